@@ -3,11 +3,16 @@ Creates the Flask app and ties the views to the routes of the application.
 """
 import logging
 from bson import ObjectId
-from flask import Flask, g
+from flask import Flask
 from flask_login import LoginManager
+from app.certificate_builder import FontRegistry
+from app.commands import db_indexes_command, render_certificates_command
+from app.instrumentation import Instrumentation
+from app.query_monitor import QueryMonitor
 from app.views.certificate import certificate_blueprint
 from app.views.account import account_blueprint
 from app.models.user import User
+from app.pdf_cache import PdfCache
 
 
 def create_app() -> Flask:
@@ -22,11 +27,24 @@ def create_app() -> Flask:
     app.config.from_object("config")
     app.register_blueprint(certificate_blueprint)
     app.register_blueprint(account_blueprint)
+    app.cli.add_command(render_certificates_command)
+    app.cli.add_command(db_indexes_command)
+
+    # Parse certificate fonts once, before any certificate is built, and set up PDF caching
+    FontRegistry.register_all()
+    PdfCache.configure(app)
+
+    # Time hot paths and report them per request and at /metrics, if enabled
+    Instrumentation.init_app(app)
+
+    # Count, time and check the queries sent to MongoDB by each request
+    QueryMonitor.init_app(app)
 
     @app.teardown_request
     def clean(error: Exception | None) -> None:
         """
-        Performs cleaning, such as closing database connections. Called after each request.
+        Performs cleaning, such as logging errors. Called after each request. Database
+        connections are not closed here, since they are pooled and reused by later requests.
 
         Args:
             error: An error that was found during the execution, if any.
@@ -34,10 +52,6 @@ def create_app() -> Flask:
         # Prints error if any was found
         if error:
             logging.error(error)
-        # Close database connection if it exists
-        client = getattr(g, "db_client", None)
-        if client:
-            client.close()
 
     # Creates login manager and configure it.
     login_manager = LoginManager()
@@ -47,11 +61,11 @@ def create_app() -> Flask:
     @login_manager.user_loader
     def load_user(user_id: str):
         """
-        Returns a user from its id.
+        Returns a user from its id, avoiding the database if it was recently retrieved.
 
         Args:
             user_id: The user's id to retrieve.
         """
-        return User.get_by_id(user_id)
+        return User.get_cached(user_id)
 
     return app
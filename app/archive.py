@@ -0,0 +1,66 @@
+"""
+Provides functionality for streaming ZIP archives, writing each file as soon as it is available
+instead of building the whole archive in memory.
+"""
+from __future__ import annotations
+from collections.abc import Iterable, Iterator
+from zipfile import ZIP_STORED, ZipFile
+
+
+class ChunkBuffer:
+    """
+    Write-only, non-seekable file-like object that keeps written bytes until they are taken. Used
+    as the output file of a `ZipFile`, which then writes its entries sequentially.
+    """
+
+    def __init__(self: ChunkBuffer) -> None:
+        """
+        Creates a new empty `ChunkBuffer`.
+        """
+        self.chunks = []
+
+    def write(self: ChunkBuffer, data: bytes) -> int:
+        """
+        Keeps `data` until the next call to `take`.
+
+        Args:
+            data: The bytes to write.
+        Returns:
+            The number of bytes written.
+        """
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self: ChunkBuffer) -> None:
+        """
+        Does nothing. Required by `ZipFile`.
+        """
+
+    def take(self: ChunkBuffer) -> bytes:
+        """
+        Returns every byte written since the last call and empties the buffer.
+
+        Returns:
+            The written bytes.
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files: Iterable[tuple[str, bytes]]) -> Iterator[bytes]:
+    """
+    Builds a ZIP archive from `files`, yielding its bytes as each file is added. Files are stored
+    without compression, since they are expected to already be compressed (e.g. PDFs).
+
+    Args:
+        files: Pairs of file names and file contents, consumed lazily.
+    Returns:
+        An iterator over the bytes of the ZIP archive.
+    """
+    buffer = ChunkBuffer()
+    with ZipFile(buffer, "w", ZIP_STORED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+            yield buffer.take()
+    yield buffer.take()
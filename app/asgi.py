@@ -0,0 +1,480 @@
+"""
+Serves the application under an ASGI server. The I/O-bound endpoints (viewing a certificate and
+starting a website verification) are handled by coroutines using Motor and httpx, so slow database
+queries and websites do not hold a thread each. Every other request is passed to the Flask
+application through `PooledWsgiToAsgi`, which runs it in a pool of threads as a threaded WSGI
+server would.
+
+Run it with an ASGI server such as uvicorn:
+
+    uvicorn --factory app.asgi:create_asgi_app
+"""
+from __future__ import annotations
+from asyncio import Semaphore, Task, TimeoutError as AsyncTimeoutError
+from asyncio import create_task, gather, to_thread, wait_for
+from collections.abc import Awaitable, Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context
+from io import BytesIO
+from sys import stderr
+from urllib.parse import urlparse
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from dotenv import load_dotenv
+from flask import Flask, Response, render_template, request
+from flask.typing import ResponseReturnValue
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from app import create_app
+from app.async_clients import AsyncDatabase, AsyncHttpClient, AsyncModels
+from app.models.user import User
+from app.views.account import verification_started_response
+from app.views.certificate import view_response
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """
+    Builds the WSGI environment of an ASGI HTTP request, so that it can be handled in a Flask
+    request context.
+
+    Args:
+        scope: The ASGI scope of the request.
+        body: The body of the request.
+    Returns:
+        The WSGI environment of the request.
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def read_body(
+    receive: Callable[[], Awaitable[dict]],
+    content_length: str | None,
+    max_bytes: int | None,
+) -> bytes:
+    """
+    Reads the whole body of an ASGI HTTP request, refusing bodies longer than `max_bytes` before
+    buffering them.
+
+    Args:
+        receive: The ASGI `receive` callable of the request.
+        content_length: The `Content-Length` header of the request, if it has one.
+        max_bytes: The maximum length of the body, or None to accept bodies of any length.
+    Returns:
+        The body of the request.
+    Raises:
+        RequestEntityTooLarge: If the body is longer than `max_bytes`.
+    """
+    if (
+        max_bytes is not None
+        and content_length is not None
+        and content_length.isdigit()
+        and int(content_length) > max_bytes
+    ):
+        raise RequestEntityTooLarge()
+    chunks = []
+    length = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        length += len(chunk)
+        if max_bytes is not None and length > max_bytes:
+            raise RequestEntityTooLarge()
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def send_response(
+    send: Callable[[dict], Awaitable[None]], response: Response
+) -> None:
+    """
+    Sends a Flask response through ASGI.
+
+    Args:
+        send: The ASGI `send` callable of the request.
+        response: The response to send.
+    """
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [
+                (name.lower().encode("latin1"), value.encode("latin1"))
+                for name, value in response.headers.items()
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    Variant of `asgiref`'s `WsgiToAsgi` that runs each WSGI request in a pool of `workers` threads.
+    `WsgiToAsgi` runs every request in the single thread shared by thread-sensitive calls, so
+    requests would otherwise be handled one at a time.
+    """
+
+    def __init__(self: PooledWsgiToAsgi, wsgi_application: Callable, workers: int) -> None:
+        """
+        Creates a new `PooledWsgiToAsgi` wrapping a WSGI application.
+
+        Args:
+            wsgi_application: The WSGI application.
+            workers: The number of threads running WSGI requests.
+        """
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi")
+
+    async def __call__(
+        self: PooledWsgiToAsgi,
+        scope: dict,
+        receive: Callable[[], Awaitable[dict]],
+        send: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        """
+        Handles an ASGI HTTP request with the WSGI application, in a thread of the pool.
+
+        Args:
+            scope: The ASGI scope of the request.
+            receive: The ASGI `receive` callable of the request.
+            send: The ASGI `send` callable of the request.
+        """
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.executor)(
+            scope, receive, send
+        )
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """
+    Variant of `asgiref`'s `WsgiToAsgiInstance` that runs the WSGI application in a thread of a
+    given pool.
+    """
+
+    def __init__(
+        self: PooledWsgiToAsgiInstance, wsgi_application: Callable, executor: ThreadPoolExecutor
+    ) -> None:
+        """
+        Creates a new `PooledWsgiToAsgiInstance` for a single request.
+
+        Args:
+            wsgi_application: The WSGI application.
+            executor: The pool of threads running WSGI requests.
+        """
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self: PooledWsgiToAsgiInstance, body: object) -> None:
+        """
+        Runs the WSGI application in a thread of the pool, sending its response.
+
+        Args:
+            body: The file with the body of the request.
+        """
+        # The method of `WsgiToAsgiInstance` wraps the function running the application with a
+        # thread-sensitive `sync_to_async`
+        run_wsgi_app = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+        await sync_to_async(run_wsgi_app, thread_sensitive=False, executor=self.executor)(
+            self, body
+        )
+
+
+class AsgiApplication:
+    """
+    ASGI application that handles the I/O-bound endpoints with coroutines and every other request
+    with the Flask application.
+    """
+
+    def __init__(self: AsgiApplication, flask_app: Flask) -> None:
+        """
+        Creates a new `AsgiApplication` wrapping a Flask application.
+
+        Args:
+            flask_app: The Flask application created by `create_app`.
+        """
+        self.flask_app = flask_app
+        self.wsgi_app = PooledWsgiToAsgi(flask_app, flask_app.config["ASGI_WSGI_WORKERS"])
+        # Asynchronous variants of Flask endpoints, by endpoint and method
+        self.async_views = {
+            ("certificate.view", "GET"): self.view_certificate,
+            ("account.verify", "POST"): self.verify,
+        }
+        # Limits the verifications fetching websites to `VERIFICATION_WORKERS` (or one, if it is 0)
+        self._verification_slots = Semaphore(flask_app.config["VERIFICATION_WORKERS"] or 1)
+        # Semaphore of each host being verified and number of verifications using it, removed once
+        # no verification uses it
+        self._host_slots = {}
+        self._tasks = set()
+
+    async def __call__(
+        self: AsgiApplication,
+        scope: dict,
+        receive: Callable[[], Awaitable[dict]],
+        send: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        """
+        Handles an ASGI connection.
+
+        Args:
+            scope: The ASGI scope of the connection.
+            receive: The ASGI `receive` callable of the connection.
+            send: The ASGI `send` callable of the connection.
+        """
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        # Find whether the request has an asynchronous view, using the routes of the Flask app
+        if scope["type"] == "http":
+            environ = build_environ(scope, b"")
+            try:
+                endpoint, view_args = self.flask_app.url_map.bind_to_environ(
+                    environ, server_name=self.flask_app.config.get("SERVER_NAME")
+                ).match()
+            except HTTPException:
+                endpoint, view_args = None, {}
+            async_view = self.async_views.get((endpoint, scope["method"]))
+            if async_view is not None:
+                try:
+                    body = await read_body(
+                        receive,
+                        environ.get("CONTENT_LENGTH"),
+                        self.flask_app.config["MAX_CONTENT_LENGTH"],
+                    )
+                except RequestEntityTooLarge as error:
+                    await send_response(send, self.error_response(environ, error))
+                    return
+                environ["wsgi.input"] = BytesIO(body)
+                await send_response(send, await self.dispatch(environ, async_view, view_args))
+                return
+
+        await self.wsgi_app(scope, receive, send)
+
+    async def dispatch(
+        self: AsgiApplication,
+        environ: dict,
+        async_view: Callable[..., Coroutine],
+        view_args: dict,
+    ) -> Response:
+        """
+        Runs an asynchronous view in a Flask request context, with the same request hooks and error
+        handling as `Flask.wsgi_app`.
+
+        Args:
+            environ: The WSGI environment of the request.
+            async_view: The asynchronous view.
+            view_args: The arguments of the view, parsed from the URL.
+        Returns:
+            The response of the view.
+        """
+        flask_app = self.flask_app
+        with flask_app.request_context(environ):
+            try:
+                try:
+                    response = flask_app.preprocess_request()
+                    if response is None:
+                        response = await async_view(**view_args)
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    response = flask_app.handle_user_exception(error)
+                return flask_app.finalize_request(response)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                return flask_app.handle_exception(error)
+
+    def error_response(self: AsgiApplication, environ: dict, error: HTTPException) -> Response:
+        """
+        Builds the response to a request rejected before its view runs, with the error handlers
+        and request hooks of the Flask application.
+
+        Args:
+            environ: The WSGI environment of the request.
+            error: The error rejecting the request.
+        Returns:
+            The response to the error.
+        """
+        flask_app = self.flask_app
+        with flask_app.request_context(environ):
+            return flask_app.finalize_request(flask_app.handle_http_exception(error))
+
+    async def view_certificate(
+        self: AsgiApplication, certificate_id: str
+    ) -> ResponseReturnValue:
+        """
+        Asynchronous variant of `certificate.view`.
+
+        Args:
+            certificate_id: The id of the certificate to display.
+        Returns:
+            A page displaying the information about the certificate.
+        """
+        certificate, certifier = await AsyncModels.get_certificate_with_certifier(
+            self.flask_app, certificate_id
+        )
+        return view_response(certificate_id, certificate, certifier)
+
+    async def verify(self: AsgiApplication) -> ResponseReturnValue:
+        """
+        Asynchronous variant of `account.verify` (POST). The verification runs as a task of the
+        event loop instead of a thread of `VerificationJobs`.
+
+        Returns:
+            A page telling that the verification started.
+        """
+        # Load the logged in user in a thread, since it may query the database
+        certifier = await to_thread(current_user._get_current_object)
+        if not certifier.is_authenticated:
+            return self.flask_app.login_manager.unauthorized()
+
+        # Retrieve and check POST input
+        url = request.form.get("url", None)
+        if not url:
+            return render_template("error.html", message="URL is missing."), 400
+
+        # Mark the verification as pending and start it in the background
+        certifier.set_verification("pending", url)
+        await AsyncModels.save_verification(self.flask_app, certifier)
+        self.run_in_background(self.verify_in_background(certifier, url))
+        return verification_started_response(url)
+
+    async def verify_in_background(self: AsgiApplication, user: User, url: str) -> None:
+        """
+        Verifies a certifier's website and records the outcome, as `VerificationJobs.run` does. At
+        most `VERIFICATION_WORKERS` verifications run at once; the others wait for their turn.
+
+        Args:
+            user: The certifier to verify.
+            url: The URL of the certifier's website.
+        """
+        config = self.flask_app.config
+
+        # Fetch the website, waiting for a free slot for its host
+        verified = False
+        async with self._verification_slots:
+            host = urlparse(url).hostname or url
+            host_slot = self._host_slot(host, config["VERIFICATION_PER_HOST"])
+            try:
+                await wait_for(host_slot.acquire(), timeout=config["VERIFICATION_QUEUE_TIMEOUT"])
+            except AsyncTimeoutError:
+                pass
+            else:
+                try:
+                    verified = await AsyncHttpClient.check_metadata(
+                        url, "ca-key", f"ca-key-{user.name}"
+                    )
+                except Exception:  # pylint: disable=broad-exception-caught
+                    verified = False
+                finally:
+                    host_slot.release()
+            finally:
+                self._leave_host(host)
+
+        # Record the outcome
+        if verified:
+            user.set_verified(url)
+        user.set_verification("verified" if verified else "failed", url)
+        await AsyncModels.save_verification(self.flask_app, user)
+
+    def run_in_background(self: AsgiApplication, coroutine: Coroutine) -> Task:
+        """
+        Runs a coroutine as a task of the event loop, keeping a reference to it until it is done.
+        The task runs in an empty context, outside of the request that started it, so that its
+        queries are counted as "background" (see `QueryMonitor`) as those of `VerificationJobs` are.
+
+        Args:
+            coroutine: The coroutine to run.
+        Returns:
+            The task running the coroutine.
+        """
+        task = Context().run(create_task, coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _host_slot(self: AsgiApplication, host: str, limit: int) -> Semaphore:
+        """
+        Returns the semaphore limiting concurrent verifications of a host, counting the caller as
+        one of its users until it calls `_leave_host`.
+
+        Args:
+            host: The host of the website being verified.
+            limit: The maximum number of concurrent verifications of the host.
+        Returns:
+            The semaphore of the host, shared by all of its verifications.
+        """
+        host_slot = self._host_slots.get(host)
+        if host_slot is None:
+            host_slot = self._host_slots[host] = [Semaphore(limit), 0]
+        host_slot[1] += 1
+        return host_slot[0]
+
+    def _leave_host(self: AsgiApplication, host: str) -> None:
+        """
+        Stops counting the caller as a user of the semaphore of a host, removing the semaphore if
+        it has no other users.
+
+        Args:
+            host: The host of the website that was verified.
+        """
+        host_slot = self._host_slots[host]
+        host_slot[1] -= 1
+        if host_slot[1] == 0:
+            del self._host_slots[host]
+
+    async def lifespan(
+        self: AsgiApplication,
+        receive: Callable[[], Awaitable[dict]],
+        send: Callable[[dict], Awaitable[None]],
+    ) -> None:
+        """
+        Handles the ASGI lifespan protocol, waiting for background verifications and closing the
+        asynchronous clients and the threads of WSGI requests when the server shuts down.
+
+        Args:
+            receive: The ASGI `receive` callable of the lifespan.
+            send: The ASGI `send` callable of the lifespan.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await gather(*self._tasks, return_exceptions=True)
+                await AsyncHttpClient.close()
+                AsyncDatabase.close()
+                self.wsgi_app.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app() -> AsgiApplication:
+    """
+    Creates the ASGI application, loading environment variables from `.env`.
+
+    Returns:
+        An ASGI application which can be served by an ASGI server such as uvicorn.
+    """
+    load_dotenv()
+    return AsgiApplication(create_app())
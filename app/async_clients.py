@@ -0,0 +1,193 @@
+"""
+Provides the asynchronous MongoDB and HTTP clients used by the ASGI serving mode (see `app.asgi`).
+They mirror `Database` and `HttpClient`, but never block the event loop while waiting for I/O.
+"""
+from __future__ import annotations
+from asyncio import to_thread
+from codecs import getincrementaldecoder
+from datetime import datetime, timezone
+from os import environ
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Flask
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from app.models.certificate import Certificate
+from app.models.user import User
+from app.query_monitor import listener
+from app.utils import MetaTagScanner
+
+
+class AsyncDatabase:
+    """
+    Namespace-like class that owns the Motor client of the event loop, configured by the same `DB_*`
+    options and environment variables as `Database`.
+    """
+
+    _client = None
+
+    @staticmethod
+    def get(app: Flask) -> AsyncIOMotorDatabase:
+        """
+        Lazily creates the Motor client and returns the default database of this application.
+
+        Args:
+            app: The Flask application whose configuration should be used.
+        Returns:
+            The default MongoDB database for this application (called `project2`).
+        """
+        if AsyncDatabase._client is None:
+            username = environ["DB_USERNAME"]
+            password = environ["DB_PASSWORD"]
+            hostname = environ["DB_HOSTNAME"]
+            config = app.config
+            AsyncDatabase._client = AsyncIOMotorClient(
+                f"mongodb+srv://{username}:{password}@{hostname}/?w=majority",
+                maxPoolSize=config.get("DB_MAX_POOL_SIZE", 100),
+                minPoolSize=config.get("DB_MIN_POOL_SIZE", 0),
+                connectTimeoutMS=config.get("DB_CONNECT_TIMEOUT_MS", 20000),
+                serverSelectionTimeoutMS=config.get("DB_SERVER_SELECTION_TIMEOUT_MS", 30000),
+                socketTimeoutMS=config.get("DB_SOCKET_TIMEOUT_MS"),
+                event_listeners=[listener],
+            )
+        return AsyncDatabase._client["project2"]
+
+    @staticmethod
+    def close() -> None:
+        """
+        Closes the Motor client, if it exists. Called when the ASGI server shuts down.
+        """
+        if AsyncDatabase._client is not None:
+            AsyncDatabase._client.close()
+        AsyncDatabase._client = None
+
+
+class AsyncModels:
+    """
+    Namespace-like class with asynchronous variants of the model methods used by the asynchronous
+    views. Documents are read and written exactly as the synchronous models do.
+    """
+
+    @staticmethod
+    async def get_certificate_with_certifier(
+        app: Flask, id_: str
+    ) -> tuple[Certificate | None, User | None]:
+        """
+        Asynchronous variant of `Certificate.get_with_certifier`.
+
+        Args:
+            app: The Flask application whose configuration should be used.
+            id_: The id of the certificate to search.
+        Returns:
+            The certificate with the given id and its certifier, as
+            `Certificate.get_with_certifier`.
+        """
+        try:
+            object_id = ObjectId(id_)
+        except InvalidId:
+            return None, None
+        db = AsyncDatabase.get(app)
+        results = db["certificate-list"].aggregate(
+            Certificate.with_certifier_pipeline(object_id)
+        )
+        documents = await results.to_list(length=1)
+        return Certificate.from_joined_document(documents[0] if documents else None)
+
+    @staticmethod
+    async def save_verification(app: Flask, user: User) -> None:
+        """
+        Asynchronous variant of `User.save_verification`. Data cached with the old version of the
+        certifier is discarded once the update is written, in a thread since PDFs cached on disk
+        may have to be removed.
+
+        Args:
+            app: The Flask application whose configuration should be used.
+            user: The certifier whose verification changed.
+        """
+        user.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        await AsyncDatabase.get(app)["certifiers"].update_one(
+            {"_id": ObjectId(user.id_)},
+            {
+                "$set": {
+                    "url": user.url,
+                    "verification": user.verification,
+                    "updated_at": user.updated_at,
+                }
+            },
+        )
+        await to_thread(User.discard_cached, user.id_)
+
+
+class AsyncHttpClient:
+    """
+    Namespace-like class that owns the `httpx.AsyncClient` of the event loop. Like `HttpClient`, it
+    keeps connections alive, limits how many are open and retries failed connections.
+    """
+
+    max_connections = 100
+    max_keepalive_connections = 20
+    retries = 2
+
+    _client = None
+
+    @staticmethod
+    def get() -> httpx.AsyncClient:
+        """
+        Lazily creates the client and returns it.
+
+        Returns:
+            The shared `httpx.AsyncClient`.
+        """
+        if AsyncHttpClient._client is None:
+            AsyncHttpClient._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=AsyncHttpClient.max_connections,
+                    max_keepalive_connections=AsyncHttpClient.max_keepalive_connections,
+                ),
+                transport=httpx.AsyncHTTPTransport(retries=AsyncHttpClient.retries),
+                follow_redirects=True,
+                timeout=3,
+            )
+        return AsyncHttpClient._client
+
+    @staticmethod
+    async def close() -> None:
+        """
+        Closes the client, if it exists. Called when the ASGI server shuts down.
+        """
+        if AsyncHttpClient._client is not None:
+            await AsyncHttpClient._client.aclose()
+        AsyncHttpClient._client = None
+
+    @staticmethod
+    async def check_metadata(
+        url: str, name: str, content: str, max_bytes: int = 65536
+    ) -> bool:
+        """
+        Asynchronous variant of `Utils.check_metadata`.
+
+        Args:
+            url: Website's url.
+            name: Name of the `meta` tag to search.
+            content: Expected value of the `meta` tag
+            max_bytes: Maximum number of bytes of the website to read.
+        Returns:
+            True if the head of the website at `url` has a `meta` tag with `name="{name}"` and
+            `content="{content}"`. False otherwise.
+        """
+        async with AsyncHttpClient.get().stream("GET", url) as response:
+            try:
+                decoder = getincrementaldecoder(response.encoding or "utf-8")("replace")
+            except LookupError:
+                decoder = getincrementaldecoder("utf-8")("replace")
+            scanner = MetaTagScanner(name, content)
+
+            # Scan chunks until the tag is found, the head is over or the byte budget is spent
+            bytes_read = 0
+            async for chunk in response.aiter_bytes(chunk_size=4096):
+                chunk = chunk[: max_bytes - bytes_read]
+                bytes_read += len(chunk)
+                scanner.feed(decoder.decode(chunk))
+                if scanner.done or bytes_read >= max_bytes:
+                    break
+            return scanner.found
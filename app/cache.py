@@ -0,0 +1,121 @@
+"""
+Provides a small, thread-safe, in-memory LRU cache used to keep expensive objects (such as decoded
+certificate templates) around between requests.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from collections.abc import Callable
+from threading import Lock
+from time import monotonic
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts its least recently used entry when full, and optionally expires
+    entries after a fixed time. All operations are protected by a lock, so an instance can be safely
+    shared between the threads of a server.
+    """
+
+    def __init__(
+        self: LRUCache,
+        max_size: int,
+        ttl: float | None = None,
+        on_evict: Callable[[object, object], None] | None = None,
+    ) -> None:
+        """
+        Creates a new empty `LRUCache`.
+
+        Args:
+            max_size: The maximum number of entries kept before the least recently used one is
+            evicted.
+            ttl: The number of seconds after which an entry expires. None if entries never expire.
+            on_evict: A function called with the key and value of each entry evicted or expired
+            (but not of entries removed with `pop` or `clear`). None to not be notified.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self: LRUCache, key: object, default: object = None) -> object:
+        """
+        Retrieves the value stored under `key` and marks it as the most recently used entry.
+
+        Args:
+            key: The key to search.
+            default: The value to return if `key` is not in the cache.
+        Returns:
+            The cached value if one was found. `default` otherwise.
+        """
+        with self._lock:
+            expires_at, value = self._entries.get(key, (None, default))
+            if key in self._entries and (
+                expires_at is None or expires_at > monotonic()
+            ):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            expired = self._entries.pop(key, None) is not None
+            self.misses += 1
+        if expired and self.on_evict is not None:
+            self.on_evict(key, value)
+        return default
+
+    def put(self: LRUCache, key: object, value: object) -> None:
+        """
+        Stores `value` under `key`, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: The key to store the value under.
+            value: The value to store.
+        """
+        expires_at = monotonic() + self.ttl if self.ttl is not None else None
+        evicted = []
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted_key, (_, evicted_value) = self._entries.popitem(last=False)
+                evicted.append((evicted_key, evicted_value))
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def pop(self: LRUCache, key: object) -> object:
+        """
+        Removes the entry stored under `key`, if any.
+
+        Args:
+            key: The key to remove.
+        Returns:
+            The removed value, or None if `key` was not in the cache.
+        """
+        with self._lock:
+            return self._entries.pop(key, (None, None))[1]
+
+    def clear(self: LRUCache) -> None:
+        """
+        Removes every entry from the cache and resets its counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self: LRUCache) -> dict:
+        """
+        Returns usage counters for this cache.
+
+        Returns:
+            A dictionary with the number of hits, misses, stored entries and the maximum size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
@@ -1,17 +1,288 @@
 """
-Builds PDF certificates from JSON options and provided data.
+Builds PDF certificates from compiled layouts and provided data.
 """
 from __future__ import annotations
+from copy import copy
+from datetime import datetime, timezone
 from io import BytesIO
+from os import path, stat
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 from PIL import Image
 from qrcode import QRCode
 from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.utils import ImageReader, _digester
 from reportlab.lib.pagesizes import A4, landscape
-import requests
-from app.utils import Utils
+from werkzeug.http import parse_date
+from app.cache import LRUCache
+from app.http_client import HttpClient
+from app.instrumentation import instrumented
+
+if TYPE_CHECKING:
+    from app.layout import Layout
+
+
+class TemplateCache:
+    """
+    Namespace-like class that keeps a process-wide cache of certificate templates, already decoded,
+    downscaled to `max_dpi` and compressed into PDF image streams that can be embedded as they are.
+    Local templates are keyed by their path and modification time, and remote templates by their URL
+    and `ETag`, so a changed template is never served stale.
+    """
+
+    cache = LRUCache(8)
+    # Resolution above which templates are downscaled, in pixels per inch of the printed page
+    max_dpi = 300
+    remote_revalidate_seconds = 60
+    remote_max_bytes = 10 * 1024 * 1024
+    static_folder = "./app/static"
+    local_hosts = ("127.0.0.1", "localhost")
+    _remote_versions = {}
+    _remote_lock = Lock()
+
+    @staticmethod
+    @instrumented("pdf.template")
+    def get(template: str) -> PDFImageXObject:
+        """
+        Returns the encoded template at `template`, loading, downscaling and compressing it only if
+        it is not already cached.
+
+        Args:
+            template: A local path or an http(s) URL pointing to the template image.
+        Returns:
+            A `PDFImageXObject` with the template, at most `max_dpi` on the certificate page.
+        """
+        if template.startswith("http"):
+            local_template = TemplateCache._local_path(template)
+            if local_template is None:
+                return TemplateCache._get_remote(template)
+            template = local_template
+        modified_at = stat(template).st_mtime_ns
+        key = (template, modified_at)
+        image = TemplateCache.cache.get(key)
+        if image is None:
+            image = TemplateCache._decode(
+                Image.open(template, "r"),
+                datetime.fromtimestamp(modified_at / 1e9, timezone.utc),
+            )
+            TemplateCache.cache.put(key, image)
+        return image
+
+    @staticmethod
+    def _get_remote(url: str) -> PDFImageXObject:
+        """
+        Returns the encoded template at `url`. Cached templates are reused without any request for
+        `remote_revalidate_seconds`, and then revalidated with a conditional request.
+
+        Args:
+            url: The http(s) URL pointing to the template image.
+        Returns:
+            A `PDFImageXObject` with the template, at most `max_dpi` on the certificate page.
+        """
+        with TemplateCache._remote_lock:
+            etag, checked_at = TemplateCache._remote_versions.get(url, (None, None))
+        image = TemplateCache.cache.get((url, etag)) if etag is not None else None
+        if image is not None:
+            if monotonic() - checked_at < TemplateCache.remote_revalidate_seconds:
+                return image
+            response = HttpClient.get(
+                url, headers={"If-None-Match": etag}, stream=True
+            )
+        else:
+            response = HttpClient.get(url, stream=True)
+
+        # Close the response on every path, so that its connection always goes back to the pool
+        content = None
+        with response:
+            if response.status_code != 304:
+                response.raise_for_status()
+                etag = response.headers.get("ETag", "")
+                modified_at = parse_date(
+                    response.headers.get("Last-Modified")
+                ) or datetime.now(timezone.utc)
+                content = HttpClient.read(response, TemplateCache.remote_max_bytes)
+        if content is not None:
+            image = TemplateCache._decode(Image.open(BytesIO(content)), modified_at)
+            TemplateCache.cache.put((url, etag), image)
+        with TemplateCache._remote_lock:
+            TemplateCache._remote_versions[url] = (etag, monotonic())
+        return image
+
+    @staticmethod
+    def _local_path(url: str) -> str | None:
+        """
+        Maps a URL of this application's static files to the file itself, so templates served by
+        this application are not fetched over HTTP.
+
+        Args:
+            url: The http(s) URL of a template.
+        Returns:
+            The path of the static file if `url` points to one in a local host. None otherwise.
+        """
+        parsed_url = urlparse(url)
+        if parsed_url.hostname not in TemplateCache.local_hosts:
+            return None
+        if not parsed_url.path.startswith("/static/"):
+            return None
+        static_folder = path.abspath(TemplateCache.static_folder)
+        local_path = path.abspath(
+            path.join(static_folder, parsed_url.path[len("/static/") :])
+        )
+        if not local_path.startswith(static_folder + path.sep) or not path.isfile(
+            local_path
+        ):
+            return None
+        return local_path
+
+    @staticmethod
+    def _decode(template: Image.Image, modified_at: datetime) -> PDFImageXObject:
+        """
+        Fully decodes a template, downscales it if it has more than `max_dpi` pixels per inch of the
+        certificate page, and compresses it into a PDF image stream. Templates are never upscaled,
+        since the PDF scales them to the page anyway. The returned object is never modified
+        afterwards, so it can be shared by every PDF document built in this process (see
+        `CertificateBuilder.draw_template`).
+
+        Args:
+            template: The lazily loaded template image.
+            modified_at: The last time the template was modified.
+        Returns:
+            A `PDFImageXObject` named after the digest of its pixel data, with the time the
+            template was modified as its `modified_at` attribute.
+        """
+        page_dimensions = landscape(A4)
+        scale = min(
+            1,
+            page_dimensions[0] / 72 * TemplateCache.max_dpi / template.width,
+            page_dimensions[1] / 72 * TemplateCache.max_dpi / template.height,
+        )
+        if scale < 1:
+            template = template.resize(
+                (round(template.width * scale), round(template.height * scale)),
+                Image.LANCZOS,
+            )
+        image = ImageReader(template)
+        name = _digester(image.getRGBData() + b"None")
+        encoded_image = PDFImageXObject(name, image)
+        encoded_image.name = name
+        encoded_image.modified_at = modified_at
+        return encoded_image
+
+
+class FontRegistry:
+    """
+    Namespace-like class that registers the fonts available for certificates with reportlab. Each
+    font file is parsed at most once per process, and fonts are then referenced only by name.
+    """
+
+    available_fonts = {"Poppins Bold": "./app/static/Poppins-Bold.ttf"}
+    default_font = "Poppins Bold"
+    _registered = set()
+    _lock = Lock()
+
+    @staticmethod
+    def register_all() -> None:
+        """
+        Registers every font in `available_fonts`. Called when the application is created so that
+        no font has to be parsed while building a certificate.
+        """
+        for font_name in FontRegistry.available_fonts:
+            FontRegistry.get(font_name)
+
+    @staticmethod
+    def get(font_name: str) -> str:
+        """
+        Returns the name under which a font is registered with reportlab, registering it first if
+        this has not been done yet. Unknown fonts fall back to `default_font`.
+
+        Args:
+            font_name: The name of the font, as found in the certificate settings.
+        Returns:
+            A font name which can be passed to `Canvas.setFont`.
+        """
+        if font_name not in FontRegistry.available_fonts:
+            font_name = FontRegistry.default_font
+        if font_name not in FontRegistry._registered:
+            FontRegistry._register(font_name)
+        return font_name
+
+    @staticmethod
+    @instrumented("pdf.font_registration")
+    def _register(font_name: str) -> None:
+        """
+        Parses a font file and registers it with reportlab, unless another thread already did.
+
+        Args:
+            font_name: The name of a font in `available_fonts`.
+        """
+        with FontRegistry._lock:
+            if font_name not in FontRegistry._registered:
+                pdfmetrics.registerFont(
+                    TTFont(font_name, FontRegistry.available_fonts[font_name])
+                )
+                FontRegistry._registered.add(font_name)
+
+    @staticmethod
+    def version(font_name: str) -> tuple[int, datetime]:
+        """
+        Returns the version of a font file, so that PDFs built with an older file can be told apart.
+
+        Args:
+            font_name: The name of the font, as found in the certificate settings.
+        Returns:
+            The modification time of the font file in nanoseconds, and as a `datetime`.
+        """
+        if font_name not in FontRegistry.available_fonts:
+            font_name = FontRegistry.default_font
+        modified_at = stat(FontRegistry.available_fonts[font_name]).st_mtime_ns
+        return modified_at, datetime.fromtimestamp(modified_at / 1e9, timezone.utc)
+
+
+class QRCodeCache:
+    """
+    Namespace-like class that keeps a process-wide cache of QR codes. Each QR code is stored as the
+    runs of dark modules of each row, so it can be drawn as a few vector rectangles.
+    """
+
+    cache = LRUCache(1024)
+
+    @staticmethod
+    def get(url: str) -> tuple[int, tuple[tuple[int, int, int], ...]]:
+        """
+        Returns the QR code encoding `url`, computing it only if it is not already cached.
+
+        Args:
+            url: The URL to encode.
+        Returns:
+            The number of modules on each side of the QR code (including its border), and the
+            horizontal runs of dark modules as `(row, first column, length)` tuples, with row 0 at
+            the top.
+        """
+        qrcode = QRCodeCache.cache.get(url)
+        if qrcode is None:
+            qrcode_generator = QRCode(version=4, border=4)
+            qrcode_generator.add_data(url)
+            qrcode_generator.make(fit=True)
+            matrix = qrcode_generator.get_matrix()
+            runs = []
+            for row, modules in enumerate(matrix):
+                column = 0
+                while column < len(modules):
+                    if not modules[column]:
+                        column += 1
+                        continue
+                    start = column
+                    while column < len(modules) and modules[column]:
+                        column += 1
+                    runs.append((row, start, column - start))
+            qrcode = (len(matrix), tuple(runs))
+            QRCodeCache.cache.put(url, qrcode)
+        return qrcode
 
 
 class CertificateBuilder:
@@ -20,59 +291,66 @@ class CertificateBuilder:
     allow method chaining.
     """
 
-    default_settings = {
-        "template": "./app/static/template.png",
-        "font": {"name": "Poppins Bold", "size": 32},
-        "qrcode": {"left": 650, "bottom": 68, "width": 125, "height": 125},
-        "name": {"left": 420, "bottom": 320},
-        "title": {"left": 420, "bottom": 245},
-        "certifier": {"left": 420, "bottom": 100},
-    }
-
-    def __init__(self: CertificateBuilder, settings: dict) -> None:
+    @instrumented("pdf.init")
+    def __init__(self: CertificateBuilder, layout: Layout) -> None:
         """
-        Creates a new CertificateBuilder with the provided settings.
+        Creates a new CertificateBuilder with the provided layout.
 
         Args:
-            settings: Information about the layout of the generated certificate PDF.
+            layout: The compiled layout of the generated certificate PDF (see `Layout.compile`).
         Returns:
             A newly created `CertificateBuilder` instance.
         """
-        self.settings = (
-            settings
-            if Utils.same_structure(settings, CertificateBuilder.default_settings)
-            else CertificateBuilder.default_settings
-        )
+        self.layout = layout
         self.buffer = BytesIO()
         self.pdf_drawer = canvas.Canvas(self.buffer, pagesize=landscape(A4))
 
+    @staticmethod
+    def assets_version(layout: Layout) -> tuple[str, datetime]:
+        """
+        Returns the version of the files rendered with a layout (its template and font), which
+        changes whenever one of them is replaced.
+
+        Args:
+            layout: The compiled layout.
+        Returns:
+            A digest of the template's pixel data and the font file's version, and the last time
+            either file was modified.
+        """
+        template = TemplateCache.get(layout.template)
+        font_version, font_modified_at = FontRegistry.version(layout.font.name)
+        return (
+            f"{template.name}:{font_version}",
+            max(template.modified_at, font_modified_at),
+        )
+
+    @instrumented("pdf.draw_template")
     def draw_template(self: CertificateBuilder) -> CertificateBuilder:
         """
-        Adds the template to the certificate. Assumes its information was provided through the
-        settings when the object was created.
+        Adds the template of the layout to the certificate.
 
         Returns:
             Itself for method chaining.
         """
         page_dimensions = landscape(A4)
-        template_settings = self.settings["template"]
-        certificate_template = (
-            Image.open(BytesIO(requests.get(template_settings, timeout=3).content))
-            if template_settings.startswith("http")
-            else Image.open(template_settings, "r")
-        )
-        certificate_template.resize(
-            (int(page_dimensions[0]), int(page_dimensions[1])), Image.LANCZOS
-        )
-        self.pdf_drawer.drawImage(
-            ImageReader(certificate_template),
-            0,
-            0,
-            page_dimensions[0],
-            page_dimensions[1],
-        )
+        template = TemplateCache.get(self.layout.template)
+
+        # Register a shallow copy of the pre-encoded image in this document (registering tags the
+        # object with the document) and draw it over the whole page. This mirrors
+        # `Canvas.drawImage`, which would otherwise hash and compress the image again.
+        document = self.pdf_drawer._doc
+        registered_name = document.getXObjectName(template.name)
+        if registered_name not in document.idToObject:
+            document.addForm(template.name, copy(template))
+        self.pdf_drawer._currentPageHasImages = 1
+        self.pdf_drawer.saveState()
+        self.pdf_drawer.scale(page_dimensions[0], page_dimensions[1])
+        self.pdf_drawer._code.append(f"/{registered_name} Do")
+        self.pdf_drawer.restoreState()
+        self.pdf_drawer._formsinuse.append(template.name)
         return self
 
+    @instrumented("pdf.add_certificate_data")
     def add_certificate_data(
         self: CertificateBuilder, certificate_data: object, certifier_data: object
     ) -> CertificateBuilder:
@@ -85,69 +363,66 @@ class CertificateBuilder:
         Returns:
             Itself for method chaining.
         """
-        font_settings = self.settings["font"]
-        name_settings = {**self.settings["name"], "text": certificate_data.name}
-        title_settings = {**self.settings["title"], "text": certificate_data.title}
-        certifier_settings = {
-            **self.settings["certifier"],
-            "text": certifier_data.name,
-        }
-
-        # Load font
-        available_fonts = {"Poppins Bold": "./app/static/Poppins-Bold.ttf"}
-        font_path = (
-            available_fonts[font_settings["name"]]
-            if font_settings["name"] in available_fonts
-            else available_fonts["Poppins Bold"]
-        )
-        pdfmetrics.registerFont(TTFont("Certificate Font", font_path))
-        self.pdf_drawer.setFont("Certificate Font", font_settings["size"])
+        layout = self.layout
+
+        # Set font
+        self.pdf_drawer.setFont(FontRegistry.get(layout.font.name), layout.font.size)
 
         # Add text
         self.pdf_drawer.drawCentredString(
-            name_settings["left"], name_settings["bottom"], name_settings["text"]
+            layout.name.left, layout.name.bottom, certificate_data.name
         )
         self.pdf_drawer.drawCentredString(
-            title_settings["left"], title_settings["bottom"], title_settings["text"]
+            layout.title.left, layout.title.bottom, certificate_data.title
         )
         self.pdf_drawer.drawCentredString(
-            certifier_settings["left"],
-            certifier_settings["bottom"],
-            certifier_settings["text"],
+            layout.certifier.left, layout.certifier.bottom, certifier_data.name
         )
         return self
 
+    @instrumented("pdf.add_qrcode")
     def add_qrcode(self: CertificateBuilder, url: str) -> CertificateBuilder:
         """
-        Adds QR code to generate PDF.
+        Adds QR code to generate PDF. The QR code is drawn with vector rectangles, so it stays sharp
+        at any zoom level.
 
         Args:
             url: URL to create the certificate's QR.
         Returns:
             Itself for method chaining.
         """
-        qrcode_settings = self.settings["qrcode"]
+        qrcode_box = self.layout.qrcode
+        size, runs = QRCodeCache.get(url)
+        module_width = qrcode_box.width / size
+        module_height = qrcode_box.height / size
+        top = qrcode_box.bottom + qrcode_box.height
 
-        # Generate QR code and resize it
-        qrcode_generator = QRCode(version=4, border=4)
-        qrcode_generator.add_data(url)
-        qrcode_generator.make(fit=True)
-        qrcode = qrcode_generator.make_image(
-            fill_color="black",
-            back_color="white",
-        )
-        qrcode = qrcode.resize(
-            (qrcode_settings["width"], qrcode_settings["height"]), Image.LANCZOS
-        )
-        self.pdf_drawer.drawImage(
-            ImageReader(qrcode),
-            qrcode_settings["left"],
-            qrcode_settings["bottom"],
-            qrcode_settings["width"],
-            qrcode_settings["height"],
+        # Draw a white background (which includes the border of the QR code) and then each run of
+        # dark modules as a single rectangle
+        self.pdf_drawer.saveState()
+        self.pdf_drawer.setFillColorRGB(1, 1, 1)
+        self.pdf_drawer.rect(
+            qrcode_box.left,
+            qrcode_box.bottom,
+            qrcode_box.width,
+            qrcode_box.height,
+            stroke=0,
+            fill=1,
         )
+        modules = self.pdf_drawer.beginPath()
+        for row, column, length in runs:
+            modules.rect(
+                qrcode_box.left + column * module_width,
+                top - (row + 1) * module_height,
+                length * module_width,
+                module_height,
+            )
+        self.pdf_drawer.setFillColorRGB(0, 0, 0)
+        self.pdf_drawer.drawPath(modules, stroke=0, fill=1)
+        self.pdf_drawer.restoreState()
         return self
 
+    @instrumented("pdf.save")
     def save(self: CertificateBuilder) -> BytesIO:
         """
         Saves a PDF certificate with the object's information.
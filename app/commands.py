@@ -0,0 +1,66 @@
+"""
+Declares the command line commands of the application. They are run through the `flask` command,
+e.g. `flask --app run render-certificates`.
+"""
+import click
+from flask import url_for
+from flask.cli import with_appcontext
+from app.archive import stream_zip
+from app.layout import Layout, LayoutError
+from app.models.certificate import Certificate
+from app.models.database import Database
+from app.models.user import User
+from app.render_service import RenderJob, RenderService
+
+
+@click.command("render-certificates")
+@click.argument("certifier_id")
+@click.argument("output", type=click.File("wb"))
+@with_appcontext
+def render_certificates_command(certifier_id: str, output: click.File) -> None:
+    """
+    Renders every certificate issued by CERTIFIER_ID into the ZIP archive OUTPUT, using the render
+    worker pool.
+    """
+    # Check that certifier exists and retrieve its information
+    certifier = User.get_by_id(certifier_id)
+    if certifier is None:
+        raise click.ClickException(f"No certifier with the id {certifier_id} was found.")
+    try:
+        Layout.of(certifier)
+    except LayoutError as error:
+        raise click.ClickException(str(error)) from error
+
+    # Render certificates and write them to the archive as they are ready
+    jobs = (
+        RenderJob(
+            certificate,
+            certifier,
+            url_for("certificate.view", _external=True, certificate_id=certificate.id_),
+        )
+        for certificate in Certificate.iter_by_certifier_id(certifier.id_)
+    )
+    files = (
+        (f"Certificate-{job.certificate_id}.pdf", pdf)
+        for job, pdf in RenderService.render_many(jobs)
+    )
+    for chunk in stream_zip(files):
+        output.write(chunk)
+    click.echo(f"Certificates issued by {certifier.name} written to {output.name}.")
+
+
+@click.command("db-indexes")
+@click.option("--create", is_flag=True, help="Create missing indexes before reporting.")
+@with_appcontext
+def db_indexes_command(create: bool) -> None:
+    """
+    Reports the indexes required by the application that are missing from the database, and the
+    indexes that are unused or not required.
+    """
+    db = Database.get_client()["project2"]
+    if create:
+        Database.ensure_indexes(db)
+    for collection, report in Database.index_report(db).items():
+        click.echo(f"{collection}:")
+        click.echo(f"  missing: {', '.join(report['missing']) or 'none'}")
+        click.echo(f"  unused: {', '.join(report['unused']) or 'none'}")
@@ -0,0 +1,160 @@
+"""
+Provides the HTTP client used for every outbound request of the application, such as fetching
+certifier websites and remote certificate templates.
+"""
+from __future__ import annotations
+from os import getpid
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from urllib3.util.retry import Retry
+
+
+class ResponseTooLargeError(ValueError):
+    """
+    Raised when the body of a response is larger than allowed.
+    """
+
+
+class TimedPoolMixin:
+    """
+    Makes a `urllib3` connection pool wait at most `HttpClient.pool_timeout` seconds for a free
+    connection, instead of waiting forever, which `requests` does not allow to configure.
+    """
+
+    def urlopen(self: TimedPoolMixin, *args: object, **kwargs: object) -> object:
+        kwargs.setdefault("pool_timeout", HttpClient.pool_timeout)
+        return super().urlopen(*args, **kwargs)
+
+
+class TimedHTTPConnectionPool(TimedPoolMixin, HTTPConnectionPool):
+    """
+    HTTP connection pool that waits at most `HttpClient.pool_timeout` seconds for a connection.
+    """
+
+
+class TimedHTTPSConnectionPool(TimedPoolMixin, HTTPSConnectionPool):
+    """
+    HTTPS connection pool that waits at most `HttpClient.pool_timeout` seconds for a connection.
+    """
+
+
+class TimedPoolAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connection pools wait at most `HttpClient.pool_timeout` seconds for a
+    connection.
+    """
+
+    def init_poolmanager(self: TimedPoolAdapter, *args: object, **kwargs: object) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+class HttpClient:
+    """
+    Namespace-like class that owns a process-wide `requests.Session`. The session keeps connections
+    alive and pools them, with at most `max_connections_per_host` connections to each host, and
+    retries failed idempotent requests with exponential backoff. A request waits at most
+    `pool_timeout` seconds for a free connection to its host.
+    """
+
+    max_connections_per_host = 10
+    pool_timeout = 10
+    max_pooled_hosts = 32
+    retries = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+
+    _session = None
+    _session_pid = None
+    _lock = Lock()
+
+    @staticmethod
+    def get_session() -> requests.Session:
+        """
+        Lazily creates the session of this process and returns it. A process forked after the
+        session was created gets its own session.
+
+        Returns:
+            The shared `requests.Session`.
+        """
+        session = HttpClient._session
+        if session is not None and HttpClient._session_pid == getpid():
+            return session
+        with HttpClient._lock:
+            if HttpClient._session is None or HttpClient._session_pid != getpid():
+                adapter = TimedPoolAdapter(
+                    pool_connections=HttpClient.max_pooled_hosts,
+                    pool_maxsize=HttpClient.max_connections_per_host,
+                    pool_block=True,
+                    max_retries=HttpClient.retries,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                HttpClient._session = session
+                HttpClient._session_pid = getpid()
+            return HttpClient._session
+
+    @staticmethod
+    def get(
+        url: str, timeout: float = 3, headers: dict | None = None, stream: bool = False
+    ) -> requests.Response:
+        """
+        Sends a GET request through the shared session.
+
+        Args:
+            url: The URL to request.
+            timeout: The maximum number of seconds to wait for the server.
+            headers: Additional headers of the request.
+            stream: Whether the body should be read lazily (e.g. through `iter_content`).
+        Returns:
+            The response of the server. Streamed responses must be closed (e.g. by using them as
+            context managers) so that their connection goes back to the pool.
+        Raises:
+            requests.ConnectionError: If no connection to the host became free within
+            `pool_timeout` seconds, among other connection errors.
+        """
+        try:
+            return HttpClient.get_session().get(
+                url, timeout=timeout, headers=headers, stream=stream
+            )
+        except EmptyPoolError as error:
+            raise requests.ConnectionError(
+                f"No connection to {url} became free within {HttpClient.pool_timeout} seconds"
+            ) from error
+
+    @staticmethod
+    def read(response: requests.Response, max_bytes: int) -> bytes:
+        """
+        Reads the body of a streamed response, refusing bodies larger than `max_bytes`.
+
+        Args:
+            response: A response obtained with `stream=True`.
+            max_bytes: The maximum size of the body.
+        Returns:
+            The body of the response.
+        Raises:
+            ResponseTooLargeError: If the body is larger than `max_bytes`.
+        """
+        with response:
+            if int(response.headers.get("Content-Length", 0)) > max_bytes:
+                raise ResponseTooLargeError(f"{response.url} is larger than {max_bytes} bytes")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=65536):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ResponseTooLargeError(
+                        f"{response.url} is larger than {max_bytes} bytes"
+                    )
+                chunks.append(chunk)
+            return b"".join(chunks)
@@ -0,0 +1,226 @@
+"""
+Provides lightweight timing instrumentation of the hot paths of the application. Instrumented
+functions record their duration as spans, which are aggregated in process-wide histograms (exposed
+at `/metrics`) and, during requests, reported in a `Server-Timing` header and a structured log line.
+When instrumentation is disabled, instrumented functions only pay for a single attribute check.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from collections.abc import Callable
+from functools import wraps
+from json import dumps
+from threading import Lock
+from time import perf_counter
+import logging
+from flask import Flask, Response, abort, g, has_request_context, request
+from flask.typing import ResponseReturnValue
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """
+    Thread-safe histogram of durations, with fixed buckets in milliseconds.
+    """
+
+    buckets = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self: Histogram) -> None:
+        """
+        Creates a new empty `Histogram`.
+        """
+        self.counts = [0] * (len(Histogram.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self: Histogram, duration: float) -> None:
+        """
+        Adds a duration to the histogram.
+
+        Args:
+            duration: The duration in milliseconds.
+        """
+        index = bisect_left(Histogram.buckets, duration)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += duration
+
+    def snapshot(self: Histogram) -> tuple[list[int], int, float]:
+        """
+        Returns a consistent copy of the histogram.
+
+        Returns:
+            The cumulative count of each bucket (the last one being `+Inf`), the total count and the
+            sum of all durations.
+        """
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, count, total
+
+
+class Instrumentation:
+    """
+    Namespace-like class that records spans of instrumented functions. It is enabled by the
+    `INSTRUMENTATION_ENABLED` option of the application.
+    """
+
+    enabled = False
+    histograms = {}
+    # Functions returning additional lines for `/metrics`, such as the counters of `QueryMonitor`
+    collectors = []
+    _lock = Lock()
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Configures instrumentation from the application configuration, and registers the request
+        hooks and the `/metrics` endpoint. Hooks do nothing while instrumentation is disabled.
+
+        Args:
+            app: The Flask application to instrument.
+        """
+        Instrumentation.enabled = app.config.get("INSTRUMENTATION_ENABLED", False)
+        app.before_request(Instrumentation.start_request)
+        app.after_request(Instrumentation.finish_request)
+        app.add_url_rule("/metrics", "metrics", Instrumentation.metrics)
+
+    @staticmethod
+    def record(name: str, start: float, end: float) -> None:
+        """
+        Records a span in its histogram and, during requests, in the spans of the current request.
+
+        Args:
+            name: The name of the span.
+            start: The `perf_counter` value when the span started.
+            end: The `perf_counter` value when the span ended.
+        """
+        duration = (end - start) * 1000
+        histogram = Instrumentation.histograms.get(name)
+        if histogram is None:
+            with Instrumentation._lock:
+                histogram = Instrumentation.histograms.setdefault(name, Histogram())
+        histogram.observe(duration)
+        if has_request_context() and "spans" in g:
+            g.spans.append(
+                {
+                    "name": name,
+                    "start_ms": round((start - g.request_started) * 1000, 3),
+                    "duration_ms": round(duration, 3),
+                }
+            )
+
+    @staticmethod
+    def start_request() -> None:
+        """
+        Starts collecting the spans of the current request. Called before each request.
+        """
+        if not Instrumentation.enabled:
+            return
+        g.request_started = perf_counter()
+        g.spans = []
+
+    @staticmethod
+    def finish_request(response: Response) -> Response:
+        """
+        Records the duration of the current request, adds its spans to the `Server-Timing` header of
+        the response and logs them. Called after each request.
+
+        Args:
+            response: The response to the current request.
+        Returns:
+            The same response.
+        """
+        if not Instrumentation.enabled or "spans" not in g:
+            return response
+        end = perf_counter()
+        Instrumentation.record(f"request.{request.endpoint}", g.request_started, end)
+        spans = g.pop("spans")
+
+        # Sum the spans of each name, as they may be repeated (e.g. several queries)
+        totals = {}
+        for span in spans:
+            totals[span["name"]] = totals.get(span["name"], 0) + span["duration_ms"]
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={duration:.3f}" for name, duration in totals.items()
+        )
+        logger.info(
+            dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "endpoint": request.endpoint,
+                    "status": response.status_code,
+                    "duration_ms": round((end - g.request_started) * 1000, 3),
+                    "spans": spans,
+                }
+            )
+        )
+        return response
+
+    @staticmethod
+    def metrics() -> ResponseReturnValue:
+        """
+        Returns the histograms of every span in the Prometheus text format. Not found while
+        instrumentation is disabled.
+        """
+        if not Instrumentation.enabled:
+            abort(404)
+        lines = [
+            "# HELP autocertify_span_duration_ms Duration of instrumented operations.",
+            "# TYPE autocertify_span_duration_ms histogram",
+        ]
+        for name, histogram in sorted(Instrumentation.histograms.items()):
+            counts, count, total = histogram.snapshot()
+            bounds = [str(bucket) for bucket in Histogram.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts):
+                lines.append(
+                    f'autocertify_span_duration_ms_bucket{{span="{name}",le="{bound}"}} '
+                    f"{bucket_count}"
+                )
+            lines.append(f'autocertify_span_duration_ms_sum{{span="{name}"}} {total:.3f}')
+            lines.append(f'autocertify_span_duration_ms_count{{span="{name}"}} {count}')
+        for collector in Instrumentation.collectors:
+            lines += collector()
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+    @staticmethod
+    def reset() -> None:
+        """
+        Removes every recorded histogram.
+        """
+        with Instrumentation._lock:
+            Instrumentation.histograms = {}
+
+
+def instrumented(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator that records each call of a function as a span named `name`, if instrumentation is
+    enabled.
+
+    Args:
+        name: The name of the span, such as `db.user.get_by_id`.
+    Returns:
+        A decorator for the function to instrument.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args: object, **kwargs: object) -> object:
+            if not Instrumentation.enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                Instrumentation.record(name, start, perf_counter())
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,304 @@
+"""
+Compiles certificate layout settings into immutable objects that `CertificateBuilder` can use
+directly. Settings are validated once, when they are compiled, and compiled layouts are cached, so
+building a certificate never has to inspect the settings again.
+"""
+from __future__ import annotations
+from json import load
+from math import isfinite
+from os.path import commonpath, isfile, realpath, splitext
+from app.cache import LRUCache
+from app.certificate_builder import FontRegistry, TemplateCache
+from app.utils import Utils
+
+
+class LayoutError(ValueError):
+    """
+    Raised when layout settings are invalid. The message names the offending field.
+    """
+
+
+class FrozenSlots:
+    """
+    Base class of the compiled layout objects. Fields are stored in `__slots__` and can only be set
+    when the object is created.
+    """
+
+    __slots__ = ()
+
+    def __init__(self: FrozenSlots, *values: object) -> None:
+        """
+        Sets every field of the object, in the order of `__slots__`.
+
+        Args:
+            values: The values of the fields.
+        """
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self: FrozenSlots, name: str, value: object) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __delattr__(self: FrozenSlots, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
+
+    def __reduce__(self: FrozenSlots) -> tuple:
+        return type(self), tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self: FrozenSlots, other: object) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__
+        )
+
+    def __hash__(self: FrozenSlots) -> int:
+        return hash(tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self: FrozenSlots) -> str:
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class Position(FrozenSlots):
+    """
+    The point of the page where a text is centered, in PDF points from the bottom left corner.
+    """
+
+    __slots__ = ("left", "bottom")
+
+    def __init__(self: Position, left: float, bottom: float) -> None:
+        super().__init__(left, bottom)
+
+
+class Box(FrozenSlots):
+    """
+    A rectangle of the page, in PDF points from the bottom left corner.
+    """
+
+    __slots__ = ("left", "bottom", "width", "height")
+
+    def __init__(
+        self: Box, left: float, bottom: float, width: float, height: float
+    ) -> None:
+        super().__init__(left, bottom, width, height)
+
+
+class Font(FrozenSlots):
+    """
+    The font of the texts of a certificate.
+    """
+
+    __slots__ = ("name", "size")
+
+    def __init__(self: Font, name: str, size: float) -> None:
+        super().__init__(name, size)
+
+
+class Layout(FrozenSlots):
+    """
+    The compiled layout of a certificate. Use `Layout.compile` to create layouts from settings.
+    """
+
+    __slots__ = ("template", "font", "qrcode", "name", "title", "certifier", "digest")
+
+    # Settings of the default layout, loaded from `settings_file`
+    settings_file = "./app/static/settings.json"
+    with open(settings_file, encoding="utf-8") as settings:
+        defaults = load(settings)
+    # Directory of the images that can be used as templates, and their allowed extensions
+    template_dir = "./app/static"
+    template_extensions = (".png", ".jpg", ".jpeg")
+    cache = LRUCache(256)
+    certifier_cache = LRUCache(1024)
+
+    def __init__(
+        self: Layout,
+        template: str,
+        font: Font,
+        qrcode: Box,
+        name: Position,
+        title: Position,
+        certifier: Position,
+        digest: str,
+    ) -> None:
+        super().__init__(template, font, qrcode, name, title, certifier, digest)
+
+    @staticmethod
+    def compile(settings: dict | None) -> Layout:
+        """
+        Validates layout settings and compiles them into a `Layout`, reusing the layout compiled
+        from equal settings if there is one. Fields missing from the settings take their value from
+        `defaults`, so empty settings compile into the default layout.
+
+        Args:
+            settings: The layout settings, with the same structure as `defaults`.
+        Returns:
+            The compiled layout.
+        Raises:
+            LayoutError: If the settings have unknown fields, fields of the wrong type or a template
+            outside `template_dir`.
+        """
+        if settings is None:
+            settings = {}
+        try:
+            key = Utils.digest(settings)
+        except (TypeError, ValueError) as error:
+            raise LayoutError(f"layout is not valid JSON: {error}") from error
+        layout = Layout.cache.get(key)
+        if layout is None:
+            layout = Layout._compile(settings)
+            Layout.cache.put(key, layout)
+        return layout
+
+    @staticmethod
+    def of(certifier: object) -> Layout:
+        """
+        Returns the compiled layout of a certifier's certificates. Layouts are cached under the
+        certifier's id and layout version, so the settings of each version are only compiled once
+        per process, and changing them (see `User.save_layout`) never serves a stale layout.
+
+        Args:
+            certifier: The certifier, with its `layout` settings and `layout_version`.
+        Returns:
+            The compiled layout.
+        Raises:
+            LayoutError: If the certifier's layout settings are invalid.
+        """
+        key = (certifier.id_, certifier.layout_version)
+        layout = Layout.certifier_cache.get(key)
+        if layout is None:
+            layout = Layout.compile(certifier.layout)
+            Layout.certifier_cache.put(key, layout)
+        return layout
+
+    @staticmethod
+    def _compile(settings: dict) -> Layout:
+        """
+        Validates layout settings and compiles them into a `Layout`, without using the cache.
+
+        Args:
+            settings: The layout settings, with the same structure as `defaults`.
+        Returns:
+            The compiled layout.
+        Raises:
+            LayoutError: If the settings have unknown fields, fields of the wrong type or a template
+            outside `template_dir`.
+        """
+        fields = Layout._merge("layout", settings, Layout.defaults)
+
+        # Check the template and the font
+        template = fields["template"]
+        Layout._template(template)
+        font = fields["font"]
+        if (
+            not isinstance(font["name"], str)
+            or font["name"] not in FontRegistry.available_fonts
+        ):
+            raise LayoutError(
+                f"layout.font.name must be one of {sorted(FontRegistry.available_fonts)}, "
+                f"got {font['name']!r}"
+            )
+        Layout._number("layout.font.size", font["size"], positive=True)
+
+        # Check the positions
+        qrcode = fields["qrcode"]
+        for field in ("left", "bottom"):
+            Layout._number(f"layout.qrcode.{field}", qrcode[field])
+        for field in ("width", "height"):
+            Layout._number(f"layout.qrcode.{field}", qrcode[field], positive=True)
+        for text in ("name", "title", "certifier"):
+            for field in ("left", "bottom"):
+                Layout._number(f"layout.{text}.{field}", fields[text][field])
+
+        return Layout(
+            template,
+            Font(font["name"], font["size"]),
+            Box(qrcode["left"], qrcode["bottom"], qrcode["width"], qrcode["height"]),
+            Position(fields["name"]["left"], fields["name"]["bottom"]),
+            Position(fields["title"]["left"], fields["title"]["bottom"]),
+            Position(fields["certifier"]["left"], fields["certifier"]["bottom"]),
+            Utils.digest(fields),
+        )
+
+    @staticmethod
+    def _template(template: object) -> None:
+        """
+        Checks that a template is an image file under `template_dir`, given by its path or by the
+        URL this application serves it at (which `TemplateCache` maps back to the file). Other
+        local files and URLs are rejected, so that certifiers can neither embed arbitrary files of
+        the server in their certificates nor make it fetch arbitrary URLs.
+
+        Args:
+            template: The path or URL of the template.
+        Raises:
+            LayoutError: If the template is not an image file under `template_dir`.
+        """
+        if not isinstance(template, str) or not template:
+            raise LayoutError(
+                f"layout.template must be a non-empty string, got {template!r}"
+            )
+        if template.startswith(("http://", "https://")):
+            path = TemplateCache._local_path(template)
+        else:
+            path = None if "://" in template else template
+        template_dir = realpath(Layout.template_dir)
+        if (
+            path is None
+            or commonpath((template_dir, realpath(path))) != template_dir
+            or splitext(path)[1].lower() not in Layout.template_extensions
+            or not isfile(path)
+        ):
+            raise LayoutError(
+                f"layout.template must be a {'/'.join(Layout.template_extensions)} image in "
+                f"{Layout.template_dir} or a URL of one, got {template!r}"
+            )
+
+    @staticmethod
+    def _merge(field_path: str, settings: object, defaults: dict) -> dict:
+        """
+        Fills the fields missing from `settings` with their defaults, recursively.
+
+        Args:
+            field_path: The path of `settings` in the layout, used in error messages.
+            settings: The settings to complete.
+            defaults: The default values of every field of `settings`.
+        Returns:
+            A new dictionary with every field of `defaults`.
+        Raises:
+            LayoutError: If `settings` is not a dictionary or has unknown fields.
+        """
+        if not isinstance(settings, dict):
+            raise LayoutError(
+                f"{field_path} must be an object, got {type(settings).__name__}"
+            )
+        for field in settings:
+            if field not in defaults:
+                raise LayoutError(f"{field_path} has an unknown field {field!r}")
+        return {
+            field: Layout._merge(f"{field_path}.{field}", settings[field], default)
+            if isinstance(default, dict) and field in settings
+            else settings.get(field, default)
+            for field, default in defaults.items()
+        }
+
+    @staticmethod
+    def _number(field_path: str, value: object, positive: bool = False) -> None:
+        """
+        Checks that a field is a finite number.
+
+        Args:
+            field_path: The path of the field in the layout, used in error messages.
+            value: The value of the field.
+            positive: Whether the number must also be greater than zero.
+        Raises:
+            LayoutError: If the value is not a finite (positive) number.
+        """
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or not isfinite(value)
+            or (positive and value <= 0)
+        ):
+            kind = "a positive number" if positive else "a number"
+            raise LayoutError(f"{field_path} must be {kind}, got {value!r}")
@@ -3,11 +3,39 @@ Defines the `Certificate` model and adds functionality to easily store and retri
 information from the database.
 """
 from __future__ import annotations
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from itertools import islice
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError
 from pymongo.results import InsertOneResult, UpdateResult
+from app.instrumentation import instrumented
 from app.models.user import User
 from app.models.database import Database
+from app.pdf_cache import PdfCache
+
+
+class BulkInsertError(Exception):
+    """
+    Raised by `Certificate.save_many` when some certificates could not be inserted. The other
+    certificates were inserted anyway.
+    """
+
+    def __init__(self: BulkInsertError, inserted_ids: list[str], errors: list[dict]) -> None:
+        """
+        Creates a new `BulkInsertError`.
+
+        Args:
+            inserted_ids: The ids of the certificates that were inserted, in the order they were
+            received.
+            errors: The errors of the certificates that were not inserted, as dictionaries with the
+            1-based `row` of the certificate (None for errors of a whole chunk) and the `error`
+            message.
+        """
+        super().__init__(f"{len(errors)} certificates could not be inserted")
+        self.inserted_ids = inserted_ids
+        self.errors = errors
 
 
 class Certificate:
@@ -17,7 +45,12 @@ class Certificate:
     """
 
     def __init__(
-        self: Certificate, id_: str | None, name: str, title: str, certifier_id: str
+        self: Certificate,
+        id_: str | None,
+        name: str,
+        title: str,
+        certifier_id: str,
+        updated_at: datetime | None = None,
     ) -> None:
         """
         Initializes a new `Certificate` using the arguments provided. This method is mainly used
@@ -30,11 +63,13 @@ class Certificate:
             name: The name of the user to certify.
             title: The title of the certificate.
             certifier_id: The id of the certifier issuing this certificate.
+            updated_at: The last time this certificate was saved, if it is known.
         """
         self.id_ = id_
         self.name = name
         self.title = title
         self.certifier_id = certifier_id
+        self.updated_at = updated_at
 
     def get_certifier(self: Certificate) -> User | None:
         """
@@ -47,10 +82,12 @@ class Certificate:
         """
         return User.get_by_id(self.certifier_id)
 
+    @instrumented("db.certificate.save")
     def save(self: Certificate) -> InsertOneResult | UpdateResult:
         """
         Saves this certificate to the database. If this certificate had already been inserted before
-        (determined by using its id_), this method updates it.
+        (determined by using its id_), this method updates it. Either way, `updated_at` is set to
+        the current time.
 
         Returns:
             The insert's `InsertOneResult` if the certificate was first inserted, or the update's
@@ -60,9 +97,11 @@ class Certificate:
         # Get database
         db = Database.get()
         certificates = db["certificate-list"]
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
 
-        # Update if it does not exist in database
+        # Update if it does not exist in database, discarding PDFs rendered with the old data
         if self.id_:
+            PdfCache.invalidate_certificate(self.id_)
             return certificates.update_one(
                 {"_id": ObjectId(self.id_)},
                 {
@@ -70,6 +109,7 @@ class Certificate:
                         "name": self.name,
                         "title": self.title,
                         "certifier_id": ObjectId(self.certifier_id),
+                        "updated_at": self.updated_at,
                     }
                 },
             )
@@ -80,11 +120,82 @@ class Certificate:
                     "name": self.name,
                     "title": self.title,
                     "certifier_id": ObjectId(self.certifier_id),
+                    "updated_at": self.updated_at,
                 }
             )
             self.id_ = str(insert_result.inserted_id)
             return insert_result
 
+    @staticmethod
+    @instrumented("db.certificate.save_many")
+    def save_many(certificates: Iterable[Certificate], chunk_size: int = 1000) -> list[str]:
+        """
+        Inserts many new certificates into the database. Certificates are consumed lazily and
+        written in chunks of `chunk_size` using unordered bulk inserts, so issuing thousands of
+        certificates only takes a few round trips. A certificate that cannot be inserted does not
+        stop the others from being inserted.
+
+        Args:
+            certificates: The certificates to insert. They must not have been inserted before.
+            chunk_size: The maximum number of certificates inserted per round trip.
+        Returns:
+            The ids of the inserted certificates, in the same order they were received.
+        Raises:
+            BulkInsertError: If any certificate could not be inserted, with the ids of those that
+            were.
+        """
+        # Get database
+        db = Database.get()
+        certificates = iter(certificates)
+        inserted_ids = []
+        errors = []
+        first_row = 1
+
+        # Insert certificates chunk by chunk
+        while chunk := list(islice(certificates, chunk_size)):
+            updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+            documents = [
+                {
+                    "name": certificate.name,
+                    "title": certificate.title,
+                    "certifier_id": ObjectId(certificate.certifier_id),
+                    "updated_at": updated_at,
+                }
+                for certificate in chunk
+            ]
+
+            # `insert_many` sets the `_id` of each document before sending it, so the ids of the
+            # inserted documents are known even if others fail
+            failed_indexes = set()
+            try:
+                db["certificate-list"].insert_many(documents, ordered=False)
+            except BulkWriteError as error:
+                for write_error in error.details.get("writeErrors", []):
+                    failed_indexes.add(write_error["index"])
+                    errors.append(
+                        {
+                            "row": first_row + write_error["index"],
+                            "error": write_error.get("errmsg", "Unknown error"),
+                        }
+                    )
+                for write_concern_error in error.details.get("writeConcernErrors", []):
+                    errors.append(
+                        {
+                            "row": None,
+                            "error": write_concern_error.get("errmsg", "Unknown error"),
+                        }
+                    )
+            for index, (certificate, document) in enumerate(zip(chunk, documents)):
+                if index not in failed_indexes:
+                    certificate.id_ = str(document["_id"])
+                    certificate.updated_at = updated_at
+                    inserted_ids.append(certificate.id_)
+            first_row += len(chunk)
+
+        if errors:
+            raise BulkInsertError(inserted_ids, errors)
+        return inserted_ids
+
     @staticmethod
     def create(name: str, title: str, certifier_id: str) -> Certificate:
         """
@@ -102,6 +213,7 @@ class Certificate:
         return Certificate(None, name, title, certifier_id)
 
     @staticmethod
+    @instrumented("db.certificate.get_by_id")
     def get_by_id(id_: str) -> Certificate:
         """
         Retrieves the certificate with the given id from the database and returns it.
@@ -127,38 +239,212 @@ class Certificate:
             certificate["name"],
             certificate["title"],
             str(certificate["certifier_id"]),
+            certificate.get("updated_at"),
         )
 
     @staticmethod
-    def get_all_by_certifier_id(certifier_id: str) -> Certificate:
+    @instrumented("db.certificate.get_with_certifier")
+    def get_with_certifier(id_: str) -> tuple[Certificate | None, User | None]:
         """
-        Retrieves the certificate with the given id from the database and returns it.
+        Retrieves the certificate with the given id and its certifier from the database in a single
+        query. Only the certifier's public fields are retrieved, so the returned certifier has no
+        password hash.
 
         Args:
-            id_: The id of the object to search.
+            id_: The id of the certificate to search.
         Returns:
-            The certificate with the given id, if one was found. None otherwise.
+            The certificate with the given id and its certifier. The certificate is None if it was
+            not found, and the certifier is None if it was not found (which usually means that your
+            data has errors).
         """
         # Check that id format is valid
         try:
-            object_id = ObjectId(certifier_id)
+            object_id = ObjectId(id_)
         except InvalidId:
-            return None
+            return None, None
+
+        # Get database and retrieve certificate joined with its certifier
+        db = Database.get()
+        results = db["certificate-list"].aggregate(
+            Certificate.with_certifier_pipeline(object_id)
+        )
+        return Certificate.from_joined_document(next(results, None))
+
+    @staticmethod
+    def with_certifier_pipeline(object_id: ObjectId) -> list[dict]:
+        """
+        Returns the aggregation pipeline used by `get_with_certifier`, which finds a certificate and
+        joins it with the public fields of its certifier.
+
+        Args:
+            object_id: The id of the certificate to search.
+        Returns:
+            The stages of the aggregation pipeline.
+        """
+        return [
+            {"$match": {"_id": object_id}},
+            {"$limit": 1},
+            {
+                "$lookup": {
+                    "from": "certifiers",
+                    "localField": "certifier_id",
+                    "foreignField": "_id",
+                    "as": "certifier",
+                }
+            },
+            {
+                "$project": {
+                    "name": 1,
+                    "title": 1,
+                    "certifier_id": 1,
+                    "updated_at": 1,
+                    "certifier._id": 1,
+                    "certifier.name": 1,
+                    "certifier.url": 1,
+                    "certifier.updated_at": 1,
+                    "certifier.layout": 1,
+                    "certifier.layout_version": 1,
+                }
+            },
+        ]
+
+    @staticmethod
+    def from_joined_document(
+        certificate: dict | None,
+    ) -> tuple[Certificate | None, User | None]:
+        """
+        Builds a certificate and its certifier from a document returned by the pipeline of
+        `with_certifier_pipeline`.
+
+        Args:
+            certificate: The document, or None if no certificate was found.
+        Returns:
+            The certificate and its certifier, as returned by `get_with_certifier`.
+        """
+        if not certificate:
+            return None, None
+        certifier = None
+        if certificate["certifier"]:
+            certifier = User(
+                str(certificate["certifier"][0]["_id"]),
+                certificate["certifier"][0]["name"],
+                None,
+                certificate["certifier"][0].get("url"),
+                certificate["certifier"][0].get("updated_at"),
+                layout=certificate["certifier"][0].get("layout"),
+                layout_version=certificate["certifier"][0].get("layout_version", 0),
+            )
+        return (
+            Certificate(
+                str(certificate["_id"]),
+                certificate["name"],
+                certificate["title"],
+                str(certificate["certifier_id"]),
+                certificate.get("updated_at"),
+            ),
+            certifier,
+        )
+
+    @staticmethod
+    @instrumented("db.certificate.get_page_by_certifier_id")
+    def get_page_by_certifier_id(
+        certifier_id: str,
+        page_size: int,
+        after: str | None = None,
+        before: str | None = None,
+    ) -> tuple[list[Certificate], str | None, str | None]:
+        """
+        Retrieves a page of the certificates issued by a certifier, newest first. Pages are located
+        by the id of a neighbouring certificate (keyset pagination) rather than skipped over, so
+        retrieving any page costs the same. Instead of counting every certificate, one extra
+        certificate is retrieved to know whether there are more pages.
+
+        Args:
+            certifier_id: The id of the certifier whose certificates should be retrieved.
+            page_size: The maximum number of certificates in the page.
+            after: If given, the page starts right after the certificate with this id.
+            before: If given (and `after` is not), the page ends right before the certificate with
+            this id.
+        Returns:
+            The certificates in the page, the cursor to pass as `after` to get the next page and the
+            cursor to pass as `before` to get the previous page. Cursors are None if there are no
+            more pages in that direction. If any id is in an invalid format, the page is empty.
+        """
+        # Check that id formats are valid
+        try:
+            query = {"certifier_id": ObjectId(certifier_id)}
+            if after:
+                query["_id"] = {"$lt": ObjectId(after)}
+            elif before:
+                query["_id"] = {"$gt": ObjectId(before)}
+        except InvalidId:
+            return [], None, None
 
         # Get database
         db = Database.get()
 
-        # Retrieve objects
+        # Retrieve objects, reading pages before a cursor backwards
+        backwards = bool(before) and not after
+        documents = list(
+            db["certificate-list"]
+            .find(query, {"name": 1, "title": 1, "updated_at": 1})
+            .sort("_id", 1 if backwards else -1)
+            .limit(page_size + 1)
+        )
+        has_more = len(documents) > page_size
+        documents = documents[:page_size]
+        if backwards:
+            documents.reverse()
         certificates = [
             Certificate(
                 str(certificate["_id"]),
                 certificate["name"],
                 certificate["title"],
-                str(certificate["certifier_id"]),
+                certifier_id,
+                certificate.get("updated_at"),
             )
-            for certificate in db["certificate-list"]
-            .find({"certifier_id": object_id})
-            .limit(20)
+            for certificate in documents
         ]
 
-        return certificates
+        # Compute cursors of the neighbouring pages
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else bool(after)
+        next_cursor = certificates[-1].id_ if certificates and has_next else None
+        previous_cursor = certificates[0].id_ if certificates and has_previous else None
+        return certificates, next_cursor, previous_cursor
+
+    @staticmethod
+    def iter_by_certifier_id(
+        certifier_id: str, ids: list[str] | None = None
+    ) -> Iterator[Certificate]:
+        """
+        Lazily retrieves the certificates issued by a certifier from the database, reading them from
+        the cursor as they are consumed.
+
+        Args:
+            certifier_id: The id of the certifier whose certificates should be retrieved.
+            ids: If given, only certificates with one of these ids are retrieved. Ids in an invalid
+            format are ignored.
+        Returns:
+            An iterator over the retrieved certificates.
+        """
+        # Check that id format is valid
+        try:
+            query = {"certifier_id": ObjectId(certifier_id)}
+        except InvalidId:
+            return
+        if ids is not None:
+            query["_id"] = {"$in": [ObjectId(id_) for id_ in ids if ObjectId.is_valid(id_)]}
+
+        # Get database
+        db = Database.get()
+
+        # Retrieve objects
+        for certificate in db["certificate-list"].find(query):
+            yield Certificate(
+                str(certificate["_id"]),
+                certificate["name"],
+                certificate["title"],
+                str(certificate["certifier_id"]),
+                certificate.get("updated_at"),
+            )
@@ -2,10 +2,16 @@
 Module containing the namespace-like class `Database`, which includes utilities for working with the
 database.
 """
-from os import environ
-from flask import g
-from pymongo import MongoClient
+from atexit import register as register_exit
+from os import environ, getpid
+from threading import Lock
+import logging
+from flask import current_app
+from pymongo import ASCENDING, IndexModel, MongoClient
 from pymongo.database import Database as MongoDatabase
+from pymongo.errors import OperationFailure
+from app.instrumentation import instrumented
+from app.query_monitor import listener
 
 
 class Database:
@@ -14,27 +20,70 @@ class Database:
     and main database for this application.
     """
 
+    # Indexes required by the queries of the models, by collection
+    required_indexes = {
+        "certifiers": [IndexModel([("name", ASCENDING)], name="name", unique=True)],
+        "certificate-list": [
+            IndexModel(
+                [("certifier_id", ASCENDING), ("_id", ASCENDING)],
+                name="certifier_id__id",
+            )
+        ],
+    }
+
+    _client = None
+    _client_pid = None
+    _indexes_ensured = False
+    _lock = Lock()
+
     @staticmethod
     def get_client() -> MongoClient:
         """
-        Lazily opens a connection to MongoDB, stores it in the application context for future use,
-        and returns it.
+        Lazily creates the MongoDB client of this process and returns it. The client keeps a pool of
+        connections that is shared by every request, configured by the `DB_*` options of the
+        application. A process forked after the client was created gets its own client.
 
         Returns:
-            A MongoClient connection to the cluster specified by the environment variables.
-        """
-        client = getattr(g, "db_client", None)
-        if not client:
-            username = environ["DB_USERNAME"]
-            password = environ["DB_PASSWORD"]
-            hostname = environ["DB_HOSTNAME"]
-            connection_string = (
-                f"mongodb+srv://{username}:{password}@{hostname}/?w=majority"
-            )
-            g.db_client = client = MongoClient(connection_string)
-        return client
+            A MongoClient connected to the cluster specified by the environment variables.
+        """
+        client = Database._client
+        if client is not None and Database._client_pid == getpid():
+            return client
+        with Database._lock:
+            if Database._client is None or Database._client_pid != getpid():
+                username = environ["DB_USERNAME"]
+                password = environ["DB_PASSWORD"]
+                hostname = environ["DB_HOSTNAME"]
+                connection_string = (
+                    f"mongodb+srv://{username}:{password}@{hostname}/?w=majority"
+                )
+                config = current_app.config
+                Database._client = MongoClient(
+                    connection_string,
+                    maxPoolSize=config.get("DB_MAX_POOL_SIZE", 100),
+                    minPoolSize=config.get("DB_MIN_POOL_SIZE", 0),
+                    connectTimeoutMS=config.get("DB_CONNECT_TIMEOUT_MS", 20000),
+                    serverSelectionTimeoutMS=config.get(
+                        "DB_SERVER_SELECTION_TIMEOUT_MS", 30000
+                    ),
+                    socketTimeoutMS=config.get("DB_SOCKET_TIMEOUT_MS"),
+                    event_listeners=[listener],
+                )
+                Database._client_pid = getpid()
+            return Database._client
 
     @staticmethod
+    def close_client() -> None:
+        """
+        Closes the MongoDB client of this process, if it exists. Called when the process exits.
+        """
+        with Database._lock:
+            if Database._client is not None and Database._client_pid == getpid():
+                Database._client.close()
+            Database._client = None
+
+    @staticmethod
+    @instrumented("db.get")
     def get() -> MongoDatabase:
         """
         Retrieves the default MongoDB database for this application (called `project2`) and returns
@@ -46,4 +95,61 @@ class Database:
         """
         client = Database.get_client()
         db = client["project2"]
+        if not Database._indexes_ensured and current_app.config.get(
+            "DB_ENSURE_INDEXES", True
+        ):
+            Database.ensure_indexes(db)
         return db
+
+    @staticmethod
+    def ensure_indexes(db: MongoDatabase) -> None:
+        """
+        Creates the indexes in `required_indexes` that do not exist yet. Creating existing indexes
+        does nothing, so this is safe to call from every process. Called the first time each
+        process uses the database. Failures (e.g. duplicated names preventing a unique index) are
+        logged instead of raised, so the application keeps working without the index.
+
+        Args:
+            db: The database where indexes should be created.
+        """
+        with Database._lock:
+            if Database._indexes_ensured:
+                return
+            for collection, indexes in Database.required_indexes.items():
+                try:
+                    db[collection].create_indexes(indexes)
+                except OperationFailure as error:
+                    logging.error("Could not create indexes on %s: %s", collection, error)
+            Database._indexes_ensured = True
+
+    @staticmethod
+    def index_report(db: MongoDatabase) -> dict:
+        """
+        Compares the indexes of the database against `required_indexes`.
+
+        Args:
+            db: The database whose indexes should be checked.
+        Returns:
+            A dictionary mapping each collection to the names of its `missing` required indexes and
+            of its `unused` indexes (indexes that have never been used since the server started,
+            or that are not required at all). The `_id` index is never reported.
+        """
+        report = {}
+        for collection, indexes in Database.required_indexes.items():
+            required = {index.document["name"] for index in indexes}
+            existing = set(db[collection].index_information()) - {"_id_"}
+            used = {
+                stats["name"]
+                for stats in db[collection].aggregate([{"$indexStats": {}}])
+                if stats["accesses"]["ops"] > 0
+            }
+            report[collection] = {
+                "missing": sorted(required - existing),
+                "unused": sorted(
+                    name for name in existing if name not in required or name not in used
+                ),
+            }
+        return report
+
+
+register_exit(Database.close_client)
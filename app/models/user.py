@@ -3,11 +3,18 @@ Defines the `User` model and adds functionality to easily store and retrieve use
 the database.
 """
 from __future__ import annotations
+from copy import copy
+from datetime import datetime, timezone
+from threading import Lock
 from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.results import InsertOneResult, UpdateResult
+from flask import g, has_app_context
 from flask_login import UserMixin
+from app.cache import LRUCache
+from app.instrumentation import instrumented
 from app.models.database import Database
+from app.pdf_cache import PdfCache
 
 
 class User(UserMixin):
@@ -16,8 +23,23 @@ class User(UserMixin):
     database.
     """
 
+    # Recently retrieved users, used by `User.get_cached`
+    cache = LRUCache(1024, ttl=60)
+    # Incremented whenever cached users are discarded, so that users read from the database before
+    # an update are not cached after it
+    _generation = 0
+    _lock = Lock()
+
     def __init__(
-        self, id_: str | None, name: str, password: str, url: str | None
+        self,
+        id_: str | None,
+        name: str,
+        password: str,
+        url: str | None,
+        updated_at: datetime | None = None,
+        verification: dict | None = None,
+        layout: dict | None = None,
+        layout_version: int = 0,
     ) -> None:
         """
         Initializes a new `User` using the arguments provided. This method is mainly used internally
@@ -29,12 +51,20 @@ class User(UserMixin):
             name: The name of the user to create.
             password: The password hash of the user to create.
             url: The verified URL of the user, if one exists.
+            updated_at: The last time this user was saved, if it is known.
+            verification: The status and URL of the user's last verification attempt, if any.
+            layout: The layout settings of the user's certificates, if the user has customized them.
+            layout_version: The number of times the user's layout has been changed.
         """
         super().__init__()
         self.id_ = id_
         self.name = name
         self.password = password
         self.url = url
+        self.updated_at = updated_at
+        self.verification = verification
+        self.layout = layout
+        self.layout_version = layout_version
 
     def get_id(self: User) -> ObjectId | None:
         """
@@ -54,10 +84,22 @@ class User(UserMixin):
         """
         self.url = url
 
+    def set_verification(self: User, status: str, url: str) -> None:
+        """
+        Records the status of a verification attempt of this user.
+
+        Args:
+            status: The status of the attempt (`pending`, `verified` or `failed`).
+            url: The URL being verified.
+        """
+        self.verification = {"status": status, "url": url}
+
+    @instrumented("db.user.save")
     def save(self: User) -> InsertOneResult | UpdateResult:
         """
         Saves this user to the database. If this user had already been inserted before (determined
-        by using its id_), this method updates it.
+        by using its id_), this method updates it. Either way, `updated_at` is set to the current
+        time. Updates never write the layout, which is only changed by `User.save_layout`.
 
         Returns:
             The insert's `InsertOneResult` if the user was first inserted, or the update's
@@ -66,27 +108,124 @@ class User(UserMixin):
         # Get database
         db = Database.get()
         users = db["certifiers"]
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
 
-        # Update if it does not exist in database
+        # Update if it does not exist in database, then discard data cached with the old version
         if self.id_:
-            return users.update_one(
+            update_result = users.update_one(
                 {"_id": ObjectId(self.id_)},
                 {
                     "$set": {
                         "name": self.name,
                         "password": self.password,
                         "url": self.url,
+                        "updated_at": self.updated_at,
+                        "verification": self.verification,
                     }
                 },
             )
+            User.discard_cached(self.id_)
+            return update_result
         # If it has been just created, insert
         else:
             insert_result = users.insert_one(
-                {"name": self.name, "password": self.password, "url": self.url}
+                {
+                    "name": self.name,
+                    "password": self.password,
+                    "url": self.url,
+                    "updated_at": self.updated_at,
+                    "verification": self.verification,
+                    "layout": self.layout,
+                    "layout_version": self.layout_version,
+                }
             )
             self.id_ = str(insert_result.inserted_id)
             return insert_result
 
+    @instrumented("db.user.save_verification")
+    def save_verification(self: User) -> UpdateResult:
+        """
+        Saves only the verified URL and the verification status of this user, which must have
+        already been inserted. Unlike `User.save`, this never overwrites other fields changed
+        concurrently, such as the password or the layout.
+
+        Returns:
+            The update's `UpdateResult`.
+        """
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        update_result = Database.get()["certifiers"].update_one(
+            {"_id": ObjectId(self.id_)},
+            {
+                "$set": {
+                    "url": self.url,
+                    "verification": self.verification,
+                    "updated_at": self.updated_at,
+                }
+            },
+        )
+        User.discard_cached(self.id_)
+        return update_result
+
+    @instrumented("db.user.save_password")
+    def save_password(self: User) -> UpdateResult:
+        """
+        Saves only the password hash of this user, which must have already been inserted. Unlike
+        `User.save`, this never overwrites other fields changed concurrently, such as the outcome
+        of a verification.
+
+        Returns:
+            The update's `UpdateResult`.
+        """
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        update_result = Database.get()["certifiers"].update_one(
+            {"_id": ObjectId(self.id_)},
+            {"$set": {"password": self.password, "updated_at": self.updated_at}},
+        )
+        User.discard_cached(self.id_)
+        return update_result
+
+    @instrumented("db.user.save_layout")
+    def save_layout(self: User, layout: dict | None) -> UpdateResult:
+        """
+        Saves the layout settings of this user's certificates, which must have already been
+        inserted. The layout version is incremented by the database itself, so that layouts
+        compiled from the previous settings are no longer used even if another request changed the
+        layout concurrently.
+
+        Args:
+            layout: The new layout settings, or None to use the default layout.
+        Returns:
+            The update's `UpdateResult`.
+        """
+        self.layout = layout
+        self.updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        update_result = Database.get()["certifiers"].update_one(
+            {"_id": ObjectId(self.id_)},
+            {
+                "$set": {"layout": self.layout, "updated_at": self.updated_at},
+                "$inc": {"layout_version": 1},
+            },
+        )
+        User.discard_cached(self.id_)
+        return update_result
+
+    @staticmethod
+    def discard_cached(id_: str) -> None:
+        """
+        Discards the data cached with the previous version of a user: the user itself (in this
+        process and in the current request) and the PDFs of its certificates. Called after the user
+        is updated in the database.
+
+        Args:
+            id_: The id of the updated user.
+        """
+        with User._lock:
+            User._generation += 1
+            User.cache.pop(id_)
+        if has_app_context():
+            g.get("users", {}).pop(id_, None)
+        PdfCache.invalidate_certifier(id_)
+
     @staticmethod
     def create(name: str, password: str) -> User:
         """
@@ -102,6 +241,7 @@ class User(UserMixin):
         return User(None, name, password, None)
 
     @staticmethod
+    @instrumented("db.user.get_by_id")
     def get_by_id(id_: str) -> User:
         """
         Retrieves the user with the given id from the database and returns it.
@@ -124,9 +264,45 @@ class User(UserMixin):
             certifier["name"],
             certifier["password"],
             certifier["url"],
+            certifier.get("updated_at"),
+            certifier.get("verification"),
+            certifier.get("layout"),
+            certifier.get("layout_version", 0),
         )
 
     @staticmethod
+    def get_cached(id_: str) -> User:
+        """
+        Retrieves the user with the given id, avoiding the database when possible. Users are
+        memoized for the rest of the current request, and otherwise kept for up to a minute in a
+        process-wide cache that `User.save` invalidates. Each request gets its own copy, so changes
+        to it are not seen by other requests until it is saved.
+
+        Args:
+            id_: The id of the object to search.
+        Returns:
+            The user with the given id, if one was found. None otherwise.
+        """
+        # Use the user retrieved earlier in this request, if any
+        users = g.setdefault("users", {}) if has_app_context() else {}
+        if id_ in users:
+            return users[id_]
+
+        # Use a cached user or retrieve it from the database
+        user = User.cache.get(id_)
+        if user is None:
+            generation = User._generation
+            user = User.get_by_id(id_)
+            if user is None:
+                return None
+            with User._lock:
+                if User._generation == generation:
+                    User.cache.put(id_, user)
+        users[id_] = copy(user)
+        return users[id_]
+
+    @staticmethod
+    @instrumented("db.user.get_by_name")
     def get_by_name(name: str) -> User:
         """
         Retrieves a user with the given name from the database and returns it.
@@ -145,4 +321,8 @@ class User(UserMixin):
             certifier["name"],
             certifier["password"],
             certifier["url"],
+            certifier.get("updated_at"),
+            certifier.get("verification"),
+            certifier.get("layout"),
+            certifier.get("layout_version", 0),
         )
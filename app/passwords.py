@@ -0,0 +1,188 @@
+"""
+Provides password hashing and verification with bcrypt, run in a bounded pool of threads so that
+login spikes cannot tie up every request thread.
+"""
+from __future__ import annotations
+from atexit import register as register_exit
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from app.instrumentation import Instrumentation, instrumented
+
+
+class HasherBusyError(RuntimeError):
+    """
+    Raised when too many passwords are already waiting to be hashed or checked.
+    """
+
+
+class PasswordHasher:
+    """
+    Namespace-like class that hashes and checks passwords in a pool of `PASSWORD_HASHER_WORKERS`
+    threads (bcrypt releases the GIL while hashing). At most `PASSWORD_HASHER_MAX_QUEUE` operations
+    may be running or waiting at once; further operations are rejected with `HasherBusyError`. The
+    cost factor is set by `BCRYPT_LOG_ROUNDS`.
+    """
+
+    bcrypt = Bcrypt()
+    log_rounds = 12
+    max_queue = 32
+    completed = 0
+    rejected = 0
+
+    _executor = None
+    _pending = 0
+    _lock = Lock()
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Configures the hasher from the application configuration and creates its thread pool.
+
+        Args:
+            app: The Flask application whose configuration should be used.
+        """
+        PasswordHasher.bcrypt.init_app(app)
+        PasswordHasher.log_rounds = app.config.get("BCRYPT_LOG_ROUNDS", 12)
+        PasswordHasher.max_queue = app.config["PASSWORD_HASHER_MAX_QUEUE"]
+        with PasswordHasher._lock:
+            if PasswordHasher._executor is not None:
+                PasswordHasher._executor.shutdown(wait=False)
+            PasswordHasher._executor = ThreadPoolExecutor(
+                max_workers=app.config["PASSWORD_HASHER_WORKERS"],
+                thread_name_prefix="password-hasher",
+            )
+        if PasswordHasher.metrics not in Instrumentation.collectors:
+            Instrumentation.collectors.append(PasswordHasher.metrics)
+
+    @staticmethod
+    @instrumented("bcrypt.generate")
+    def generate(password: str) -> bytes:
+        """
+        Hashes a password with the configured cost factor.
+
+        Args:
+            password: The password to hash.
+        Returns:
+            The bcrypt hash of the password.
+        Raises:
+            HasherBusyError: If too many operations are already waiting.
+        """
+        return PasswordHasher._run(
+            PasswordHasher.bcrypt.generate_password_hash,
+            password,
+            PasswordHasher.log_rounds,
+        )
+
+    @staticmethod
+    @instrumented("bcrypt.check")
+    def check(password_hash: str | bytes, password: str) -> bool:
+        """
+        Checks a password against a bcrypt hash.
+
+        Args:
+            password_hash: The stored bcrypt hash.
+            password: The password to check.
+        Returns:
+            True if the password matches the hash, False otherwise.
+        Raises:
+            HasherBusyError: If too many operations are already waiting.
+        """
+        return PasswordHasher._run(
+            PasswordHasher.bcrypt.check_password_hash, password_hash, password
+        )
+
+    @staticmethod
+    def needs_rehash(password_hash: str | bytes) -> bool:
+        """
+        Checks whether a hash was created with a cost factor other than the configured one.
+
+        Args:
+            password_hash: The stored bcrypt hash, in the `$2b$<cost>$<salt and hash>` format.
+        Returns:
+            True if the password should be hashed again, False otherwise.
+        """
+        if isinstance(password_hash, bytes):
+            password_hash = password_hash.decode()
+        return int(password_hash.split("$")[2]) != PasswordHasher.log_rounds
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Returns usage counters of the hasher.
+
+        Returns:
+            A dictionary with the number of operations currently pending (running or queued), the
+            maximum allowed, and the number of completed and rejected operations.
+        """
+        with PasswordHasher._lock:
+            return {
+                "pending": PasswordHasher._pending,
+                "max_queue": PasswordHasher.max_queue,
+                "completed": PasswordHasher.completed,
+                "rejected": PasswordHasher.rejected,
+            }
+
+    @staticmethod
+    def metrics() -> list[str]:
+        """
+        Returns the usage counters of the hasher in the Prometheus text format.
+
+        Returns:
+            The lines of the counters.
+        """
+        stats = PasswordHasher.stats()
+        return [
+            "# HELP autocertify_password_hasher_pending Password operations running or queued.",
+            "# TYPE autocertify_password_hasher_pending gauge",
+            f"autocertify_password_hasher_pending {stats['pending']}",
+            "# HELP autocertify_password_hasher_max_queue Maximum pending password operations.",
+            "# TYPE autocertify_password_hasher_max_queue gauge",
+            f"autocertify_password_hasher_max_queue {stats['max_queue']}",
+            "# HELP autocertify_password_hasher_completed_total Password operations completed.",
+            "# TYPE autocertify_password_hasher_completed_total counter",
+            f"autocertify_password_hasher_completed_total {stats['completed']}",
+            "# HELP autocertify_password_hasher_rejected_total Password operations rejected.",
+            "# TYPE autocertify_password_hasher_rejected_total counter",
+            f"autocertify_password_hasher_rejected_total {stats['rejected']}",
+        ]
+
+    @staticmethod
+    def _run(function: callable, *args: object) -> object:
+        """
+        Runs `function` in the thread pool and waits for its result, unless too many operations are
+        already pending.
+
+        Args:
+            function: The function to run.
+            args: The arguments of the function.
+        Returns:
+            The result of the function.
+        Raises:
+            HasherBusyError: If too many operations are already waiting.
+        """
+        with PasswordHasher._lock:
+            if PasswordHasher._pending >= PasswordHasher.max_queue:
+                PasswordHasher.rejected += 1
+                raise HasherBusyError("Too many passwords are being checked.")
+            PasswordHasher._pending += 1
+        try:
+            return PasswordHasher._executor.submit(function, *args).result()
+        finally:
+            with PasswordHasher._lock:
+                PasswordHasher._pending -= 1
+                PasswordHasher.completed += 1
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Stops the thread pool. Called when the process exits.
+        """
+        with PasswordHasher._lock:
+            if PasswordHasher._executor is not None:
+                PasswordHasher._executor.shutdown(cancel_futures=True)
+            PasswordHasher._executor = None
+
+
+register_exit(PasswordHasher.shutdown)
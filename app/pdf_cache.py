@@ -0,0 +1,377 @@
+"""
+Provides a content-addressed cache of rendered certificate PDFs. Since a certificate's PDF only
+depends on the data printed in it, PDFs are stored under a hash of that data and served again
+without rebuilding them.
+"""
+from __future__ import annotations
+from collections.abc import Callable
+from os import makedirs, path, remove, replace, scandir, utime
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import TYPE_CHECKING
+from flask import Flask
+from app.cache import LRUCache
+from app.utils import Utils
+
+if TYPE_CHECKING:
+    from app.layout import Layout
+
+
+class MemoryPdfStore:
+    """
+    Stores rendered PDFs in a bounded in-memory LRU cache.
+    """
+
+    def __init__(
+        self: MemoryPdfStore,
+        max_size: int,
+        on_evict: Callable[[str], None] | None = None,
+    ) -> None:
+        """
+        Creates a new empty `MemoryPdfStore`.
+
+        Args:
+            max_size: The maximum number of PDFs kept in memory.
+            on_evict: A function called with the key of each PDF evicted to make room for others.
+        """
+        self.cache = LRUCache(
+            max_size,
+            on_evict=(lambda key, pdf: on_evict(key)) if on_evict is not None else None,
+        )
+
+    def get(self: MemoryPdfStore, key: str) -> bytes | None:
+        """
+        Retrieves the PDF stored under `key`.
+
+        Args:
+            key: The key of the PDF to retrieve.
+        Returns:
+            The bytes of the PDF if it was found. None otherwise.
+        """
+        return self.cache.get(key)
+
+    def put(self: MemoryPdfStore, key: str, pdf: bytes) -> None:
+        """
+        Stores a PDF under `key`.
+
+        Args:
+            key: The key to store the PDF under.
+            pdf: The bytes of the PDF.
+        """
+        self.cache.put(key, pdf)
+
+    def delete(self: MemoryPdfStore, key: str) -> None:
+        """
+        Removes the PDF stored under `key`, if any.
+
+        Args:
+            key: The key of the PDF to remove.
+        """
+        self.cache.pop(key)
+
+
+class DiskPdfStore:
+    """
+    Stores rendered PDFs as files in a directory, so they are shared between processes and survive
+    restarts. When the files take more than `max_bytes`, the least recently used ones are removed,
+    whichever process wrote them.
+    """
+
+    # Fraction of `max_bytes` that is kept when the directory is pruned
+    prune_to = 0.9
+
+    def __init__(self: DiskPdfStore, directory: str, max_bytes: int) -> None:
+        """
+        Creates a new `DiskPdfStore`, creating its directory if it does not exist.
+
+        Args:
+            directory: The directory where PDFs are stored.
+            max_bytes: The maximum total size of the stored PDFs.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        makedirs(directory, exist_ok=True)
+        self._lock = Lock()
+        self._size = 0
+        self._written = 0
+        self.prune()
+
+    def get(self: DiskPdfStore, key: str) -> bytes | None:
+        """
+        Retrieves the PDF stored under `key`.
+
+        Args:
+            key: The key of the PDF to retrieve.
+        Returns:
+            The bytes of the PDF if it was found. None otherwise.
+        """
+        try:
+            with open(self._path(key), "rb") as pdf_file:
+                pdf = pdf_file.read()
+        except FileNotFoundError:
+            return None
+
+        # Mark the file as recently used, so it is pruned last
+        try:
+            utime(self._path(key))
+        except OSError:
+            pass
+        return pdf
+
+    def put(self: DiskPdfStore, key: str, pdf: bytes) -> None:
+        """
+        Stores a PDF under `key`. The file is written under a temporary name and then renamed, so
+        concurrent readers never see a partially written PDF.
+
+        Args:
+            key: The key to store the PDF under.
+            pdf: The bytes of the PDF.
+        """
+        with NamedTemporaryFile(dir=self.directory, delete=False) as pdf_file:
+            pdf_file.write(pdf)
+        replace(pdf_file.name, self._path(key))
+
+        # Other processes write to the same directory, so it is also scanned again after every
+        # tenth of `max_bytes` written by this process
+        with self._lock:
+            self._size += len(pdf)
+            self._written += len(pdf)
+            must_prune = (
+                self._size > self.max_bytes or self._written > self.max_bytes // 10
+            )
+        if must_prune:
+            self.prune()
+
+    def delete(self: DiskPdfStore, key: str) -> None:
+        """
+        Removes the PDF stored under `key`, if any.
+
+        Args:
+            key: The key of the PDF to remove.
+        """
+        try:
+            remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def prune(self: DiskPdfStore) -> None:
+        """
+        Measures the stored PDFs and, if they take more than `max_bytes`, removes the least
+        recently used ones until they take at most `prune_to` of it. Only one thread of this
+        process prunes at once; others skip pruning while it does.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._written = 0
+            files = []
+            with scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".pdf"):
+                        continue
+                    try:
+                        file_stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((file_stat.st_mtime_ns, file_stat.st_size, entry.path))
+            size = sum(file_size for _, file_size, _ in files)
+            if size > self.max_bytes:
+                files.sort()
+                for _, file_size, file_path in files:
+                    if size <= self.max_bytes * self.prune_to:
+                        break
+                    try:
+                        remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                    size -= file_size
+            self._size = size
+        finally:
+            self._lock.release()
+
+    def _path(self: DiskPdfStore, key: str) -> str:
+        """
+        Returns the path of the file for the PDF stored under `key`.
+
+        Args:
+            key: The key of the PDF.
+        Returns:
+            The path of the PDF file.
+        """
+        return path.join(self.directory, f"{key}.pdf")
+
+
+class PdfCache:
+    """
+    Namespace-like class that looks up rendered PDFs in a list of stores (tiers), from the fastest
+    to the slowest. Any object with `get`, `put` and `delete` methods can be used as a store.
+
+    Keys are computed from everything rendered in a PDF, so a cached PDF is never stale; updated
+    certificates and certifiers are invalidated only to free space early. The index used for this
+    only tracks the PDFs held by the first (memory) store, and slower stores are expected to bound
+    themselves, as `DiskPdfStore` does.
+    """
+
+    stores = [MemoryPdfStore(128, on_evict=lambda key: PdfCache._unindex(key))]
+    _keys_by_certificate = {}
+    _certificates_by_certifier = {}
+    _owners = {}
+    _lock = Lock()
+
+    @staticmethod
+    def configure(app: Flask) -> None:
+        """
+        Sets up the cache stores from the application configuration (`PDF_CACHE_SIZE`,
+        `PDF_CACHE_DIR` and `PDF_CACHE_DIR_MAX_BYTES`). Any previously cached PDF is discarded.
+
+        Args:
+            app: The Flask application whose configuration should be used.
+        """
+        stores = [
+            MemoryPdfStore(
+                app.config.get("PDF_CACHE_SIZE", 128), on_evict=PdfCache._unindex
+            )
+        ]
+        if app.config.get("PDF_CACHE_DIR"):
+            stores.append(
+                DiskPdfStore(
+                    app.config["PDF_CACHE_DIR"],
+                    app.config.get("PDF_CACHE_DIR_MAX_BYTES", 512 * 1024 * 1024),
+                )
+            )
+        with PdfCache._lock:
+            PdfCache.stores = stores
+            PdfCache._keys_by_certificate = {}
+            PdfCache._certificates_by_certifier = {}
+            PdfCache._owners = {}
+
+    @staticmethod
+    def key(
+        certificate_data: object,
+        certifier_data: object,
+        layout: Layout,
+        assets_version: str,
+        url: str,
+    ) -> str:
+        """
+        Computes the key of a certificate's PDF from all the data that is rendered into it.
+
+        Args:
+            certificate_data: Information about the certificate, including the name and title.
+            certifier_data: Information about the certifier, including its name.
+            layout: The compiled layout used to build the PDF.
+            assets_version: The version of the template and font files of the layout (see
+            `CertificateBuilder.assets_version`).
+            url: The URL encoded in the certificate's QR.
+        Returns:
+            A hexadecimal SHA-256 digest identifying the PDF.
+        """
+        rendered_data = [
+            certificate_data.name,
+            certificate_data.title,
+            certifier_data.name,
+            layout.digest,
+            assets_version,
+            url,
+        ]
+        return Utils.digest(rendered_data)
+
+    @staticmethod
+    def get(key: str) -> bytes | None:
+        """
+        Retrieves a cached PDF, copying it to the faster stores if it was found in a slower one.
+
+        Args:
+            key: The key of the PDF, as returned by `PdfCache.key`.
+        Returns:
+            The bytes of the PDF if it was cached. None otherwise.
+        """
+        stores = PdfCache.stores
+        for index, store in enumerate(stores):
+            pdf = store.get(key)
+            if pdf is not None:
+                for faster_store in stores[:index]:
+                    faster_store.put(key, pdf)
+                return pdf
+        return None
+
+    @staticmethod
+    def put(key: str, pdf: bytes, certificate_id: str, certifier_id: str) -> None:
+        """
+        Stores a PDF in every store and remembers which certificate and certifier it belongs to,
+        so it can be invalidated later.
+
+        Args:
+            key: The key of the PDF, as returned by `PdfCache.key`.
+            pdf: The bytes of the PDF.
+            certificate_id: The id of the certificate rendered in the PDF.
+            certifier_id: The id of the certifier who issued the certificate.
+        """
+        with PdfCache._lock:
+            PdfCache._owners[key] = (certificate_id, certifier_id)
+            PdfCache._keys_by_certificate.setdefault(certificate_id, set()).add(key)
+            PdfCache._certificates_by_certifier.setdefault(certifier_id, set()).add(
+                certificate_id
+            )
+        for store in PdfCache.stores:
+            store.put(key, pdf)
+
+    @staticmethod
+    def invalidate_certificate(certificate_id: str) -> None:
+        """
+        Removes every cached PDF of a certificate. Called when the certificate is updated.
+
+        Args:
+            certificate_id: The id of the updated certificate.
+        """
+        with PdfCache._lock:
+            keys = list(PdfCache._keys_by_certificate.get(certificate_id, ()))
+            for key in keys:
+                PdfCache._unindex(key, locked=True)
+        for key in keys:
+            for store in PdfCache.stores:
+                store.delete(key)
+
+    @staticmethod
+    def invalidate_certifier(certifier_id: str) -> None:
+        """
+        Removes every cached PDF of the certificates issued by a certifier. Called when the
+        certifier is updated.
+
+        Args:
+            certifier_id: The id of the updated certifier.
+        """
+        with PdfCache._lock:
+            certificate_ids = list(
+                PdfCache._certificates_by_certifier.get(certifier_id, ())
+            )
+        for certificate_id in certificate_ids:
+            PdfCache.invalidate_certificate(certificate_id)
+
+    @staticmethod
+    def _unindex(key: str, locked: bool = False) -> None:
+        """
+        Removes a PDF from the index used for invalidation, along with the entries of its
+        certificate and certifier if it was their last PDF. Called when the memory store evicts it.
+
+        Args:
+            key: The key of the PDF.
+            locked: Whether the caller already holds `_lock`.
+        """
+        if not locked:
+            with PdfCache._lock:
+                PdfCache._unindex(key, locked=True)
+            return
+        owner = PdfCache._owners.pop(key, None)
+        if owner is None:
+            return
+        certificate_id, certifier_id = owner
+        keys = PdfCache._keys_by_certificate.get(certificate_id, set())
+        keys.discard(key)
+        if keys:
+            return
+        PdfCache._keys_by_certificate.pop(certificate_id, None)
+        certificate_ids = PdfCache._certificates_by_certifier.get(certifier_id, set())
+        certificate_ids.discard(certificate_id)
+        if not certificate_ids:
+            PdfCache._certificates_by_certifier.pop(certifier_id, None)
@@ -0,0 +1,273 @@
+"""
+Monitors the commands sent to MongoDB, counting queries per Flask endpoint, logging slow queries
+with the shape of their filters, and flagging requests that look like N+1 query patterns.
+"""
+from __future__ import annotations
+from collections import Counter
+from json import dumps
+from threading import Lock
+import logging
+from flask import Flask, Response, current_app, g, has_request_context, request
+from pymongo import monitoring
+from app.instrumentation import Instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def filter_shape(query: object) -> object:
+    """
+    Replaces the values of a MongoDB filter by `?`, keeping its fields and operators, so that
+    queries that only differ in their values have the same shape.
+
+    Args:
+        query: A filter, such as `{"_id": ObjectId(...)}`.
+    Returns:
+        The shape of the filter, such as `{"_id": "?"}`.
+    """
+    if isinstance(query, dict):
+        return {key: filter_shape(value) for key, value in query.items()}
+    if isinstance(query, list) and any(isinstance(item, dict) for item in query):
+        return [filter_shape(item) for item in query]
+    return "?"
+
+
+class QueryMonitor(monitoring.CommandListener):
+    """
+    Command listener registered in the MongoDB clients of `Database` and `AsyncDatabase`. Configured
+    by the `DB_SLOW_QUERY_MS`, `DB_N_PLUS_ONE_THRESHOLD` and `DB_QUERY_BUDGET` options of the
+    application.
+
+    Queries are counted under the endpoint of the request context of the thread that sends them, or
+    as "background" outside of requests. Motor sends commands from executor threads, but runs them
+    in a copy of the context of the awaiting coroutine, so the queries of the asynchronous views of
+    `AsgiApplication` are counted under their endpoint too. Verifications run by `VerificationJobs`
+    and `AsgiApplication.run_in_background` have no request context and count as "background".
+    """
+
+    # Commands that read or write documents, and where their filters are found
+    monitored_commands = {
+        "find": lambda command: command.get("filter", {}),
+        "aggregate": lambda command: next(
+            (stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage),
+            {},
+        ),
+        "count": lambda command: command.get("query", {}),
+        "distinct": lambda command: command.get("query", {}),
+        "findAndModify": lambda command: command.get("query", {}),
+        "update": lambda command: (command.get("updates") or [{}])[0].get("q", {}),
+        "delete": lambda command: (command.get("deletes") or [{}])[0].get("q", {}),
+        "insert": lambda command: {},
+    }
+
+    slow_query_ms = 100
+    n_plus_one_threshold = 2
+    query_budget = 5
+    queries = Counter()
+    requests = Counter()
+    slow_queries = Counter()
+    _pending = {}
+    _lock = Lock()
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Configures the monitor from the application configuration and registers the request hooks
+        that collect the queries of each request.
+
+        Args:
+            app: The Flask application to monitor.
+        """
+        QueryMonitor.slow_query_ms = app.config.get("DB_SLOW_QUERY_MS", 100)
+        QueryMonitor.n_plus_one_threshold = app.config.get("DB_N_PLUS_ONE_THRESHOLD", 2)
+        QueryMonitor.query_budget = app.config.get("DB_QUERY_BUDGET", 5)
+        app.before_request(QueryMonitor.start_request)
+        app.after_request(QueryMonitor.finish_request)
+        if QueryMonitor.metrics not in Instrumentation.collectors:
+            Instrumentation.collectors.append(QueryMonitor.metrics)
+
+    def started(self: QueryMonitor, event: monitoring.CommandStartedEvent) -> None:
+        """
+        Remembers a monitored command until it finishes. Called by pymongo in the thread that sends
+        the command.
+
+        Args:
+            event: The event of the command.
+        """
+        get_filter = QueryMonitor.monitored_commands.get(event.command_name)
+        if get_filter is None:
+            return
+        query = {
+            "command": event.command_name,
+            "collection": event.command.get(event.command_name),
+            "shape": filter_shape(get_filter(event.command)),
+            "endpoint": (request.endpoint or "unmatched")
+            if has_request_context()
+            else "background",
+        }
+        with QueryMonitor._lock:
+            QueryMonitor._pending[(event.connection_id, event.request_id)] = query
+        if has_request_context() and "queries" in g:
+            g.queries.append(query)
+
+    def succeeded(self: QueryMonitor, event: monitoring.CommandSucceededEvent) -> None:
+        """
+        Counts a finished command and logs it if it was slow.
+
+        Args:
+            event: The event of the command.
+        """
+        self._finish(event)
+
+    def failed(self: QueryMonitor, event: monitoring.CommandFailedEvent) -> None:
+        """
+        Counts a failed command and logs it if it was slow.
+
+        Args:
+            event: The event of the command.
+        """
+        self._finish(event)
+
+    def _finish(
+        self: QueryMonitor,
+        event: monitoring.CommandSucceededEvent | monitoring.CommandFailedEvent,
+    ) -> None:
+        """
+        Counts a command under the endpoint that sent it and logs it if it was slow.
+
+        Args:
+            event: The event of the command.
+        """
+        with QueryMonitor._lock:
+            query = QueryMonitor._pending.pop((event.connection_id, event.request_id), None)
+        if query is None:
+            return
+        duration = event.duration_micros / 1000
+        query["duration_ms"] = round(duration, 3)
+        endpoint = query["endpoint"]
+        with QueryMonitor._lock:
+            QueryMonitor.queries[endpoint] += 1
+            if duration >= QueryMonitor.slow_query_ms:
+                QueryMonitor.slow_queries[endpoint] += 1
+        if duration >= QueryMonitor.slow_query_ms:
+            logger.warning(
+                "Slow query (%.1f ms) from %s: %s on %s with filter %s",
+                duration,
+                endpoint,
+                query["command"],
+                query["collection"],
+                dumps(query["shape"], sort_keys=True),
+            )
+
+    @staticmethod
+    def start_request() -> None:
+        """
+        Starts collecting the queries of the current request. Called before each request.
+        """
+        g.queries = []
+
+    @staticmethod
+    def finish_request(response: Response) -> Response:
+        """
+        Counts the current request, flags N+1 query patterns in it and, in debug mode, warns if it
+        sent more queries than the budget. Called after each request.
+
+        Args:
+            response: The response to the current request.
+        Returns:
+            The same response.
+        """
+        queries = g.pop("queries", [])
+        with QueryMonitor._lock:
+            QueryMonitor.requests[request.endpoint or "unmatched"] += 1
+        if not queries:
+            return response
+
+        for pattern, count in QueryMonitor.n_plus_one_patterns(queries).items():
+            logger.warning(
+                "Possible N+1 queries in %s: %s sent %d times in a single request",
+                request.endpoint,
+                pattern,
+                count,
+            )
+        if current_app.debug and len(queries) > QueryMonitor.query_budget:
+            logger.warning(
+                "%s sent %d queries, over its budget of %d: %s",
+                request.endpoint,
+                len(queries),
+                QueryMonitor.query_budget,
+                ", ".join(f"{query['command']} {query['collection']}" for query in queries),
+            )
+        return response
+
+    @staticmethod
+    def n_plus_one_patterns(queries: list[dict]) -> dict[str, int]:
+        """
+        Finds patterns of a single request that suggest N+1 queries: the same query (same command,
+        collection and filter shape) repeated, or documents of several collections fetched one by
+        one by `_id` (e.g. a certificate and then its certifier) instead of in a single query.
+
+        Args:
+            queries: The queries of the request.
+        Returns:
+            The description and number of occurrences of each pattern found at least
+            `n_plus_one_threshold` times.
+        """
+        patterns = Counter()
+        lookups_by_id = Counter()
+        for query in queries:
+            if query["command"] == "insert":
+                continue
+            shape = dumps(query["shape"], sort_keys=True)
+            patterns[f"{query['command']} {query['collection']} {shape}"] += 1
+            if query["shape"] == {"_id": "?"}:
+                lookups_by_id[query["collection"]] += 1
+        if len(lookups_by_id) > 1:
+            collections = ", ".join(sorted(lookups_by_id))
+            patterns[f"lookups by _id on {collections}"] = sum(lookups_by_id.values())
+        return {
+            pattern: count
+            for pattern, count in patterns.items()
+            if count >= QueryMonitor.n_plus_one_threshold
+        }
+
+    @staticmethod
+    def metrics() -> list[str]:
+        """
+        Returns the query counters in the Prometheus text format.
+
+        Returns:
+            The lines of the counters.
+        """
+        with QueryMonitor._lock:
+            queries = dict(QueryMonitor.queries)
+            requests = dict(QueryMonitor.requests)
+            slow_queries = dict(QueryMonitor.slow_queries)
+        lines = [
+            "# HELP autocertify_db_queries_total Queries sent to MongoDB, by endpoint.",
+            "# TYPE autocertify_db_queries_total counter",
+        ]
+        lines += [
+            f'autocertify_db_queries_total{{endpoint="{endpoint}"}} {count}'
+            for endpoint, count in sorted(queries.items())
+        ]
+        lines += [
+            "# HELP autocertify_db_slow_queries_total Queries slower than DB_SLOW_QUERY_MS.",
+            "# TYPE autocertify_db_slow_queries_total counter",
+        ]
+        lines += [
+            f'autocertify_db_slow_queries_total{{endpoint="{endpoint}"}} {count}'
+            for endpoint, count in sorted(slow_queries.items())
+        ]
+        lines += [
+            "# HELP autocertify_requests_total Requests served, by endpoint.",
+            "# TYPE autocertify_requests_total counter",
+        ]
+        lines += [
+            f'autocertify_requests_total{{endpoint="{endpoint}"}} {count}'
+            for endpoint, count in sorted(requests.items())
+        ]
+        return lines
+
+
+# The listener registered in the MongoDB client of each process
+listener = QueryMonitor()
@@ -0,0 +1,249 @@
+"""
+Provides a service for rendering certificate PDFs, either in the calling thread or, for batches,
+in a pool of worker processes so that rendering can use every CPU core.
+"""
+from __future__ import annotations
+from atexit import register as register_exit
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from os import cpu_count, getpid
+from threading import Lock
+from types import SimpleNamespace
+from flask import current_app
+from app.certificate_builder import CertificateBuilder, FontRegistry, TemplateCache
+from app.layout import Layout
+from app.pdf_cache import PdfCache
+
+
+class RenderJob:
+    """
+    Holds all the data needed to render a certificate PDF. Jobs only contain plain data and compiled
+    layouts, so they can be sent to worker processes.
+    """
+
+    def __init__(
+        self: RenderJob,
+        certificate: object,
+        certifier: object,
+        view_url: str,
+    ) -> None:
+        """
+        Creates a new `RenderJob` for a certificate.
+
+        Args:
+            certificate: The certificate to render.
+            certifier: The certifier who issued the certificate, whose layout is used.
+            view_url: The URL encoded in the certificate's QR.
+        Raises:
+            LayoutError: If the certifier's layout settings are invalid.
+        """
+        self.certificate_id = certificate.id_
+        self.name = certificate.name
+        self.title = certificate.title
+        self.certifier_id = certifier.id_
+        self.certifier_name = certifier.name
+        self.layout = Layout.of(certifier)
+        self.view_url = view_url
+        assets_version, self.assets_modified_at = CertificateBuilder.assets_version(
+            self.layout
+        )
+        self.cache_key = PdfCache.key(
+            certificate, certifier, self.layout, assets_version, view_url
+        )
+
+
+def render_pdf(job: RenderJob) -> bytes:
+    """
+    Renders the PDF of a job. Used both in the calling thread and in worker processes.
+
+    Args:
+        job: The job to render.
+    Returns:
+        The bytes of the PDF.
+    """
+    return (
+        CertificateBuilder(job.layout)
+        .draw_template()
+        .add_certificate_data(job, SimpleNamespace(name=job.certifier_name))
+        .add_qrcode(job.view_url)
+        .save()
+        .getvalue()
+    )
+
+
+def warm_up_worker(template: str) -> None:
+    """
+    Loads the fonts and the default template in a newly started worker process, so that its first
+    job renders as fast as the following ones.
+
+    Args:
+        template: The template to load.
+    """
+    FontRegistry.register_all()
+    TemplateCache.get(template)
+
+
+class RenderService:
+    """
+    Namespace-like class that renders certificate PDFs, reusing cached PDFs when possible. Batches
+    are rendered by a lazily created pool of `RENDER_WORKERS` processes (one per core if it is
+    None, or in the calling thread if it is 0).
+    """
+
+    _pool = None
+    _pool_pid = None
+    _pool_size = 0
+    _lock = Lock()
+
+    @staticmethod
+    def render(job: RenderJob) -> bytes:
+        """
+        Renders a single PDF in the calling thread, unless it is already cached.
+
+        Args:
+            job: The job to render.
+        Returns:
+            The bytes of the PDF.
+        """
+        pdf = PdfCache.get(job.cache_key)
+        if pdf is None:
+            pdf = render_pdf(job)
+            PdfCache.put(job.cache_key, pdf, job.certificate_id, job.certifier_id)
+        return pdf
+
+    @staticmethod
+    def render_many(jobs: Iterable[RenderJob]) -> Iterator[tuple[RenderJob, bytes]]:
+        """
+        Renders many PDFs in parallel, yielding them in the same order as the jobs. Jobs are
+        consumed lazily and only a few of them are in flight at once, so batches of any size can be
+        rendered without holding all of their PDFs in memory.
+
+        Args:
+            jobs: The jobs to render.
+        Returns:
+            An iterator over pairs of jobs and the bytes of their PDFs.
+        """
+        pool = RenderService.get_pool()
+        if pool is None:
+            for job in jobs:
+                yield job, RenderService.render(job)
+            return
+
+        in_flight = deque()
+        max_in_flight = 2 * RenderService._pool_size
+        for job in jobs:
+            pdf = PdfCache.get(job.cache_key)
+            if pdf is None:
+                in_flight.append((job, *RenderService._submit(job)))
+            else:
+                in_flight.append((job, pdf, None))
+            if len(in_flight) >= max_in_flight:
+                yield RenderService._collect(*in_flight.popleft())
+        while in_flight:
+            yield RenderService._collect(*in_flight.popleft())
+
+    @staticmethod
+    def _submit(job: RenderJob) -> tuple[Future, ProcessPoolExecutor]:
+        """
+        Submits a job to the worker pool, replacing the pool first if it is broken.
+
+        Args:
+            job: The job to render.
+        Returns:
+            The future of the worker rendering the job, and the pool it was submitted to.
+        """
+        pool = RenderService.get_pool()
+        try:
+            return pool.submit(render_pdf, job), pool
+        except BrokenProcessPool:
+            RenderService._discard_pool(pool)
+            pool = RenderService.get_pool()
+            return pool.submit(render_pdf, job), pool
+
+    @staticmethod
+    def _collect(
+        job: RenderJob, result: bytes | Future, pool: ProcessPoolExecutor | None
+    ) -> tuple[RenderJob, bytes]:
+        """
+        Waits for the result of a job, caching it if it was rendered by a worker. If the pool broke
+        while rendering it, the pool is replaced and the job is rendered again, once.
+
+        Args:
+            job: The job whose result is collected.
+            result: The cached PDF or the future of the worker rendering it.
+            pool: The pool rendering the job, or None if the PDF was cached.
+        Returns:
+            The job and the bytes of its PDF.
+        Raises:
+            BrokenProcessPool: If the pool also broke while rendering the job again.
+        """
+        if not isinstance(result, Future):
+            return job, result
+        for attempt in range(2):
+            try:
+                pdf = result.result()
+                break
+            except BrokenProcessPool:
+                # A worker died (e.g. it was killed for using too much memory), which breaks the
+                # whole pool
+                RenderService._discard_pool(pool)
+                if attempt:
+                    raise
+                result, pool = RenderService._submit(job)
+        PdfCache.put(job.cache_key, pdf, job.certificate_id, job.certifier_id)
+        return job, pdf
+
+    @staticmethod
+    def get_pool() -> ProcessPoolExecutor | None:
+        """
+        Returns the worker pool of this process, creating it if it does not exist yet. Pools are
+        never shared with forked child processes.
+
+        Returns:
+            The worker pool, or None if `RENDER_WORKERS` is 0.
+        """
+        workers = current_app.config.get("RENDER_WORKERS")
+        if workers == 0:
+            return None
+        with RenderService._lock:
+            if RenderService._pool is None or RenderService._pool_pid != getpid():
+                RenderService._pool_size = workers or cpu_count()
+                RenderService._pool = ProcessPoolExecutor(
+                    max_workers=RenderService._pool_size,
+                    mp_context=get_context("spawn"),
+                    initializer=warm_up_worker,
+                    initargs=(Layout.defaults["template"],),
+                )
+                RenderService._pool_pid = getpid()
+            return RenderService._pool
+
+    @staticmethod
+    def _discard_pool(pool: ProcessPoolExecutor) -> None:
+        """
+        Stops a broken worker pool, so that `get_pool` creates a new one. Does nothing if the pool
+        was already replaced.
+
+        Args:
+            pool: The broken pool.
+        """
+        with RenderService._lock:
+            if RenderService._pool is not pool:
+                return
+            RenderService._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Stops the worker pool of this process, if it exists. Called when the process exits.
+        """
+        with RenderService._lock:
+            if RenderService._pool is not None and RenderService._pool_pid == getpid():
+                RenderService._pool.shutdown(cancel_futures=True)
+            RenderService._pool = None
+
+
+register_exit(RenderService.shutdown)
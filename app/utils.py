@@ -1,9 +1,69 @@
 """
-Provides utilities for the "Certificate Automation" Flask app. This includes comparing dictionaries
-for deep structural equality, connecting to the database, managing requests to websites, and more.
+Provides utilities for the "Certificate Automation" Flask app. This includes digesting data,
+managing requests to websites, and more.
 """
-from bs4 import BeautifulSoup
-import requests
+from __future__ import annotations
+from codecs import getincrementaldecoder
+from collections.abc import Iterator
+from hashlib import sha256
+from html.parser import HTMLParser
+from json import JSONDecodeError, JSONDecoder, dumps
+import re
+from typing import TextIO
+from app.http_client import HttpClient
+from app.instrumentation import instrumented
+
+
+class MetaTagScanner(HTMLParser):
+    """
+    Incremental HTML parser that looks for a `meta` tag with a specific name and content. It only
+    scans the head of the document, and marks itself as done as soon as the tag is found or the head
+    is over, so callers can stop feeding it.
+    """
+
+    def __init__(self: MetaTagScanner, name: str, content: str) -> None:
+        """
+        Creates a new `MetaTagScanner`.
+
+        Args:
+            name: Name of the `meta` tag to search.
+            content: Expected value of the `meta` tag.
+        """
+        super().__init__()
+        self.name = name
+        self.content = content
+        self.found = False
+        self.done = False
+
+    def handle_starttag(
+        self: MetaTagScanner, tag: str, attrs: list[tuple[str, str | None]]
+    ) -> None:
+        """
+        Checks `meta` tags, and stops scanning when the body starts.
+
+        Args:
+            tag: The name of the tag, in lowercase.
+            attrs: The attributes of the tag.
+        """
+        if tag == "meta":
+            attributes = dict(attrs)
+            if (
+                attributes.get("name", None) == self.name
+                and attributes.get("content", None) == self.content
+            ):
+                self.found = self.done = True
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self: MetaTagScanner, tag: str) -> None:
+        """
+        Stops scanning when the head ends.
+
+        Args:
+            tag: The name of the tag, in lowercase.
+        """
+        if tag == "head":
+            self.done = True
 
 
 class Utils:
@@ -14,48 +74,124 @@ class Utils:
     """
 
     @staticmethod
-    def check_metadata(url: str, name: str, content: str) -> bool:
+    @instrumented("http.check_metadata")
+    def check_metadata(
+        url: str, name: str, content: str, max_bytes: int = 65536
+    ) -> bool:
         """
-        Checks whether a website has a `meta` tag set to an specific value.
+        Checks whether a website has a `meta` tag set to an specific value. The website is read and
+        parsed in chunks, stopping as soon as the tag is found, the head of the document is over or
+        `max_bytes` have been read.
 
         Arguments:
             url: Website's url.
             name: Name of the `meta` tag to search.
             content: Expected value of the `meta` tag
+            max_bytes: Maximum number of bytes of the website to read.
         Returns:
-            True if the website at `url` has a `meta` tag with `name="{name}"` and
+            True if the head of the website at `url` has a `meta` tag with `name="{name}"` and
             `content="{content}"`. False otherwise.
         """
-        # Retrieve URL
-        response = requests.get(url, timeout=3)  # error if url is invalid
-        meta_elements = BeautifulSoup(response.text).find_all("meta")
+        # Retrieve URL without reading its body yet
+        with HttpClient.get(url, stream=True) as response:  # error if url is invalid
+            try:
+                decoder = getincrementaldecoder(response.encoding or "utf-8")("replace")
+            except LookupError:
+                decoder = getincrementaldecoder("utf-8")("replace")
+            scanner = MetaTagScanner(name, content)
+
+            # Scan chunks until the tag is found, the head is over or the byte budget is spent
+            bytes_read = 0
+            for chunk in response.iter_content(chunk_size=4096):
+                chunk = chunk[: max_bytes - bytes_read]
+                bytes_read += len(chunk)
+                scanner.feed(decoder.decode(chunk))
+                if scanner.done or bytes_read >= max_bytes:
+                    break
+            return scanner.found
+
+    @staticmethod
+    def digest(data: any) -> str:
+        """
+        Computes a stable digest of JSON-serializable data. Equal data always produces the same
+        digest, regardless of the order of dictionary keys.
 
-        # Iterate over meta elements
-        return any(
-            element.attrs.get("name", None) == name
-            and element.attrs.get("content", None) == content
-            for element in meta_elements
-        )
+        Arguments:
+            data: The data to digest.
+        Returns:
+            A hexadecimal SHA-256 digest of `data`.
+        """
+        return sha256(dumps(data, sort_keys=True).encode()).hexdigest()
 
     @staticmethod
-    def same_structure(dict1: any, dict2: any) -> bool:
+    def iter_json_list(text: TextIO, chunk_size: int = 65536) -> Iterator[object]:
         """
-        Checks whether two dictionaries have the same structure recursively. It is considered that two
-        objects are of the same structure if they are two non-dictionary objects of the same type or if
-        they are two dictionaries whose keys are equal and values have the same structure.
+        Lazily parses a JSON list, yielding each of its items as soon as it has been read, so that
+        large lists never have to be held in memory at once.
 
         Arguments:
-            dict1: The first variable to compare.
-            dict2: The second variable to compare.
+            text: A text stream with the JSON list, such as the body of a request.
+            chunk_size: The number of characters read from `text` at once.
         Returns:
-            True if dict2's structure matches dict1's, False otherwise.
+            An iterator over the items of the list.
+        Raises:
+            ValueError: If the stream does not contain a single well-formed JSON list.
         """
-        # Base case: At least one of dict1 or dict2 is not a dict, so just compare types.
-        if not isinstance(dict1, dict) or not isinstance(dict2, dict):
-            return type(dict1) is type(dict2)
+        decoder = JSONDecoder()
+        whitespace = re.compile(r"[ \t\n\r]*")
+        buffer = ""
+        position = 0
+        at_end = False
+        expected = "["
+
+        while True:
+            # Find the next token, reading more of the stream if needed
+            position = whitespace.match(buffer, position).end()
+            if position == len(buffer):
+                chunk = text.read(chunk_size)
+                if not chunk:
+                    raise ValueError("The JSON list is not terminated.")
+                buffer, position = chunk, 0
+                continue
+            token = buffer[position]
 
-        # Recursive case: Both dict1 or dict2 are dict, so check elements recursively
-        return len(dict1) == len(dict2) and not any(
-            key not in dict2 or not Utils.same_structure(dict1[key], dict2[key])
-            for key in dict1
-        )
+            if expected == "[":
+                if token != "[":
+                    raise ValueError("The JSON value is not a list.")
+                position += 1
+                expected = "first item"
+            elif (expected == "first item" and token == "]") or expected == "separator":
+                if token == ",":
+                    position += 1
+                    expected = "item"
+                    continue
+                if token != "]":
+                    raise ValueError(f"Expected ',' or ']' but found {token!r}.")
+                rest = buffer[position + 1 :] + text.read()
+                if rest.strip(" \t\n\r"):
+                    raise ValueError("There is data after the JSON list.")
+                return
+            else:
+                # Decode the next item, reading more of the stream until it is complete (a number
+                # is only complete once it is followed by a separator, as it may continue in the
+                # next chunk)
+                while True:
+                    try:
+                        item, end = decoder.raw_decode(buffer, position)
+                    except JSONDecodeError:
+                        if at_end:
+                            raise
+                        end = None
+                    if end is not None and (
+                        at_end
+                        or not isinstance(item, (int, float))
+                        or end < len(buffer)
+                        and buffer[end] in ",] \t\n\r"
+                    ):
+                        break
+                    chunk = text.read(chunk_size)
+                    at_end = not chunk
+                    buffer, position = buffer[position:] + chunk, 0
+                yield item
+                position = end
+                expected = "separator"
@@ -0,0 +1,138 @@
+"""
+Provides background verification of certifier websites, so that slow websites never keep a request
+waiting.
+"""
+from __future__ import annotations
+from atexit import register as register_exit
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+from flask import Flask, current_app
+from app.models.user import User
+from app.utils import Utils
+
+
+class VerificationJobs:
+    """
+    Namespace-like class that runs website verifications in a pool of `VERIFICATION_WORKERS`
+    threads (or in the calling thread if it is 0). At most `VERIFICATION_PER_HOST` verifications
+    fetch the same host at once. The outcome of each verification is stored in the certifier's
+    `verification` field.
+    """
+
+    _executor = None
+    # Semaphore of each host being verified and number of verifications using it, removed once
+    # no verification uses it
+    _host_slots = {}
+    _lock = Lock()
+
+    @staticmethod
+    def submit(user: User, url: str) -> None:
+        """
+        Marks the verification of a certifier's website as pending and schedules it.
+
+        Args:
+            user: The certifier to verify.
+            url: The URL of the certifier's website.
+        """
+        user.set_verification("pending", url)
+        user.save_verification()
+        app = current_app._get_current_object()
+        workers = app.config["VERIFICATION_WORKERS"]
+        if workers == 0:
+            VerificationJobs.run(app, user.id_, url)
+            return
+        with VerificationJobs._lock:
+            if VerificationJobs._executor is None:
+                VerificationJobs._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="verification"
+                )
+        VerificationJobs._executor.submit(VerificationJobs.run, app, user.id_, url)
+
+    @staticmethod
+    def run(app: Flask, user_id: str, url: str) -> None:
+        """
+        Verifies a certifier's website and records the outcome. To be verified, the website must
+        have a `meta` tag with `name="ca-key"` and `content="ca-key-{username}"`.
+
+        Args:
+            app: The Flask application whose configuration and database should be used.
+            user_id: The id of the certifier to verify.
+            url: The URL of the certifier's website.
+        """
+        with app.app_context():
+            user = User.get_by_id(user_id)
+            if user is None:
+                return
+
+            # Fetch the website, waiting for a free slot for its host
+            host = urlparse(url).hostname or url
+            host_slot = VerificationJobs._host_slot(
+                host, app.config["VERIFICATION_PER_HOST"]
+            )
+            verified = False
+            try:
+                if host_slot.acquire(timeout=app.config["VERIFICATION_QUEUE_TIMEOUT"]):
+                    try:
+                        verified = Utils.check_metadata(
+                            url, "ca-key", f"ca-key-{user.name}"
+                        )
+                    except Exception:  # pylint: disable=broad-exception-caught
+                        verified = False
+                    finally:
+                        host_slot.release()
+            finally:
+                VerificationJobs._leave_host(host)
+
+            # Record the outcome
+            if verified:
+                user.set_verified(url)
+            user.set_verification("verified" if verified else "failed", url)
+            user.save_verification()
+
+    @staticmethod
+    def _host_slot(host: str, limit: int) -> BoundedSemaphore:
+        """
+        Returns the semaphore limiting concurrent verifications of a host, counting the caller as
+        one of its users until it calls `_leave_host`.
+
+        Args:
+            host: The host of the website being verified.
+            limit: The maximum number of concurrent verifications of the host.
+        Returns:
+            The semaphore of the host, shared by all of its verifications.
+        """
+        with VerificationJobs._lock:
+            host_slot = VerificationJobs._host_slots.get(host)
+            if host_slot is None:
+                host_slot = VerificationJobs._host_slots[host] = [BoundedSemaphore(limit), 0]
+            host_slot[1] += 1
+            return host_slot[0]
+
+    @staticmethod
+    def _leave_host(host: str) -> None:
+        """
+        Stops counting the caller as a user of the semaphore of a host, removing the semaphore if
+        it has no other users.
+
+        Args:
+            host: The host of the website that was verified.
+        """
+        with VerificationJobs._lock:
+            host_slot = VerificationJobs._host_slots[host]
+            host_slot[1] -= 1
+            if host_slot[1] == 0:
+                del VerificationJobs._host_slots[host]
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Cancels queued verifications and stops the thread pool. Called when the process exits.
+        """
+        with VerificationJobs._lock:
+            if VerificationJobs._executor is not None:
+                VerificationJobs._executor.shutdown(cancel_futures=True)
+            VerificationJobs._executor = None
+
+
+register_exit(VerificationJobs.shutdown)
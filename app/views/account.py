@@ -3,32 +3,49 @@ Declares a blueprint which holds the views for actions related to accounts. All
 by `/account`.
 """
 import re
-from flask import Blueprint, render_template, request
+from json import JSONDecodeError, dumps, loads
+from flask import Blueprint, jsonify, render_template, request
 from flask.blueprints import BlueprintSetupState
 from flask.typing import ResponseReturnValue
-from flask_bcrypt import Bcrypt
 from flask_login import current_user, login_user, login_required
+from pymongo.errors import DuplicateKeyError
+from app.layout import Layout, LayoutError
 from app.models.user import User
-from app.utils import Utils
+from app.passwords import HasherBusyError, PasswordHasher
+from app.verification import VerificationJobs
 
 account_blueprint = Blueprint(
     "account", __name__, template_folder="templates", url_prefix="/account"
 )
 
-# Initialize Flask extensions and later add app configuration
-bcrypt = Bcrypt()
-
 
 @account_blueprint.record_once
 def on_load(state: BlueprintSetupState) -> None:
     """
-    Adds app configuration to Flask extensions.
+    Adds app configuration to Flask extensions and the password hasher.
 
     Arguments:
         state: A state object created by Flask whose `app` attribute refers to the main Flask
         application.
     """
-    bcrypt.init_app(state.app)
+    PasswordHasher.init_app(state.app)
+
+
+@account_blueprint.errorhandler(HasherBusyError)
+def on_hasher_busy(error: HasherBusyError) -> ResponseReturnValue:
+    """
+    Asks the client to retry later when too many passwords are already being checked or hashed.
+
+    Arguments:
+        error: The error raised by the password hasher.
+    """
+    return (
+        render_template(
+            "error.html", message="The server is busy. Please try again in a few seconds."
+        ),
+        429,
+        {"Retry-After": "1"},
+    )
 
 
 @account_blueprint.route("/login", methods=["GET", "POST"])
@@ -57,11 +74,14 @@ def login() -> ResponseReturnValue:
 
     # Check that account exists in database
     certifier = User.get_by_name(name)
-    if certifier is None or not bcrypt.check_password_hash(
-        certifier.password, password
-    ):
+    if certifier is None or not PasswordHasher.check(certifier.password, password):
         return render_template("error.html", message="Incorrect credentials.")
 
+    # Hash password again if the configured cost factor has changed
+    if PasswordHasher.needs_rehash(certifier.password):
+        certifier.password = PasswordHasher.generate(password)
+        certifier.save_password()
+
     # Success
     login_user(certifier, remember=True)
     return render_template("success.html", message="Logged in successfully")
@@ -106,8 +126,13 @@ def register() -> ResponseReturnValue:
             "error.html", message=f"An account with the name {name} already exists."
         )
 
-    # Update database with new account
-    User.create(name, bcrypt.generate_password_hash(password)).save()
+    # Update database with new account (names are unique, even if registered concurrently)
+    try:
+        User.create(name, PasswordHasher.generate(password)).save()
+    except DuplicateKeyError:
+        return render_template(
+            "error.html", message=f"An account with the name {name} already exists."
+        )
 
     # Return success message
     return render_template(
@@ -122,8 +147,9 @@ def verify() -> ResponseReturnValue:
     Verify an user's account. To be verified, a certifier must have a website where they have a
     `meta` tag with `name="ca-key"` and `content="ca-key-{username}"`. Then, the URL of the website
     must be submitted through this form. Accessing this view's route with GET will render a form to
-    verify the user's account. Accessing this view's route with POST will try to verify the user
-    using the information provided.
+    verify the user's account. Accessing this view's route with POST will start verifying the user
+    in the background using the information provided. The outcome can be checked later in
+    `/account/settings` or polled from `/account/verify/status`.
     """
     # If request method is GET, return form
     if request.method == "GET":
@@ -134,31 +160,85 @@ def verify() -> ResponseReturnValue:
     if not url:
         return render_template("error.html", message="URL is missing."), 400
 
-    # Check that certifier exists and retrieve its information
-    certifier = User.get_by_id(current_user.id_)
-    name = certifier.name
-
-    # Check if metadata in URL is valid for this specific certifier
-    if not Utils.check_metadata(url, "ca-key", f"ca-key-{name}"):
-        return (
-            render_template(
-                "error.html",
-                message="Metadata tag was not found. Make sure you followed the steps correctly.",
-            ),
-            400,
-        )
+    # Retrieve the certifier's information, already loaded for this request
+    certifier = User.get_cached(current_user.id_)
 
-    # Update database with verified URL
-    certifier.set_verified(url)
-    certifier.save()
+    # Start checking the metadata in URL for this specific certifier
+    VerificationJobs.submit(certifier, url)
 
     # Return success message
+    return verification_started_response(url)
+
+
+def verification_started_response(url: str) -> ResponseReturnValue:
+    """
+    Renders the page telling that the verification of a website started. Shared by `verify` and
+    its asynchronous variant (see `app.asgi`).
+
+    Args:
+        url: The URL of the website being verified.
+    Returns:
+        A success page.
+    """
     return render_template(
         "success.html",
-        message=f"Account {name} verified correctly with the website {url}",
+        message=f"Verification of the website {url} started. Check your settings to see whether "
+        "it succeeded.",
     )
 
 
+@account_blueprint.route("/verify/status", methods=["GET"])
+@login_required
+def verification_status() -> ResponseReturnValue:
+    """
+    Returns the status of the user's last verification as JSON. The status is read from the
+    database, since verifications finish in the background.
+    """
+    certifier = User.get_by_id(current_user.id_)
+    if certifier.verification != current_user.verification:
+        User.cache.pop(certifier.id_)
+    return jsonify(
+        {
+            "verified": bool(certifier.url and certifier.url != "None"),
+            "url": certifier.url,
+            "verification": certifier.verification,
+        }
+    )
+
+
+@account_blueprint.route("/layout", methods=["GET", "POST"])
+@login_required
+def layout() -> ResponseReturnValue:
+    """
+    Customizes the layout of the user's certificates. Accessing this view's route with GET will
+    render a form with the current layout settings as JSON. Accessing this view's route with POST
+    will validate and save the submitted settings; empty settings restore the default layout.
+    """
+    # If request method is GET, return form
+    if request.method == "GET":
+        return render_template(
+            "layout-account.html",
+            layout=dumps(current_user.layout or Layout.defaults, indent=4),
+        )
+
+    # Retrieve and check POST input
+    settings = request.form.get("layout", "").strip() or None
+    try:
+        if settings is not None:
+            settings = loads(settings)
+        Layout.compile(settings)
+    except JSONDecodeError as error:
+        return render_template("error.html", message=f"Layout is not valid JSON: {error}"), 400
+    except LayoutError as error:
+        return render_template("error.html", message=f"Layout is invalid: {error}"), 400
+
+    # Save the layout, so that the certifier's certificates are generated with it from now on
+    User.get_cached(current_user.id_).save_layout(settings)
+
+    # Return success message
+    return render_template("success.html", message="Layout saved successfully.")
+
+
 @account_blueprint.route("/settings", methods=["GET"])
 @login_required
 def settings() -> ResponseReturnValue:
@@ -173,5 +253,6 @@ def settings() -> ResponseReturnValue:
             "name": current_user.name,
             "verified": current_user.url and current_user.url != "None",
             "url": current_user.url,
+            "verification": current_user.verification,
         },
     )
@@ -2,14 +2,33 @@
 Declares a blueprint which holds the views for actions related to certificates. All views are
 prefixed by `/certificate`.
 """
-
-from flask import Blueprint, request, render_template, send_file, url_for
+from collections.abc import Iterator
+from csv import DictReader, Error as CSVError
+from datetime import datetime, timezone
+from io import BufferedReader, BytesIO, TextIOWrapper
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    render_template,
+    send_file,
+    stream_with_context,
+    url_for,
+)
 from flask.blueprints import BlueprintSetupState
 from flask.typing import ResponseReturnValue
 from flask_bcrypt import Bcrypt
 from flask_login import current_user, login_required
-from app.certificate_builder import CertificateBuilder
-from app.models.certificate import Certificate
+from werkzeug.http import is_resource_modified
+from app.archive import stream_zip
+from app.layout import Layout, LayoutError
+from app.models.certificate import BulkInsertError, Certificate
+from app.models.user import User
+from app.render_service import RenderJob, RenderService
+from app.utils import Utils
 
 certificate_blueprint = Blueprint(
     "certificate", __name__, template_folder="templates", url_prefix="/certificate"
@@ -31,6 +50,66 @@ def on_load(state: BlueprintSetupState) -> None:
     bcrypt.init_app(state.app)
 
 
+@certificate_blueprint.errorhandler(LayoutError)
+def on_invalid_layout(error: LayoutError) -> ResponseReturnValue:
+    """
+    Reports that a certificate cannot be generated because its certifier's layout is invalid.
+
+    Arguments:
+        error: The error raised while compiling the layout.
+    """
+    return (
+        render_template(
+            "error.html",
+            critical_error=True,
+            message=f"The certificate layout of this certifier is invalid: {error}",
+        ),
+        500,
+    )
+
+
+def not_modified_response(
+    etag: str, last_modified: datetime | None
+) -> Response | None:
+    """
+    Checks the conditional headers of the current request against the version of the requested
+    resource.
+
+    Args:
+        etag: The strong ETag of the current version of the resource.
+        last_modified: The last time the resource was modified, if it is known.
+    Returns:
+        A `304 Not Modified` response if the client already has this version of the resource.
+        None otherwise.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def last_modified_of(*models: object) -> datetime | None:
+    """
+    Returns the most recent modification time of the given models.
+
+    Args:
+        models: Models with an `updated_at` attribute, such as certificates and certifiers.
+    Returns:
+        The latest `updated_at` of the models, or None if any of them is unknown.
+    """
+    updates = [model.updated_at for model in models]
+    if None in updates:
+        return None
+    # Times read from MongoDB are naive, but always in UTC
+    return max(
+        update if update.tzinfo else update.replace(tzinfo=timezone.utc)
+        for update in updates
+    )
+
+
 @certificate_blueprint.route("/create", methods=["GET", "POST"])
 @login_required
 def create() -> ResponseReturnValue:
@@ -70,6 +149,113 @@ def create() -> ResponseReturnValue:
     )
 
 
+@certificate_blueprint.route("/bulk", methods=["GET", "POST"])
+@login_required
+def bulk() -> ResponseReturnValue:
+    """
+    Creates many certificates at once. Accessing this view's route with GET will render a form to
+    upload a CSV file with `name` and `title` columns. Accessing this view's route with POST will
+    create a certificate for each row of the uploaded CSV file, of a CSV request body (`text/csv`)
+    or of a JSON list of objects with `name` and `title` keys.
+
+    Returns:
+        The bulk creation view if the route was accessed through GET. Otherwise it returns the ids
+        of the created certificates, as JSON unless the CSV file was uploaded through the form. If
+        some certificates could not be created, the errors of each of them are also returned.
+    """
+    # If request method is GET, return form
+    if request.method == "GET":
+        return render_template("bulk-certificate.html")
+
+    # Errors and results are returned as JSON to API clients, and rendered for the form
+    from_form = request.mimetype == "multipart/form-data"
+
+    def bulk_error(message: str) -> ResponseReturnValue:
+        """
+        Returns an error response in the format expected by the client.
+
+        Args:
+            message: The error to report.
+        """
+        if from_form:
+            return render_template("error.html", message=message), 400
+        return jsonify({"error": message}), 400
+
+    # Retrieve the received rows without reading the whole body up front
+    if request.is_json:
+        rows = Utils.iter_json_list(
+            TextIOWrapper(BufferedReader(request.stream), encoding="utf-8")
+        )
+    elif request.mimetype == "text/csv":
+        rows = DictReader(
+            TextIOWrapper(BufferedReader(request.stream), encoding="utf-8-sig")
+        )
+    elif "certificates-file" in request.files:
+        rows = DictReader(
+            TextIOWrapper(
+                request.files["certificates-file"].stream, encoding="utf-8-sig"
+            )
+        )
+    else:
+        return bulk_error("A CSV file or JSON list of certificates is missing.")
+
+    # Validate rows as they are read
+    max_certificates = current_app.config["BULK_MAX_CERTIFICATES"]
+    certificates = []
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            if row_number > max_certificates:
+                return bulk_error(
+                    f"At most {max_certificates} certificates can be created at once."
+                )
+            name = row.get("name") if isinstance(row, dict) else None
+            title = row.get("title") if isinstance(row, dict) else None
+            if not (isinstance(name, str) and name and isinstance(title, str) and title):
+                return bulk_error(f"Certificate {row_number} must have a name and title.")
+            certificates.append(Certificate.create(name, title, current_user.id_))
+    except (CSVError, ValueError):
+        if request.is_json:
+            return bulk_error("The request body must be a JSON list.")
+        return bulk_error("The CSV file could not be read.")
+    if not certificates:
+        return bulk_error("No certificates were found in your request.")
+
+    # Update database with new certificates
+    try:
+        inserted_ids = Certificate.save_many(
+            certificates, current_app.config["BULK_CHUNK_SIZE"]
+        )
+    except BulkInsertError as error:
+        # Some certificates were created anyway, so their ids are reported with the errors
+        status = 207 if error.inserted_ids else 400
+        if from_form:
+            failures = "; ".join(
+                f"certificate {failure['row']}: {failure['error']}"
+                if failure["row"] is not None
+                else failure["error"]
+                for failure in error.errors
+            )
+            return (
+                render_template(
+                    "error.html",
+                    message=f"{len(error.inserted_ids)} certificates were created with the ids "
+                    + ", ".join(error.inserted_ids)
+                    + f", but some could not be created ({failures}).",
+                ),
+                status,
+            )
+        return jsonify({"ids": error.inserted_ids, "errors": error.errors}), status
+
+    # Return created ids
+    if from_form:
+        return render_template(
+            "success.html",
+            message=f"{len(inserted_ids)} certificates created successfully with the ids "
+            + ", ".join(inserted_ids),
+        )
+    return jsonify({"ids": inserted_ids}), 201
+
+
 @certificate_blueprint.route("/<string:certificate_id>/view", methods=["GET"])
 def view(certificate_id: str) -> ResponseReturnValue:
     """
@@ -85,13 +271,29 @@ def view(certificate_id: str) -> ResponseReturnValue:
             403,
         )
 
-    # Check that the ID is in valid format and exists and retrieve certificate
-    certificate = Certificate.get_by_id(certificate_id)
+    # Check that the ID is in valid format and exists and retrieve certificate and certifier
+    certificate, certifier = Certificate.get_with_certifier(certificate_id)
+    return view_response(certificate_id, certificate, certifier)
+
+
+def view_response(
+    certificate_id: str, certificate: Certificate | None, certifier: User | None
+) -> ResponseReturnValue:
+    """
+    Renders the page of a certificate, once it and its certifier have been retrieved. Shared by
+    `view` and its asynchronous variant (see `app.asgi`).
+
+    Args:
+        certificate_id: The id of the requested certificate.
+        certificate: The certificate, or None if it was not found.
+        certifier: The certifier of the certificate, or None if it was not found.
+    Returns:
+        A page displaying the information about the certificate.
+    """
     if not certificate:
         return render_template("error.html", message="ID was not found."), 403
 
-    # Check that certifier is valid and retrieve its information
-    certifier = certificate.get_certifier()
+    # Check that certifier is valid
     if not certifier:
         return (
             render_template(
@@ -102,23 +304,47 @@ def view(certificate_id: str) -> ResponseReturnValue:
             500,
         )
 
+    # Skip rendering if the client already has this version of the page
+    download_url = url_for(
+        "certificate.download", certificate_id=str(certificate_id)
+    )
+    etag = Utils.digest(
+        [
+            certificate.id_,
+            certificate.name,
+            certificate.title,
+            certifier.id_,
+            certifier.name,
+            certifier.url,
+            download_url,
+        ]
+    )
+    last_modified = last_modified_of(certificate, certifier)
+    not_modified = not_modified_response(etag, last_modified)
+    if not_modified:
+        return not_modified
+
     # Return a display of the results
-    return render_template(
-        "view-certificate.html",
-        certificate={
-            "id": certificate.id_,
-            "name": certificate.name,
-            "title": certificate.title,
-        },
-        certifier={
-            "id": certifier.id_,
-            "name": certifier.name,
-            "url": certifier.url,
-        },
-        download_url=url_for(
-            "certificate.download", certificate_id=str(certificate_id)
-        ),
+    response = make_response(
+        render_template(
+            "view-certificate.html",
+            certificate={
+                "id": certificate.id_,
+                "name": certificate.name,
+                "title": certificate.title,
+            },
+            certifier={
+                "id": certifier.id_,
+                "name": certifier.name,
+                "url": certifier.url,
+            },
+            download_url=download_url,
+        )
     )
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
 
 
 @certificate_blueprint.route("/<string:certificate_id>/download", methods=["GET"])
@@ -134,13 +360,12 @@ def download(certificate_id: str) -> ResponseReturnValue:
             403,
         )
 
-    # Check that the ID exists and is in correct format and retrieve certificate
-    certificate = Certificate.get_by_id(certificate_id)
+    # Check that the ID exists and is in correct format and retrieve certificate and certifier
+    certificate, certifier = Certificate.get_with_certifier(certificate_id)
     if not certificate:
         return render_template("error.html", message="ID was not found."), 403
 
-    # Check that certifier is valid and retrieve its information
-    certifier = certificate.get_certifier()
+    # Check that certifier is valid
     if not certifier:
         return (
             render_template(
@@ -151,25 +376,70 @@ def download(certificate_id: str) -> ResponseReturnValue:
             500,
         )
 
-    # Generate certificate
-    certificate_pdf = (
-        CertificateBuilder({})
-        .draw_template()
-        .add_certificate_data(certificate, certifier)
-        .add_qrcode(
-            url_for(
-                "certificate.view", _external=True, certificate_id=str(certificate_id)
-            )
-        )
-        .save()
+    # Skip generating the certificate if the client already has this version of it
+    job = RenderJob(
+        certificate,
+        certifier,
+        url_for("certificate.view", _external=True, certificate_id=str(certificate_id)),
     )
+    last_modified = last_modified_of(certificate, certifier)
+    if last_modified is not None:
+        last_modified = max(last_modified, job.assets_modified_at)
+    not_modified = not_modified_response(job.cache_key, last_modified)
+    if not_modified:
+        return not_modified
 
-    # Return PDF
+    # Generate certificate and return PDF
     return send_file(
-        certificate_pdf,
+        BytesIO(RenderService.render(job)),
         mimetype="application/pdf",
         as_attachment=True,
         download_name="Certificate.pdf",
+        etag=job.cache_key,
+        last_modified=last_modified,
+    )
+
+
+@certificate_blueprint.route("/archive", methods=["GET"])
+@login_required
+def archive() -> ResponseReturnValue:
+    """
+    Downloads a ZIP archive with the PDFs of the certificates issued by the current user. If `id`
+    query parameters are given, only the certificates with those ids are included. The archive is
+    streamed, adding each PDF as soon as it is generated.
+    """
+    # Retrieve GET input
+    ids = request.args.getlist("id") or None
+    certifier = current_user._get_current_object()
+
+    # Check the layout before streaming, so that an invalid layout is reported as an error page
+    Layout.of(certifier)
+
+    def certificate_files() -> Iterator[tuple[str, bytes]]:
+        """
+        Lazily generates the PDFs of the requested certificates, rendering them in parallel.
+
+        Returns:
+            An iterator over pairs of file names and PDFs.
+        """
+        jobs = (
+            RenderJob(
+                certificate,
+                certifier,
+                url_for(
+                    "certificate.view", _external=True, certificate_id=certificate.id_
+                ),
+            )
+            for certificate in Certificate.iter_by_certifier_id(certifier.id_, ids)
+        )
+        for job, pdf in RenderService.render_many(jobs):
+            yield f"Certificate-{job.certificate_id}.pdf", pdf
+
+    # Return ZIP archive
+    return Response(
+        stream_with_context(stream_zip(certificate_files())),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=Certificates.zip"},
     )
 
 
@@ -177,10 +447,27 @@ def download(certificate_id: str) -> ResponseReturnValue:
 @login_required
 def manage() -> ResponseReturnValue:
     """
-    Provides functionality for looking at user-issued certificates and managing them.
+    Provides functionality for looking at user-issued certificates and managing them. Certificates
+    are shown a page at a time, and the `after` and `before` query parameters select the page.
     """
-    # Fetch certificates issued by this user
-    certificates = Certificate.get_all_by_certifier_id(current_user.id_)
+    # Fetch the requested page of certificates issued by this user
+    certificates, next_cursor, previous_cursor = Certificate.get_page_by_certifier_id(
+        current_user.id_,
+        current_app.config["MANAGE_PAGE_SIZE"],
+        after=request.args.get("after", None),
+        before=request.args.get("before", None),
+    )
 
     # Render view
-    return render_template("manage-certificate.html", certificates=certificates)
+    next_url = url_for("certificate.manage", after=next_cursor) if next_cursor else None
+    previous_url = (
+        url_for("certificate.manage", before=previous_cursor)
+        if previous_cursor
+        else None
+    )
+    return render_template(
+        "manage-certificate.html",
+        certificates=certificates,
+        next_url=next_url,
+        previous_url=previous_url,
+    )
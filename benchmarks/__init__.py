@@ -0,0 +1,4 @@
+"""
+Includes benchmarks of the Certificate Automation Flask app. Each benchmark is a module that can be
+run with `python -m benchmarks.<module>` from the project's root.
+"""
@@ -0,0 +1,203 @@
+"""
+Benchmarks each stage of `CertificateBuilder` with the real template and font, reporting the p50 and
+p99 latency of each stage, the peak RSS of the process and the size of the generated PDFs.
+
+Run it from the project's root with:
+
+    python -m benchmarks.builder [--iterations N] [--save]
+
+Results are compared with the baseline stored in `benchmarks/baseline-builder.json`. Use `--save`
+to replace the baseline, so that changes in performance show up as diffs of that file.
+"""
+from __future__ import annotations
+from argparse import ArgumentParser
+from json import dumps, loads
+from os import path
+from resource import RUSAGE_SELF, getrusage
+from statistics import quantiles
+from sys import platform
+from time import perf_counter
+from types import SimpleNamespace
+from app.certificate_builder import CertificateBuilder, FontRegistry, TemplateCache
+from app.layout import Layout
+
+BASELINE_PATH = path.join(path.dirname(__file__), "baseline-builder.json")
+STAGES = ("__init__", "draw_template", "add_certificate_data", "add_qrcode", "save")
+
+
+def percentile(samples: list[float], percent: int) -> float:
+    """
+    Computes a percentile of a list of samples.
+
+    Args:
+        samples: The samples, in any order.
+        percent: The percentile to compute, between 1 and 99.
+    Returns:
+        The value below which `percent` percent of the samples fall.
+    """
+    if len(samples) == 1:
+        return samples[0]
+    return quantiles(samples, n=100, method="inclusive")[percent - 1]
+
+
+def peak_rss_mib() -> float:
+    """
+    Returns the peak resident set size of this process.
+
+    Returns:
+        The peak RSS in MiB.
+    """
+    max_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes while macOS reports bytes
+    return max_rss / 1024 / 1024 if platform == "darwin" else max_rss / 1024
+
+
+def build_once(layout: Layout, index: int) -> tuple[dict[str, float], int]:
+    """
+    Builds a certificate, timing each stage of the builder. Each certificate has its own data and
+    URL, as downloads of different certificates do.
+
+    Args:
+        layout: The layout of the certificate.
+        index: The number of the certificate, used to make its data unique.
+    Returns:
+        The seconds spent in each stage, and the size of the PDF in bytes.
+    """
+    certificate = SimpleNamespace(name=f"Person {index}", title=f"Participant #{index}")
+    certifier = SimpleNamespace(name="Benchmark Certifier")
+    url = f"http://localhost:5000/certificate/{index:024x}/view"
+    timings = {}
+
+    start = perf_counter()
+    builder = CertificateBuilder(layout)
+    timings["__init__"] = perf_counter() - start
+
+    start = perf_counter()
+    builder.draw_template()
+    timings["draw_template"] = perf_counter() - start
+
+    start = perf_counter()
+    builder.add_certificate_data(certificate, certifier)
+    timings["add_certificate_data"] = perf_counter() - start
+
+    start = perf_counter()
+    builder.add_qrcode(url)
+    timings["add_qrcode"] = perf_counter() - start
+
+    start = perf_counter()
+    pdf = builder.save().getvalue()
+    timings["save"] = perf_counter() - start
+
+    return timings, len(pdf)
+
+
+def run(iterations: int, warmup: int) -> dict:
+    """
+    Runs the benchmark.
+
+    Args:
+        iterations: The number of certificates to time.
+        warmup: The number of certificates built before timing, so that fonts and the template are
+        already loaded.
+    Returns:
+        The results, with the p50 and p99 latency in milliseconds of each stage and of the whole
+        build, the peak RSS in MiB and the size of the PDFs in bytes.
+    """
+    # Load fonts and template as the application does when it starts
+    layout = Layout.compile({})
+    FontRegistry.register_all()
+    TemplateCache.get(layout.template)
+    for index in range(warmup):
+        build_once(layout, -index - 1)
+
+    # Time each stage
+    samples = {stage: [] for stage in STAGES + ("total",)}
+    pdf_sizes = []
+    for index in range(iterations):
+        timings, pdf_size = build_once(layout, index)
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds * 1000)
+        samples["total"].append(sum(timings.values()) * 1000)
+        pdf_sizes.append(pdf_size)
+
+    return {
+        "iterations": iterations,
+        "stages": {
+            stage: {
+                "p50_ms": round(percentile(stage_samples, 50), 3),
+                "p99_ms": round(percentile(stage_samples, 99), 3),
+            }
+            for stage, stage_samples in samples.items()
+        },
+        "peak_rss_mib": round(peak_rss_mib(), 1),
+        "pdf_bytes": {"min": min(pdf_sizes), "max": max(pdf_sizes)},
+    }
+
+
+def report(results: dict, baseline: dict | None) -> str:
+    """
+    Formats the results as a table, including the change from the baseline if there is one.
+
+    Args:
+        results: The results of the benchmark.
+        baseline: The results stored as the baseline, if any.
+    Returns:
+        A printable table.
+    """
+
+    def change(current: float, previous: float | None) -> str:
+        if not previous:
+            return ""
+        return f"({(current - previous) / previous:+.0%})"
+
+    lines = [f"{'stage':<22}{'p50 ms':>10}{'':>8}{'p99 ms':>10}{'':>8}"]
+    for stage, stage_results in results["stages"].items():
+        previous = (baseline or {}).get("stages", {}).get(stage, {})
+        lines.append(
+            f"{stage:<22}"
+            f"{stage_results['p50_ms']:>10.3f}"
+            f"{change(stage_results['p50_ms'], previous.get('p50_ms')):>8}"
+            f"{stage_results['p99_ms']:>10.3f}"
+            f"{change(stage_results['p99_ms'], previous.get('p99_ms')):>8}"
+        )
+    previous_rss = (baseline or {}).get("peak_rss_mib")
+    previous_size = (baseline or {}).get("pdf_bytes", {}).get("max")
+    lines.append(
+        f"peak RSS: {results['peak_rss_mib']} MiB "
+        f"{change(results['peak_rss_mib'], previous_rss)}".rstrip()
+    )
+    lines.append(
+        f"PDF size: {results['pdf_bytes']['min']}-{results['pdf_bytes']['max']} bytes "
+        f"{change(results['pdf_bytes']['max'], previous_size)}".rstrip()
+    )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """
+    Parses the command line arguments, runs the benchmark and prints or saves its results.
+    """
+    parser = ArgumentParser(description="Benchmarks the stages of CertificateBuilder.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baseline"
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    baseline = None
+    if path.isfile(args.baseline):
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = loads(baseline_file.read())
+
+    results = run(args.iterations, args.warmup)
+    print(report(results, baseline))
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            baseline_file.write(dumps(results, indent=4) + "\n")
+        print(f"Baseline saved to {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
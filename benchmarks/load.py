@@ -0,0 +1,369 @@
+"""
+Load-tests the main endpoints of the application against an in-process MongoDB stand-in, so no
+network or database server is needed. The database is seeded with certifiers and certificates, and
+then concurrent clients send requests to each endpoint in turn. For each endpoint, the throughput,
+the latency percentiles and the number of database calls per request are reported.
+
+The stand-in is `mongomock`, which is not required by the application itself:
+
+    pip install mongomock
+    python -m benchmarks.load [--certifiers N] [--certificates M] [--clients C] [--requests R]
+
+Calls to the stand-in are serialized, like the operations of a single small `mongod`, so the
+numbers are most useful to compare versions of the application rather than as absolute capacity.
+"""
+from __future__ import annotations
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from json import dumps
+from os import getpid
+from random import Random
+from threading import Lock
+from time import perf_counter
+from bson import ObjectId
+from flask import Flask, has_request_context, request
+from flask.testing import FlaskClient
+from app import create_app
+from app.models.database import Database
+from app.passwords import PasswordHasher
+from benchmarks.builder import percentile
+
+try:
+    import mongomock
+except ImportError as error:
+    raise SystemExit("The load test needs mongomock: pip install mongomock") from error
+
+ENDPOINTS = ("certificate.view", "certificate.download", "certificate.manage", "account.login")
+PASSWORD = "loadtest"
+
+
+class LockedCursor:
+    """
+    Wraps a cursor of the stand-in, running its query while holding the lock of the stand-in.
+    Chained calls (such as `sort` and `limit`) return wrapped cursors too.
+    """
+
+    def __init__(self: LockedCursor, cursor: object, stand_in: StandIn) -> None:
+        """
+        Creates a new `LockedCursor`.
+
+        Args:
+            cursor: The wrapped `mongomock` cursor.
+            stand_in: The stand-in whose lock is used.
+        """
+        self._cursor = cursor
+        self._stand_in = stand_in
+        self._documents = None
+
+    def __getattr__(self: LockedCursor, name: str) -> object:
+        attribute = getattr(self._cursor, name)
+        if not callable(attribute):
+            return attribute
+
+        def chained(*args: object, **kwargs: object) -> object:
+            with self._stand_in.lock:
+                result = attribute(*args, **kwargs)
+            return LockedCursor(result, self._stand_in) if result is self._cursor else result
+
+        return chained
+
+    def __iter__(self: LockedCursor) -> LockedCursor:
+        return self
+
+    def __next__(self: LockedCursor) -> dict:
+        if self._documents is None:
+            with self._stand_in.lock:
+                self._documents = iter(list(self._cursor))
+        return next(self._documents)
+
+
+class CountingCollection:
+    """
+    Wraps a collection of the stand-in, counting every operation under the endpoint of the request
+    that issued it and serializing operations with a lock.
+    """
+
+    def __init__(self: CountingCollection, collection: object, stand_in: StandIn) -> None:
+        """
+        Creates a new `CountingCollection`.
+
+        Args:
+            collection: The wrapped `mongomock` collection.
+            stand_in: The stand-in whose counters and lock are used.
+        """
+        self._collection = collection
+        self._stand_in = stand_in
+
+    def __getattr__(self: CountingCollection, name: str) -> object:
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def counted(*args: object, **kwargs: object) -> object:
+            endpoint = request.endpoint if has_request_context() else None
+            with self._stand_in.lock:
+                self._stand_in.calls[endpoint] += 1
+                result = attribute(*args, **kwargs)
+            # Cursors run their queries lazily, so they must hold the lock when they are read
+            if hasattr(result, "__next__"):
+                return LockedCursor(result, self._stand_in)
+            return result
+
+        return counted
+
+
+class CountingDatabase:
+    """
+    Wraps a database of the stand-in, handing out counting collections.
+    """
+
+    def __init__(self: CountingDatabase, database: object, stand_in: StandIn) -> None:
+        """
+        Creates a new `CountingDatabase`.
+
+        Args:
+            database: The wrapped `mongomock` database.
+            stand_in: The stand-in whose counters and lock are used.
+        """
+        self._database = database
+        self._stand_in = stand_in
+
+    def __getitem__(self: CountingDatabase, name: str) -> CountingCollection:
+        return CountingCollection(self._database[name], self._stand_in)
+
+
+class StandIn:
+    """
+    An in-process `mongomock` client that counts database calls per endpoint. Installed as the
+    client of `Database`, so the models use it without any change.
+    """
+
+    def __init__(self: StandIn) -> None:
+        """
+        Creates a new, empty `StandIn`.
+        """
+        self.client = mongomock.MongoClient()
+        self.calls = Counter()
+        self.lock = Lock()
+
+    def __getitem__(self: StandIn, name: str) -> CountingDatabase:
+        return CountingDatabase(self.client[name], self)
+
+    def close(self: StandIn) -> None:
+        """
+        Does nothing. Called by `Database.close_client`.
+        """
+
+    def install(self: StandIn) -> None:
+        """
+        Makes `Database` use this stand-in instead of connecting to a cluster.
+        """
+        Database._client = self
+        Database._client_pid = getpid()
+        Database._indexes_ensured = False
+
+
+def seed(stand_in: StandIn, certifiers: int, certificates: int) -> tuple[list, list]:
+    """
+    Fills the stand-in with certifiers and certificates. Certificates are spread evenly between
+    certifiers, and every certifier has the password `PASSWORD`.
+
+    Args:
+        stand_in: The stand-in to fill.
+        certifiers: The number of certifiers to create.
+        certificates: The number of certificates to create.
+    Returns:
+        The names of the certifiers and the ids of the certificates.
+    """
+    db = stand_in.client["project2"]
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    password = PasswordHasher.generate(PASSWORD)
+    certifier_ids = [ObjectId() for _ in range(certifiers)]
+    names = [f"certifier-{index}" for index in range(certifiers)]
+    db["certifiers"].insert_many(
+        {
+            "_id": certifier_id,
+            "name": name,
+            "password": password,
+            "url": None,
+            "updated_at": now,
+        }
+        for certifier_id, name in zip(certifier_ids, names)
+    )
+    certificate_ids = [ObjectId() for _ in range(certificates)]
+    db["certificate-list"].insert_many(
+        {
+            "_id": certificate_id,
+            "name": f"Person {index}",
+            "title": "Load test participant",
+            "certifier_id": certifier_ids[index % certifiers],
+            "updated_at": now,
+        }
+        for index, certificate_id in enumerate(certificate_ids)
+    )
+    return names, [str(certificate_id) for certificate_id in certificate_ids]
+
+
+def send(
+    client: FlaskClient,
+    endpoint: str,
+    random: Random,
+    names: list[str],
+    certificate_ids: list[str],
+) -> int:
+    """
+    Sends a request to an endpoint with random data.
+
+    Args:
+        client: The test client of the simulated user.
+        endpoint: The endpoint to request.
+        random: The random number generator of the simulated user.
+        names: The names of the seeded certifiers.
+        certificate_ids: The ids of the seeded certificates.
+    Returns:
+        The status code of the response.
+    """
+    if endpoint == "certificate.view":
+        response = client.get(f"/certificate/{random.choice(certificate_ids)}/view")
+    elif endpoint == "certificate.download":
+        response = client.get(f"/certificate/{random.choice(certificate_ids)}/download")
+    elif endpoint == "certificate.manage":
+        response = client.get("/certificate/manage")
+    else:
+        response = client.post(
+            "/account/login", data={"name": random.choice(names), "password": PASSWORD}
+        )
+    response.close()
+    return response.status_code
+
+
+def load_endpoint(
+    app: Flask,
+    stand_in: StandIn,
+    endpoint: str,
+    clients: int,
+    requests: int,
+    names: list[str],
+    certificate_ids: list[str],
+) -> dict:
+    """
+    Sends `requests` requests to an endpoint from each of `clients` concurrent clients.
+
+    Args:
+        app: The application under test.
+        stand_in: The database stand-in, whose calls are counted.
+        endpoint: The endpoint to load.
+        clients: The number of concurrent clients.
+        requests: The number of requests sent by each client.
+        names: The names of the seeded certifiers.
+        certificate_ids: The ids of the seeded certificates.
+    Returns:
+        The results of the endpoint: number of requests and errors, throughput in requests per
+        second, p50/p90/p99 latency in milliseconds and database calls per request.
+    """
+
+    def simulate_client(seed_number: int) -> tuple[list[float], int]:
+        random = Random(seed_number)
+        client = app.test_client()
+        if endpoint == "certificate.manage":
+            client.post(
+                "/account/login",
+                data={"name": random.choice(names), "password": PASSWORD},
+            )
+        latencies = []
+        errors = 0
+        for _ in range(requests):
+            start = perf_counter()
+            status_code = send(client, endpoint, random, names, certificate_ids)
+            latencies.append((perf_counter() - start) * 1000)
+            errors += status_code >= 400
+        return latencies, errors
+
+    calls_before = stand_in.calls[endpoint]
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        outcomes = list(executor.map(simulate_client, range(clients)))
+    elapsed = perf_counter() - start
+
+    latencies = [latency for client_latencies, _ in outcomes for latency in client_latencies]
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": sum(errors for _, errors in outcomes),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "db_calls_per_request": round((stand_in.calls[endpoint] - calls_before) / total, 2),
+    }
+
+
+def report(results: dict) -> str:
+    """
+    Formats the results as a table.
+
+    Args:
+        results: The results of each endpoint.
+    Returns:
+        A printable table.
+    """
+    lines = [
+        f"{'endpoint':<24}{'requests':>9}{'errors':>8}{'req/s':>9}"
+        f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'db/req':>8}"
+    ]
+    for endpoint, endpoint_results in results.items():
+        lines.append(
+            f"{endpoint:<24}{endpoint_results['requests']:>9}{endpoint_results['errors']:>8}"
+            f"{endpoint_results['throughput_rps']:>9.1f}{endpoint_results['p50_ms']:>9.2f}"
+            f"{endpoint_results['p90_ms']:>9.2f}{endpoint_results['p99_ms']:>9.2f}"
+            f"{endpoint_results['db_calls_per_request']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """
+    Parses the command line arguments, seeds the stand-in, loads each endpoint and prints the
+    results.
+    """
+    parser = ArgumentParser(description="Load-tests the application in process.")
+    parser.add_argument("--certifiers", type=int, default=50)
+    parser.add_argument("--certificates", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=25, help="requests per client")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Create the application with background work done inline, as a single process would
+    app = create_app()
+    app.config.update({"RENDER_WORKERS": 0, "VERIFICATION_WORKERS": 0})
+    stand_in = StandIn()
+    stand_in.install()
+    with app.app_context():
+        Database.get()
+        names, certificate_ids = seed(stand_in, args.certifiers, args.certificates)
+
+    # Load each endpoint in turn
+    results = {
+        endpoint: load_endpoint(
+            app,
+            stand_in,
+            endpoint,
+            args.clients,
+            args.requests,
+            names,
+            certificate_ids,
+        )
+        for endpoint in args.endpoints
+    }
+    print(report(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(dumps(results, indent=4) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,3 +13,83 @@ SERVER_NAME = "localhost:5000"
 # Sets debug mode
 # This should always be False in production environments
 DEBUG = False
+
+# Sets the maximum size of request bodies, in bytes
+# Larger requests are rejected with 413 Content Too Large before their body is read
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+
+# Sets how many rendered certificate PDFs are kept in memory
+PDF_CACHE_SIZE = 128
+
+# Sets the directory where rendered certificate PDFs are also cached on disk
+# Set it to None to only cache PDFs in memory
+PDF_CACHE_DIR = None
+
+# Sets how many bytes of rendered certificate PDFs are kept on disk before the least recently used
+# ones are removed
+PDF_CACHE_DIR_MAX_BYTES = 512 * 1024 * 1024
+
+# Sets the maximum number of certificates that can be issued in a single bulk request
+BULK_MAX_CERTIFICATES = 10000
+
+# Sets how many certificates are inserted per database round trip when issuing in bulk
+BULK_CHUNK_SIZE = 1000
+
+# Sets how many worker processes render certificates in batches (e.g. ZIP archives)
+# Set it to None to use one process per CPU core, or to 0 to render in the request's thread
+RENDER_WORKERS = None
+
+# Sets the connection pool of the MongoDB client shared by every request of a process
+DB_MAX_POOL_SIZE = 100
+DB_MIN_POOL_SIZE = 0
+
+# Sets the MongoDB timeouts, in milliseconds
+# A socket timeout of None waits for the server indefinitely
+DB_CONNECT_TIMEOUT_MS = 20000
+DB_SERVER_SELECTION_TIMEOUT_MS = 30000
+DB_SOCKET_TIMEOUT_MS = None
+
+# Sets whether the indexes required by the application are created when a process first uses the
+# database
+DB_ENSURE_INDEXES = True
+
+# Sets how many certificates are shown per page when managing certificates
+MANAGE_PAGE_SIZE = 20
+
+# Sets how many threads handle the requests passed to the Flask application when serving it with
+# ASGI (every endpoint without an asynchronous variant, see `app.asgi`)
+ASGI_WSGI_WORKERS = 32
+
+# Sets how many threads verify certifier websites in the background
+# Set it to 0 to verify websites in the request's thread
+VERIFICATION_WORKERS = 8
+
+# Sets how many verifications can fetch the same host at once, and how many seconds a verification
+# waits for its turn before failing
+VERIFICATION_PER_HOST = 2
+VERIFICATION_QUEUE_TIMEOUT = 30
+
+# Sets the bcrypt cost factor of password hashes
+# Hashes with a different cost factor are replaced when their owner logs in
+BCRYPT_LOG_ROUNDS = 12
+
+# Sets how many threads hash and check passwords, and how many operations can be running or waiting
+# at once before further logins and registrations are rejected with 429 Too Many Requests
+PASSWORD_HASHER_WORKERS = 4
+PASSWORD_HASHER_MAX_QUEUE = 32
+
+# Sets whether hot paths (database queries, certificate generation, website verification and
+# password hashing) are timed. Timings are reported in the Server-Timing header and logs of each
+# request, and aggregated as histograms at /metrics
+# This should be False unless the /metrics endpoint is protected from public access
+INSTRUMENTATION_ENABLED = False
+
+# Sets how long a MongoDB query can take, in milliseconds, before it is logged as slow
+DB_SLOW_QUERY_MS = 100
+
+# Sets how many times a query pattern can repeat in a single request before it is logged as a
+# possible N+1 query (e.g. fetching a certificate and then its certifier by id)
+DB_N_PLUS_ONE_THRESHOLD = 2
+
+# Sets how many queries a request can send before a warning is logged, only in debug mode
+DB_QUERY_BUDGET = 5
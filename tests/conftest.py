@@ -1,6 +1,8 @@
 from flask.testing import FlaskClient
 import pytest
 from app import create_app
+from app.layout import Layout
+from app.models.user import User
 from dotenv import load_dotenv
 
 
@@ -13,6 +15,8 @@ def client() -> FlaskClient:
         A testing `FlaskClient` that can be used in tests through fixtures.
     """
     load_dotenv()
+    User.cache.clear()
+    Layout.certifier_cache.clear()
     app = create_app()
-    app.config.update({"TESTING": True})
+    app.config.update({"TESTING": True, "RENDER_WORKERS": 0, "VERIFICATION_WORKERS": 0})
     yield app.test_client()
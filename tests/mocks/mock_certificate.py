@@ -2,6 +2,7 @@
 Includes a `MockCertificate` class that mocks the `Certificate` class
 """
 from __future__ import annotations
+from datetime import datetime
 from types import SimpleNamespace
 from tests.mocks.mock_user import MockUser
 
@@ -17,6 +18,7 @@ class MockCertificate:
         name: str,
         title: str,
         certifier_id: str | None,
+        updated_at: datetime | None = None,
     ) -> None:
         """
         Data to use for the mock.
@@ -26,12 +28,14 @@ class MockCertificate:
             name: Mocks receiver's name.
             title: Mocks receiver's title
             certifier_id: Mocks certifier's id
+            updated_at: Mocks the last time the certificate was saved.
         """
         super().__init__()
         self.id_ = id_
         self.name = name
         self.title = title
         self.certifier_id = certifier_id
+        self.updated_at = updated_at
 
     def get_certifier(self: MockCertificate) -> MockUser:
         return MockUser.get_by_id(self.certifier_id)
@@ -42,21 +46,67 @@ class MockCertificate:
         """
         return SimpleNamespace(inserted_id="somecertificate")
 
+    @staticmethod
+    def save_many(certificates: list[MockCertificate], chunk_size: int) -> list[str]:
+        """
+        Mocks the `save_many` function. Returns mock inserted ids.
+        """
+        return [f"somecertificate{index}" for index, _ in enumerate(certificates)]
+
     @staticmethod
     def get_by_id(id_: str) -> MockCertificate:
         """
         Mocks the `get_by_id` function, retrieving certificates from the "if-else database".
         """
         if id_ == "anid":
-            return MockCertificate("anid", "goodperson", "goodtitle", "someid")
+            return MockCertificate(
+                "anid", "goodperson", "goodtitle", "someid", datetime(2023, 7, 1)
+            )
         return None
 
+    @staticmethod
+    def get_with_certifier(id_: str) -> tuple[MockCertificate | None, MockUser | None]:
+        """
+        Mocks the `get_with_certifier` function, retrieving certificates and their certifiers from
+        the "if-else database".
+        """
+        certificate = MockCertificate.get_by_id(id_)
+        if not certificate:
+            return None, None
+        return certificate, MockUser.get_by_id(certificate.certifier_id)
+
     @staticmethod
     def get_all_by_certifier_id(certifier_id: str):
         if certifier_id == "someid":
             return [MockCertificate("anid", "goodperson", "goodtitle", "someid")]
         return []
 
+    @staticmethod
+    def get_page_by_certifier_id(
+        certifier_id: str,
+        page_size: int,
+        after: str | None = None,
+        before: str | None = None,
+    ):
+        """
+        Mocks the `get_page_by_certifier_id` function, retrieving certificates from the "if-else
+        database". Pretends that there are certificates before and after the first page.
+        """
+        if after or before:
+            return [], None, None
+        certificates = MockCertificate.get_all_by_certifier_id(certifier_id)
+        return certificates, "nextid", None
+
+    @staticmethod
+    def iter_by_certifier_id(certifier_id: str, ids: list[str] | None = None):
+        """
+        Mocks the `iter_by_certifier_id` function, retrieving certificates from the "if-else
+        database".
+        """
+        for certificate in MockCertificate.get_all_by_certifier_id(certifier_id):
+            if ids is None or certificate.id_ in ids:
+                yield certificate
+
     @staticmethod
     def create(title: str, name: str, certifier_id: str) -> MockCertificate:
         """
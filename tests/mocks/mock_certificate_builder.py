@@ -2,15 +2,28 @@
 Includes a `MockCertificateBuilder` class that mocks the `CertificateBuilder` class
 """
 from __future__ import annotations
+from datetime import datetime, timezone
 from io import BytesIO
 
 
 class MockCertificateBuilder:
-    def __init__(self: MockCertificateBuilder, settings: dict) -> None:
+    def __init__(self: MockCertificateBuilder, layout: object) -> None:
         """
         Initializes a MockCertificateBuilder to capture modifications made to certificate.
         """
-        self.applied_changes = [f"Loaded settings"] if settings else []
+        self.applied_changes = [f"Loaded layout with template {layout.template}"]
+
+    @staticmethod
+    def assets_version(layout: object) -> tuple[str, datetime]:
+        """
+        Mock `assets_version`, as if the template and font had not changed in a long time.
+
+        Args:
+            layout: The layout whose assets are versioned.
+        Returns:
+            A version of the assets of the layout and the last time they were modified.
+        """
+        return f"{layout.template}:1", datetime(2023, 1, 1, tzinfo=timezone.utc)
 
     def draw_template(self: MockCertificateBuilder) -> MockCertificateBuilder:
         """
@@ -0,0 +1,103 @@
+"""
+Includes `MockCollection` and `MockCursor` classes that mock the collections and cursors of pymongo
+"""
+from __future__ import annotations
+
+
+class MockCursor:
+    """
+    Mocks a pymongo `Cursor`, supporting sorting by a single field and limiting.
+    """
+
+    def __init__(self: MockCursor, documents: list[dict]) -> None:
+        """
+        Data to use for the mock.
+
+        Args:
+            documents: Mocks the documents matched by the cursor.
+        """
+        self.documents = documents
+
+    def sort(self: MockCursor, field: str, direction: int) -> MockCursor:
+        """
+        Mocks the `sort` function, sorting the documents by a single field.
+
+        Args:
+            field: The field to sort by.
+            direction: 1 to sort in ascending order, -1 to sort in descending order.
+        Returns:
+            Itself for method chaining.
+        """
+        self.documents.sort(key=lambda document: document[field], reverse=direction == -1)
+        return self
+
+    def limit(self: MockCursor, limit: int) -> MockCursor:
+        """
+        Mocks the `limit` function, keeping only the first documents.
+
+        Args:
+            limit: The maximum number of documents.
+        Returns:
+            Itself for method chaining.
+        """
+        self.documents = self.documents[:limit]
+        return self
+
+    def __iter__(self: MockCursor):
+        return iter(self.documents)
+
+
+class MockCollection:
+    """
+    Mocks a pymongo `Collection`, finding documents by equality and by the `$lt` and `$gt`
+    operators, and recording the queries it receives.
+    """
+
+    def __init__(self: MockCollection, documents: list[dict] | None = None) -> None:
+        """
+        Data to use for the mock.
+
+        Args:
+            documents: Mocks the documents of the collection.
+        """
+        self.documents = documents or []
+        self.queries = []
+
+    def find(self: MockCollection, query: dict, projection: dict | None = None) -> MockCursor:
+        """
+        Mocks the `find` function. Projections are ignored.
+
+        Args:
+            query: The filter of the documents to find.
+            projection: The fields to return.
+        Returns:
+            A cursor with the matching documents.
+        """
+        self.queries.append(query)
+        return MockCursor(
+            [dict(document) for document in self.documents if self.matches(document, query)]
+        )
+
+    @staticmethod
+    def matches(document: dict, query: dict) -> bool:
+        """
+        Checks whether a document matches a filter.
+
+        Args:
+            document: The document.
+            query: The filter, with values or `$lt` and `$gt` conditions.
+        Returns:
+            True if the document matches every condition of the filter. False otherwise.
+        """
+        for field, condition in query.items():
+            value = document.get(field)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+        return True
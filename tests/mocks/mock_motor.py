@@ -0,0 +1,72 @@
+"""
+Includes `MockMotorCollection` and `MockMotorCursor` classes that mock the collections and cursors
+of Motor, the asynchronous MongoDB driver
+"""
+from __future__ import annotations
+
+
+class MockMotorCursor:
+    """
+    Mocks an `AsyncIOMotorCommandCursor`, returning a fixed list of documents.
+    """
+
+    def __init__(self: MockMotorCursor, documents: list[dict]) -> None:
+        """
+        Data to use for the mock.
+
+        Args:
+            documents: Mocks the documents returned by the cursor.
+        """
+        self.documents = documents
+
+    async def to_list(self: MockMotorCursor, length: int | None) -> list[dict]:
+        """
+        Mocks the `to_list` function, returning the documents of the cursor.
+
+        Args:
+            length: The maximum number of documents to return, or None to return all of them.
+        Returns:
+            The documents of the cursor.
+        """
+        return self.documents[:length]
+
+
+class MockMotorCollection:
+    """
+    Mocks an `AsyncIOMotorCollection`, finding documents by `_id` and recording updates.
+    """
+
+    def __init__(self: MockMotorCollection, documents: list[dict] | None = None) -> None:
+        """
+        Data to use for the mock.
+
+        Args:
+            documents: Mocks the documents of the collection.
+        """
+        self.documents = documents or []
+        self.updates = []
+
+    def aggregate(self: MockMotorCollection, pipeline: list[dict]) -> MockMotorCursor:
+        """
+        Mocks the `aggregate` function, only applying the `$match` stage of the pipeline, which
+        must filter by `_id`.
+
+        Args:
+            pipeline: The stages of the aggregation pipeline.
+        Returns:
+            A cursor with the documents whose `_id` matches.
+        """
+        match = next(stage["$match"] for stage in pipeline if "$match" in stage)
+        return MockMotorCursor(
+            [document for document in self.documents if document["_id"] == match["_id"]]
+        )
+
+    async def update_one(self: MockMotorCollection, query: dict, update: dict) -> None:
+        """
+        Mocks the `update_one` function, recording the update.
+
+        Args:
+            query: The filter of the document to update.
+            update: The update to apply.
+        """
+        self.updates.append((query, update))
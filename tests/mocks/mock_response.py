@@ -0,0 +1,72 @@
+"""
+Includes a `MockResponse` class that mocks the `requests.Response` class
+"""
+from __future__ import annotations
+from requests import HTTPError
+
+
+class MockResponse:
+    """
+    Mocks a streamed `requests.Response`, recording how much of its body is read.
+    """
+
+    def __init__(
+        self: MockResponse,
+        body: bytes,
+        encoding: str | None = "utf-8",
+        status_code: int = 200,
+        headers: dict | None = None,
+    ) -> None:
+        """
+        Data to use for the mock.
+
+        Args:
+            body: Mocks the response's body.
+            encoding: Mocks the response's encoding.
+            status_code: Mocks the response's status code.
+            headers: Mocks the response's headers.
+        """
+        self.body = body
+        self.encoding = encoding
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = "http://example.com/"
+        self.bytes_read = 0
+        self.closed = False
+
+    def __enter__(self: MockResponse) -> MockResponse:
+        """
+        Mocks using the response as a context manager.
+        """
+        return self
+
+    def __exit__(self: MockResponse, *args: object) -> None:
+        """
+        Mocks closing the response when it is used as a context manager.
+        """
+        self.close()
+
+    def close(self: MockResponse) -> None:
+        """
+        Mocks closing the response, recording it.
+        """
+        self.closed = True
+
+    def raise_for_status(self: MockResponse) -> None:
+        """
+        Mocks the `raise_for_status` function, raising for error status codes.
+        """
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} error for {self.url}")
+
+    def iter_content(self: MockResponse, chunk_size: int):
+        """
+        Mocks the `iter_content` function, yielding the body in chunks.
+
+        Args:
+            chunk_size: The size of each chunk.
+        """
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start : start + chunk_size]
+            self.bytes_read += len(chunk)
+            yield chunk
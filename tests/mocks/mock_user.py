@@ -2,6 +2,7 @@
 Includes a `MockUser` class that mocks the `User` class
 """
 from __future__ import annotations
+from datetime import datetime
 from flask_login import UserMixin
 
 
@@ -10,7 +11,20 @@ class MockUser(UserMixin):
     Mocks the `User` class.
     """
 
-    def __init__(self, id_: str, name: str, password: str, url: str | None) -> None:
+    # Verified URLs and verification statuses saved with `save_verification`, by user id
+    stored_verifications = {}
+
+    def __init__(
+        self,
+        id_: str,
+        name: str,
+        password: str,
+        url: str | None,
+        updated_at: datetime | None = None,
+        verification: dict | None = None,
+        layout: dict | None = None,
+        layout_version: int = 0,
+    ) -> None:
         """
         Data to use for the mock.
 
@@ -19,12 +33,20 @@ class MockUser(UserMixin):
             name: Mocks user's name.
             password: Mocks user's password hash.
             url: Mock user's verified URL.
+            updated_at: Mocks the last time the user was saved.
+            verification: Mocks the user's last verification attempt.
+            layout: Mocks the user's layout settings.
+            layout_version: Mocks the version of the user's layout settings.
         """
         super().__init__()
         self.id_ = id_
         self.name = name
         self.password = password
         self.url = url
+        self.updated_at = updated_at
+        self.verification = verification
+        self.layout = layout
+        self.layout_version = layout_version
 
     def get_id(self: MockUser) -> str:
         """
@@ -45,12 +67,60 @@ class MockUser(UserMixin):
         """
         self.url = url
 
+    def set_verification(self: MockUser, status: str, url: str) -> None:
+        """
+        Mocks the `set_verification` function, recording the status of a verification attempt.
+
+        Args:
+            status: The status of the attempt.
+            url: The URL being verified.
+        """
+        self.verification = {"status": status, "url": url}
+
     def save(self: MockUser) -> None:
         """
         Mocks the `save` function. No-op.
         """
         pass
 
+    def save_password(self: MockUser) -> None:
+        """
+        Mocks the `save_password` function. No-op.
+        """
+        pass
+
+    def save_verification(self: MockUser) -> None:
+        """
+        Mocks the `save_verification` function, storing the verified URL and verification status
+        of this user so that they are returned by `get_by_id` and `get_by_name`.
+        """
+        MockUser.stored_verifications[self.id_] = (self.url, self.verification)
+
+    def save_layout(self: MockUser, layout: dict | None) -> None:
+        """
+        Mocks the `save_layout` function, setting the layout settings of this `MockUser` and
+        incrementing its layout version.
+
+        Args:
+            layout: The new layout settings.
+        """
+        self.layout = layout
+        self.layout_version += 1
+
+    @staticmethod
+    def with_stored_verification(user: MockUser | None) -> MockUser | None:
+        """
+        Applies the verified URL and verification status stored by `save_verification`.
+
+        Args:
+            user: A user from the mock "if-else database".
+        Returns:
+            The same user.
+        """
+        if user is not None and user.id_ in MockUser.stored_verifications:
+            user.url, user.verification = MockUser.stored_verifications[user.id_]
+        return user
+
     @staticmethod
     def get_by_id(id_: str) -> MockUser | None:
         """
@@ -59,6 +129,13 @@ class MockUser(UserMixin):
         Returns:
             The mocked MongoDB's id.
         """
+        return MockUser.with_stored_verification(MockUser._get_by_id(id_))
+
+    @staticmethod
+    def _get_by_id(id_: str) -> MockUser | None:
+        """
+        Retrieves users from the mock "if-else database" by id.
+        """
         if id_ == "someid":
             # User's password is 1234
             return MockUser(
@@ -66,6 +143,7 @@ class MockUser(UserMixin):
                 "someuser",
                 b"$2b$12$St2gvjcv1nzl.ZaDqHIhLO1gLNsoZ1MB7gmO8yrHigI0j7rXx6pUW",
                 None,
+                datetime(2023, 6, 1),
             )
         elif id_ == "anotherid":
             # User's password is also 1234
@@ -85,6 +163,13 @@ class MockUser(UserMixin):
         Returns:
             The mocked MongoDB's id.
         """
+        return MockUser.with_stored_verification(MockUser._get_by_name(name))
+
+    @staticmethod
+    def _get_by_name(name: str) -> MockUser | None:
+        """
+        Retrieves users from the mock "if-else database" by name.
+        """
         if name == "someuser":
             # User's password is 1234
             return MockUser(
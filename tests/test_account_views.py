@@ -4,6 +4,8 @@ Flask app. To collect and run these tests, you should use `pytest`'s test discov
 """
 from flask.testing import FlaskClient
 from pytest_mock import MockerFixture
+from app.passwords import HasherBusyError, PasswordHasher
+from app.verification import VerificationJobs
 from tests.mocks.mock_user import MockUser
 from tests.mocks.mock_utils import MockUtils
 
@@ -50,6 +52,47 @@ def test_login_view(mocker: MockerFixture, client: FlaskClient) -> None:
     assert b"Success" in response.data
 
 
+def test_login_view_password_hasher(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that logins are rejected when the password hasher is busy, and that outdated password
+    hashes are replaced on login.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Mock required functions
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    saved = mocker.patch.object(MockUser, "save", autospec=True)
+
+    # Test that a busy hasher answers with 429 Too Many Requests
+    mocker.patch.object(PasswordHasher, "check", side_effect=HasherBusyError)
+    response = client.post(
+        "/account/login", data={"name": "someuser", "password": "1234"}
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    saved.assert_not_called()
+    mocker.stopall()
+
+    # Test that hashes with an outdated cost factor are replaced, saving only the password
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    saved = mocker.patch.object(MockUser, "save_password", autospec=True)
+    saved_whole_user = mocker.patch.object(MockUser, "save", autospec=True)
+    mocker.patch.object(PasswordHasher, "log_rounds", 4)
+    response = client.post(
+        "/account/login", data={"name": "someuser", "password": "1234"}
+    )
+    assert b"Success" in response.data
+    saved.assert_called_once()
+    saved_whole_user.assert_not_called()
+    user = saved.call_args.args[0]
+    assert PasswordHasher.needs_rehash(user.password) is False
+    assert PasswordHasher.check(user.password, "1234")
+
+
 def test_register_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
     Tests the register functionality (located at /account/register).
@@ -113,7 +156,7 @@ def test_register_view(mocker: MockerFixture, client: FlaskClient) -> None:
 
 def test_verification_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
-    Tests the verification functionality (/account/verify).
+    Tests the verification functionality (/account/verify and /account/verify/status).
 
     Args:
         mocker: A mocking interface provided by `pytest-mock`.
@@ -124,6 +167,8 @@ def test_verification_view(mocker: MockerFixture, client: FlaskClient) -> None:
     mocker.patch("app.utils.Utils.check_metadata", wraps=MockUtils.check_metadata)
     mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
     mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    mocker.patch.object(MockUser, "stored_verifications", {})
+    saved = mocker.spy(MockUser, "save_verification")
 
     # Check that endpoint cannot be accessed without getting logged in
     response = client.get("/account/verify")
@@ -145,13 +190,19 @@ def test_verification_view(mocker: MockerFixture, client: FlaskClient) -> None:
         response = client.post("/account/verify")
         assert b"Error" in response.data
 
-        # Test that account cannot be verified with a non-existent URL
+        # Test that verification with a non-existent URL is started, but fails
         response = client.post("/account/verify", data={"url": "doesnotexi.st"})
-        assert b"Error" in response.data
+        assert b"Success" in response.data
+        assert saved.call_args_list[0].args[0].verification == {
+            "status": "pending",
+            "url": "doesnotexi.st",
+        }
+        assert saved.call_args.args[0].verification["status"] == "failed"
 
         # Test that account cannot be verified with valid URL that does not have correct metadata
         response = client.post("/account/verify", data={"url": "example.com"})
-        assert b"Error" in response.data
+        assert saved.call_args.args[0].verification["status"] == "failed"
+        assert saved.call_args.args[0].url is None
 
     # Logins are kept within this block
     with client.application.test_request_context():
@@ -168,6 +219,22 @@ def test_verification_view(mocker: MockerFixture, client: FlaskClient) -> None:
         # Test that account can be verified
         response = client.post("/account/verify", data={"url": "example.com"})
         assert b"Success" in response.data
+        assert saved.call_args.args[0].verification == {
+            "status": "verified",
+            "url": "example.com",
+        }
+        assert saved.call_args.args[0].url == "example.com"
+
+        # Test that the verification status can be polled
+        response = client.get("/account/verify/status")
+        assert response.json == {
+            "verified": True,
+            "url": "example.com",
+            "verification": {"status": "verified", "url": "example.com"},
+        }
+
+    # Test that the semaphores of hosts are removed once their verifications finish
+    assert not VerificationJobs._host_slots
 
 
 def test_settings_view(mocker: MockerFixture, client: FlaskClient) -> None:
@@ -182,6 +249,9 @@ def test_settings_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
     # Mock required functions
     mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    get_by_id = mocker.patch(
+        "app.models.user.User.get_by_id", wraps=MockUser.get_by_id
+    )
 
     # Check that endpoint cannot be accessed without getting logged in
     response = client.get("/account/settings")
@@ -202,3 +272,59 @@ def test_settings_view(mocker: MockerFixture, client: FlaskClient) -> None:
 
         # Check that the password is not displayed in the settings view
         assert b"1234" not in response.data
+
+    # Check that the logged in user is retrieved from the database only once
+    for _ in range(3):
+        response = client.get("/account/settings")
+        assert b"someuser" in response.data
+    assert get_by_id.call_count == 1
+
+
+def test_layout_view(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests the certificate layout functionality (/account/layout).
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Mock required functions
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
+    saved = mocker.spy(MockUser, "save_layout")
+
+    # Check that endpoint cannot be accessed without getting logged in
+    response = client.get("/account/layout")
+    assert response.status_code == 302
+
+    # Check that the form shows the default layout
+    client.post("/account/login", data={"name": "someuser", "password": "1234"})
+    response = client.get("/account/layout")
+    assert b"Poppins Bold" in response.data
+
+    # Check that invalid layouts are rejected with the offending field
+    response = client.post("/account/layout", data={"layout": "{"})
+    assert response.status_code == 400
+    assert b"not valid JSON" in response.data
+    response = client.post(
+        "/account/layout", data={"layout": '{"qrcode": {"width": -1}}'}
+    )
+    assert response.status_code == 400
+    assert b"layout.qrcode.width" in response.data
+    response = client.post(
+        "/account/layout", data={"layout": '{"template": "/etc/passwd"}'}
+    )
+    assert response.status_code == 400
+    assert b"layout.template" in response.data
+    saved.assert_not_called()
+
+    # Check that valid layouts are saved with a new version
+    response = client.post(
+        "/account/layout", data={"layout": '{"title": {"left": 322}}'}
+    )
+    assert b"Success" in response.data
+    user = saved.call_args.args[0]
+    assert user.layout == {"title": {"left": 322}}
+    assert user.layout_version == 1
@@ -0,0 +1,339 @@
+"""
+Includes tests for the ASGI serving mode (`AsgiApplication` and the asynchronous clients) of the
+Certificate Automation Flask app. To collect and run these tests, you should use `pytest`'s test
+discovery.
+"""
+from asyncio import Event, gather, run, sleep
+from collections.abc import AsyncIterator
+from datetime import datetime
+from threading import current_thread
+import time
+from bson import ObjectId
+from flask.testing import FlaskClient
+import httpx
+from pytest_mock import MockerFixture
+from app.asgi import AsgiApplication
+from app.async_clients import AsyncModels
+from app.models.certificate import Certificate
+from app.models.user import User
+from app.pdf_cache import PdfCache
+from tests.mocks.mock_motor import MockMotorCollection
+
+# Hash of the password "1234"
+PASSWORD_HASH = b"$2b$12$St2gvjcv1nzl.ZaDqHIhLO1gLNsoZ1MB7gmO8yrHigI0j7rXx6pUW"
+
+
+def asgi_client(asgi_app: AsgiApplication) -> httpx.AsyncClient:
+    """
+    Creates an HTTP client sending its requests directly to an ASGI application.
+
+    Args:
+        asgi_app: The ASGI application.
+    Returns:
+        An `httpx.AsyncClient` for the server name of the application.
+    """
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=asgi_app), base_url="http://localhost:5000"
+    )
+
+
+def mock_certifier(mocker: MockerFixture) -> str:
+    """
+    Mocks the database of users with a single certifier called "someuser", whose password is
+    "1234".
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Returns:
+        The id of the certifier.
+    """
+    user_id = str(ObjectId())
+    mocker.patch(
+        "app.models.user.User.get_by_id",
+        side_effect=lambda id_: User(user_id, "someuser", PASSWORD_HASH, None)
+        if id_ == user_id
+        else None,
+    )
+    mocker.patch(
+        "app.models.user.User.get_by_name",
+        side_effect=lambda name: User(user_id, "someuser", PASSWORD_HASH, None)
+        if name == "someuser"
+        else None,
+    )
+    return user_id
+
+
+def test_view_certificate(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that certificates are viewed through Motor by the asynchronous variant of
+    `certificate.view`.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    certificate_id = ObjectId()
+    certifier_id = ObjectId()
+    certificates = MockMotorCollection(
+        [
+            {
+                "_id": certificate_id,
+                "name": "goodperson",
+                "title": "Good person",
+                "certifier_id": certifier_id,
+                "updated_at": datetime(2023, 6, 1),
+                "certifier": [
+                    {"_id": certifier_id, "name": "someuser", "url": "example.com"}
+                ],
+            }
+        ]
+    )
+    mocker.patch(
+        "app.async_clients.AsyncDatabase.get",
+        return_value={"certificate-list": certificates},
+    )
+    get_with_certifier = mocker.spy(Certificate, "get_with_certifier")
+
+    async def requests() -> None:
+        """
+        Sends the requests of the test.
+        """
+        async with asgi_client(AsgiApplication(client.application)) as http:
+            # Test that the certificate is found through Motor
+            response = await http.get(f"/certificate/{certificate_id}/view")
+            assert response.status_code == 200
+            assert "goodperson" in response.text and "someuser" in response.text
+
+            # Test that the view is not sent again if the client already has it
+            response = await http.get(
+                f"/certificate/{certificate_id}/view",
+                headers={"If-None-Match": response.headers["ETag"]},
+            )
+            assert response.status_code == 304
+
+            # Test that unknown and invalid ids are not found
+            response = await http.get(f"/certificate/{ObjectId()}/view")
+            assert response.status_code == 403
+            response = await http.get("/certificate/idthatdoesnotexist/view")
+            assert response.status_code == 403
+
+    run(requests())
+    get_with_certifier.assert_not_called()
+
+
+def test_verify(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that the asynchronous variant of `account.verify` verifies websites in the background
+    and saves the outcome through Motor.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    user_id = mock_certifier(mocker)
+    certifiers = MockMotorCollection()
+    mocker.patch("app.async_clients.AsyncDatabase.get", return_value={"certifiers": certifiers})
+    check_metadata = mocker.patch(
+        "app.async_clients.AsyncHttpClient.check_metadata", return_value=True
+    )
+    asgi_app = AsgiApplication(client.application)
+
+    async def requests() -> None:
+        """
+        Sends the requests of the test.
+        """
+        async with asgi_client(asgi_app) as http:
+            # Test that verifications cannot be started without logging in
+            response = await http.post("/account/verify", data={"url": "https://example.com"})
+            assert response.status_code == 302
+            assert not certifiers.updates
+
+            # Test that the verification is marked as pending and then run in the background
+            await http.post("/account/login", data={"name": "someuser", "password": "1234"})
+            response = await http.post("/account/verify", data={"url": "https://example.com"})
+            assert response.status_code == 200
+            assert "started" in response.text
+            await gather(*asgi_app._tasks)
+
+    run(requests())
+    check_metadata.assert_awaited_once_with("https://example.com", "ca-key", "ca-key-someuser")
+    assert [update["$set"]["verification"] for _, update in certifiers.updates] == [
+        {"status": "pending", "url": "https://example.com"},
+        {"status": "verified", "url": "https://example.com"},
+    ]
+    query, update = certifiers.updates[-1]
+    assert query == {"_id": ObjectId(user_id)}
+    assert update["$set"]["url"] == "https://example.com"
+    assert not asgi_app._host_slots
+
+
+def test_wsgi_requests_overlap(client: FlaskClient) -> None:
+    """
+    Tests that requests to endpoints without an asynchronous variant are handled by the Flask
+    application in several threads at once.
+
+    Args:
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    threads = set()
+
+    @client.application.route("/slow")
+    def slow() -> str:
+        """
+        Responds after blocking its thread for a while.
+        """
+        threads.add(current_thread().name)
+        time.sleep(0.3)
+        return "done"
+
+    async def requests() -> None:
+        """
+        Sends the requests of the test.
+        """
+        async with asgi_client(AsgiApplication(client.application)) as http:
+            start = time.monotonic()
+            responses = await gather(*(http.get("/slow") for _ in range(4)))
+            assert time.monotonic() - start < 0.9
+            assert all(response.text == "done" for response in responses)
+
+    run(requests())
+    assert len(threads) == 4
+
+
+def test_request_body_limit(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that asynchronous views reject bodies longer than `MAX_CONTENT_LENGTH` with 413 Content
+    Too Large, whether or not their length is announced.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    certifiers = MockMotorCollection()
+    mocker.patch("app.async_clients.AsyncDatabase.get", return_value={"certifiers": certifiers})
+    client.application.config["MAX_CONTENT_LENGTH"] = 1024
+
+    async def body(chunks: int) -> AsyncIterator[bytes]:
+        """
+        Streams a body of 512-byte chunks, without announcing its length.
+        """
+        for _ in range(chunks):
+            yield b"url=" + bytes(508)
+
+    async def requests() -> None:
+        """
+        Sends the requests of the test.
+        """
+        async with asgi_client(AsgiApplication(client.application)) as http:
+            # Test that a body announced as too long is rejected
+            response = await http.post("/account/verify", data={"url": "x" * 2048})
+            assert response.status_code == 413
+
+            # Test that a body that turns out to be too long is rejected
+            response = await http.post("/account/verify", content=body(3))
+            assert "content-length" not in response.request.headers
+            assert response.status_code == 413
+
+            # Test that shorter bodies reach the view
+            response = await http.post("/account/verify", content=body(2))
+            assert response.status_code == 302
+
+    run(requests())
+    assert not certifiers.updates
+
+
+def test_verification_limits(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that at most `VERIFICATION_WORKERS` background verifications fetch websites at once, and
+    that the semaphores of hosts are removed once no verification uses them.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    certifiers = MockMotorCollection()
+    mocker.patch("app.async_clients.AsyncDatabase.get", return_value={"certifiers": certifiers})
+    client.application.config["VERIFICATION_WORKERS"] = 1
+    asgi_app = AsgiApplication(client.application)
+    users = [User(str(ObjectId()), f"user{number}", PASSWORD_HASH, None) for number in range(3)]
+    websites_respond = Event()
+
+    async def check_metadata(url: str, name: str, content: str) -> bool:
+        """
+        Checks a website once websites respond.
+        """
+        await websites_respond.wait()
+        return True
+
+    fetches = mocker.patch(
+        "app.async_clients.AsyncHttpClient.check_metadata", side_effect=check_metadata
+    )
+
+    async def verifications() -> None:
+        """
+        Runs a verification for each user, while the websites do not respond.
+        """
+        tasks = [
+            asgi_app.run_in_background(
+                asgi_app.verify_in_background(user, f"https://{user.name}.example.com")
+            )
+            for user in users
+        ]
+        for _ in range(5):
+            await sleep(0)
+
+        # Test that only one verification is fetching a website
+        assert fetches.await_count == 1
+        assert list(asgi_app._host_slots) == ["user0.example.com"]
+
+        # Test that the other verifications run once it finishes
+        websites_respond.set()
+        await gather(*tasks)
+
+    run(verifications())
+    assert fetches.await_count == 3
+    assert len(certifiers.updates) == 3
+    assert not asgi_app._host_slots
+
+
+def test_save_verification(mocker: MockerFixture) -> None:
+    """
+    Tests that `AsyncModels.save_verification` discards the data cached with the old version of a
+    certifier after the update is written, so that versions read during the update are not kept.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    user = User(str(ObjectId()), "someuser", PASSWORD_HASH, None)
+    certifiers = MockMotorCollection()
+    mocker.patch("app.async_clients.AsyncDatabase.get", return_value={"certifiers": certifiers})
+    invalidate_certifier = mocker.patch.object(PdfCache, "invalidate_certifier")
+    update_one = certifiers.update_one
+
+    async def update_one_read_during_write(query: dict, update: dict) -> None:
+        """
+        Writes the update while another request caches the certifier it read before the update.
+        """
+        User.cache.put(user.id_, User(user.id_, "someuser", PASSWORD_HASH, None))
+        invalidate_certifier.assert_not_called()
+        await update_one(query, update)
+
+    certifiers.update_one = update_one_read_during_write
+    user.set_verified("example.com")
+    user.set_verification("verified", "example.com")
+    run(AsyncModels.save_verification(mocker.MagicMock(), user))
+    assert certifiers.updates[0][1]["$set"]["verification"]["status"] == "verified"
+    assert User.cache.get(user.id_) is None
+    invalidate_certifier.assert_called_once_with(user.id_)
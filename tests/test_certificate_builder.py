@@ -0,0 +1,143 @@
+"""
+Includes tests for the `CertificateBuilder` helpers of the Certificate Automation Flask app. To
+collect and run these tests, you should use `pytest`'s test discovery.
+"""
+from base64 import a85decode
+from io import BytesIO
+from pathlib import Path
+import re
+from zlib import decompress
+from PIL import Image
+from pytest import raises
+from pytest_mock import MockerFixture
+from qrcode import QRCode
+from requests import HTTPError
+from app.certificate_builder import CertificateBuilder, QRCodeCache, TemplateCache
+from app.layout import Layout
+from tests.mocks.mock_response import MockResponse
+
+
+def test_qrcode_cache() -> None:
+    """
+    Tests that `QRCodeCache` encodes every dark module of a QR code exactly once and reuses the
+    computed QR codes.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    url = "http://localhost/certificate/anid/view"
+    size, runs = QRCodeCache.get(url)
+
+    # Test that the runs cover exactly the dark modules of the QR code
+    qrcode_generator = QRCode(version=4, border=4)
+    qrcode_generator.add_data(url)
+    qrcode_generator.make(fit=True)
+    matrix = qrcode_generator.get_matrix()
+    dark_modules = {
+        (row, column + offset)
+        for row, column, length in runs
+        for offset in range(length)
+    }
+    assert size == len(matrix)
+    assert dark_modules == {
+        (row, column)
+        for row, modules in enumerate(matrix)
+        for column, dark in enumerate(modules)
+        if dark
+    }
+
+    # Test that the QR code is computed only once
+    assert QRCodeCache.get(url) is QRCodeCache.get(url)
+
+
+def test_draw_template() -> None:
+    """
+    Tests that `CertificateBuilder.draw_template` embeds the pre-encoded template as an image
+    XObject of the page and draws it over the whole page. `draw_template` relies on private
+    reportlab APIs, so this test catches reportlab upgrades that break it.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    layout = Layout.compile({})
+    template = TemplateCache.get(layout.template)
+    pdf = CertificateBuilder(layout).draw_template().save().getvalue()
+
+    # Test that the template is embedded once, at its own resolution
+    images = re.findall(rb"/Subtype /Image.*?/Width (\d+)", pdf, re.S)
+    assert images == [b"2000"]
+    assert re.search(rb"/Height 1414 ", pdf)
+
+    # Test that the page references the template and draws it scaled to the whole page
+    xobject_name = f"/FormXob.{template.name}".encode()
+    assert re.search(rb"/XObject <<\s*" + re.escape(xobject_name) + rb" \d+ 0 R", pdf)
+    contents_id = re.search(rb"/Contents (\d+) 0 R", pdf).group(1)
+    stream = re.search(
+        rb"\n" + contents_id + rb" 0 obj\s*<<.*?>>\s*stream\r?\n(.*?)endstream", pdf, re.S
+    ).group(1)
+    contents = decompress(a85decode(stream.strip(), adobe=True))
+    assert b"841.8898 0 0 595.2756 0 0 cm\n" + xobject_name + b" Do" in contents
+
+    # Test that the shared template is not modified by the documents that embed it
+    second_pdf = CertificateBuilder(layout).draw_template().save().getvalue()
+    assert TemplateCache.get(layout.template) is template
+    assert len(re.findall(rb"/Subtype /Image", second_pdf)) == 1
+
+
+def test_template_resolution(tmp_path: Path) -> None:
+    """
+    Tests that `TemplateCache` keeps templates at their own resolution, only downscaling those
+    with more than `max_dpi` pixels per inch of the certificate page.
+
+    Args:
+        tmp_path: A temporary directory provided by `pytest`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Test that templates are never upscaled
+    small_template = tmp_path / "small.png"
+    Image.new("RGB", (640, 480), "white").save(small_template)
+    image = TemplateCache.get(str(small_template))
+    assert (image.width, image.height) == (640, 480)
+
+    # Test that large templates are downscaled to 300 DPI, keeping their aspect ratio
+    large_template = tmp_path / "large.png"
+    Image.new("RGB", (6000, 3000), "white").save(large_template)
+    image = TemplateCache.get(str(large_template))
+    assert (image.width, image.height) == (3508, 1754)
+
+
+def test_remote_template_responses_closed(mocker: MockerFixture) -> None:
+    """
+    Tests that `TemplateCache` closes the responses of remote templates on every path, so that
+    their connections go back to the pool.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    template = BytesIO()
+    Image.new("RGB", (64, 48), "white").save(template, "PNG")
+    responses = [
+        MockResponse(template.getvalue(), headers={"ETag": '"v1"'}),
+        MockResponse(b"", status_code=304),
+        MockResponse(b"", status_code=500),
+    ]
+    get = mocker.patch("app.http_client.HttpClient.get", side_effect=responses)
+    mocker.patch.object(TemplateCache, "remote_revalidate_seconds", 0)
+    url = "https://templates.example.com/template.png"
+
+    # Test that the response of a fetched template is closed
+    image = TemplateCache.get(url)
+    assert responses[0].closed
+
+    # Test that the response of a revalidated template is closed
+    assert TemplateCache.get(url) is image
+    assert get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert responses[1].closed
+
+    # Test that the response of a failed request is closed
+    with raises(HTTPError):
+        TemplateCache.get(url)
+    assert responses[2].closed
@@ -2,8 +2,11 @@
 Includes tests for the views under /certificate/ (certificate.* endpoints) of the Certificate
 Automation Flask app. To collect and run these tests, you should use `pytest`'s test discovery.
 """
+from io import BytesIO
+from zipfile import ZipFile
 from flask.testing import FlaskClient
 from pytest_mock import MockerFixture
+from app.models.certificate import BulkInsertError
 from tests.mocks.mock_user import MockUser
 from tests.mocks.mock_certificate import MockCertificate
 from tests.mocks.mock_certificate_builder import MockCertificateBuilder
@@ -51,6 +54,114 @@ def test_create_view(mocker: MockerFixture, client: FlaskClient) -> None:
         assert b"Success" in response.data
 
 
+def test_bulk_view(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests the bulk certificate creation functionality (located at /certificate/bulk).
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Mock required functions
+    mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    mocker.patch(
+        "app.models.certificate.Certificate.create", wraps=MockCertificate.create
+    )
+    save_many = mocker.patch(
+        "app.models.certificate.Certificate.save_many",
+        wraps=MockCertificate.save_many,
+    )
+
+    # Test that bulk view cannot be seen without logging in
+    response = client.get("/certificate/bulk")
+    assert response.status_code == 302
+
+    with client.application.test_request_context():
+        # Log in as "someuser"
+        response = client.post(
+            "/account/login", data={"name": "someuser", "password": "1234"}
+        )
+        assert b"Success" in response.data
+
+        # Check that user can create certificates from a JSON list
+        response = client.post(
+            "/certificate/bulk",
+            json=[
+                {"name": "goodperson", "title": "sometitle"},
+                {"name": "otherperson", "title": "othertitle"},
+            ],
+        )
+        assert response.status_code == 201
+        assert response.json == {"ids": ["somecertificate0", "somecertificate1"]}
+
+        # Check that user can create certificates from a CSV body
+        response = client.post(
+            "/certificate/bulk",
+            data="name,title\ngoodperson,sometitle\n",
+            content_type="text/csv",
+        )
+        assert response.json == {"ids": ["somecertificate0"]}
+
+        # Check that user can create certificates from an uploaded CSV file
+        response = client.post(
+            "/certificate/bulk",
+            data={
+                "certificates-file": (
+                    BytesIO(b"name,title\ngoodperson,sometitle\n"),
+                    "certificates.csv",
+                )
+            },
+        )
+        assert b"Success" in response.data
+        assert b"somecertificate0" in response.data
+
+        # Check that nothing is created if any certificate is missing its title
+        response = client.post(
+            "/certificate/bulk",
+            json=[{"name": "goodperson", "title": "sometitle"}, {"name": "bad"}],
+        )
+        assert response.status_code == 400
+        assert "Certificate 2" in response.json["error"]
+        response = client.post(
+            "/certificate/bulk",
+            data="name,title\ngoodperson,\n",
+            content_type="text/csv",
+        )
+        assert response.status_code == 400
+        response = client.post(
+            "/certificate/bulk",
+            data='[{"name": "goodperson", "title": "sometitle"}',
+            content_type="application/json",
+        )
+        assert response.status_code == 400
+        response = client.post(
+            "/certificate/bulk",
+            json={"name": "goodperson", "title": "sometitle"},
+        )
+        assert response.status_code == 400
+        assert save_many.call_count == 3
+
+        # Check that the certificates created before a failed insert are reported
+        save_many.side_effect = BulkInsertError(
+            ["somecertificate0"], [{"row": 2, "error": "E11000 duplicate key error"}]
+        )
+        response = client.post(
+            "/certificate/bulk",
+            json=[
+                {"name": "goodperson", "title": "sometitle"},
+                {"name": "otherperson", "title": "othertitle"},
+            ],
+        )
+        assert response.status_code == 207
+        assert response.json == {
+            "ids": ["somecertificate0"],
+            "errors": [{"row": 2, "error": "E11000 duplicate key error"}],
+        }
+
+
 def test_view_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
     Tests the certificate viewing functionality (located at
@@ -64,7 +175,8 @@ def test_view_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
     # Mock required functions
     mocker.patch(
-        "app.models.certificate.Certificate.get_by_id", wraps=MockCertificate.get_by_id
+        "app.models.certificate.Certificate.get_with_certifier",
+        wraps=MockCertificate.get_with_certifier,
     )
 
     # Test that a view with a non-existent id cannot be seen
@@ -75,6 +187,16 @@ def test_view_view(mocker: MockerFixture, client: FlaskClient) -> None:
     response = client.get("/certificate/anid/view")
     assert response.status_code == 200
 
+    # Test that the view is not sent again if the client already has it
+    response = client.get(
+        "/certificate/anid/view", headers={"If-None-Match": response.headers["ETag"]}
+    )
+    assert response.status_code == 304
+    response = client.get(
+        "/certificate/anid/view", headers={"If-None-Match": '"outdated"'}
+    )
+    assert response.status_code == 200
+
 
 def test_download_view(mocker: MockerFixture, client: FlaskClient) -> None:
     """
@@ -87,12 +209,14 @@ def test_download_view(mocker: MockerFixture, client: FlaskClient) -> None:
     Raises:
         AssertionError: If any of the tests fails.
     """
-    # Mock required functions from the User class
-    mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
+    # Mock required functions
     mocker.patch(
-        "app.models.certificate.Certificate.get_by_id", wraps=MockCertificate.get_by_id
+        "app.models.certificate.Certificate.get_with_certifier",
+        wraps=MockCertificate.get_with_certifier,
+    )
+    builder = mocker.patch(
+        "app.render_service.CertificateBuilder", wraps=MockCertificateBuilder
     )
-    mocker.patch("app.views.certificate.CertificateBuilder", MockCertificateBuilder)
 
     # Test that a view with a non-existent id cannot be seen
     response = client.get("/certificate/idthatdoesnotexist/download")
@@ -101,6 +225,26 @@ def test_download_view(mocker: MockerFixture, client: FlaskClient) -> None:
     # Test that appropiate view can be seen without logging in
     response = client.get("/certificate/anid/download")
     assert response.status_code == 200
+    assert b"With certified 'goodperson'" in response.data
+
+    # Test that downloading the same certificate again reuses the generated PDF
+    cached_response = client.get("/certificate/anid/download")
+    assert cached_response.data == response.data
+    assert response.headers["Last-Modified"] == "Sat, 01 Jul 2023 00:00:00 GMT"
+    assert builder.call_count == 1
+
+    # Test that the certificate is not sent again if the client already has it
+    response = client.get(
+        "/certificate/anid/download",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+    response = client.get(
+        "/certificate/anid/download",
+        headers={"If-Modified-Since": "Sat, 01 Jul 2023 00:00:00 GMT"},
+    )
+    assert response.status_code == 304
+    assert builder.call_count == 1
 
 
 def test_manage_view(mocker: MockerFixture, client: FlaskClient) -> None:
@@ -117,8 +261,8 @@ def test_manage_view(mocker: MockerFixture, client: FlaskClient) -> None:
     # Mock required functions
     mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
     mocker.patch(
-        "app.models.certificate.Certificate.get_all_by_certifier_id",
-        wraps=MockCertificate.get_all_by_certifier_id,
+        "app.models.certificate.Certificate.get_page_by_certifier_id",
+        wraps=MockCertificate.get_page_by_certifier_id,
     )
     mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
 
@@ -140,3 +284,53 @@ def test_manage_view(mocker: MockerFixture, client: FlaskClient) -> None:
 
         # Test that created certificates are appropiately listed
         assert b"goodperson" in response.data
+
+        # Test that the next page is linked and can be seen
+        assert b"/certificate/manage?after=nextid" in response.data
+        response = client.get("/certificate/manage?after=nextid")
+        assert response.status_code == 200
+        assert b"goodperson" not in response.data
+
+
+def test_archive_view(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests the certificate archive downloading functionality (located at /certificate/archive).
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Mock required functions
+    mocker.patch("app.models.user.User.get_by_id", wraps=MockUser.get_by_id)
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    mocker.patch(
+        "app.models.certificate.Certificate.iter_by_certifier_id",
+        wraps=MockCertificate.iter_by_certifier_id,
+    )
+    mocker.patch("app.render_service.CertificateBuilder", MockCertificateBuilder)
+
+    # Test that archive cannot be downloaded without being logged in
+    response = client.get("/certificate/archive")
+    assert response.status_code == 302
+
+    with client.application.test_request_context():
+        # Log in as "someuser"
+        response = client.post(
+            "/account/login", data={"name": "someuser", "password": "1234"}
+        )
+        assert b"Success" in response.data
+
+        # Test that the archive contains the PDFs of the user's certificates
+        response = client.get("/certificate/archive")
+        assert response.status_code == 200
+        assert response.mimetype == "application/zip"
+        with ZipFile(BytesIO(response.data)) as archive:
+            assert archive.namelist() == ["Certificate-anid.pdf"]
+            assert b"goodperson" in archive.read("Certificate-anid.pdf")
+
+        # Test that only the requested certificates are included
+        response = client.get("/certificate/archive?id=anotherid")
+        with ZipFile(BytesIO(response.data)) as archive:
+            assert archive.namelist() == []
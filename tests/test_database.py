@@ -0,0 +1,138 @@
+"""
+Includes tests for the `Database` namespace-like class and the `db-indexes` command of the
+Certificate Automation Flask app. To collect and run these tests, you should use `pytest`'s test
+discovery.
+"""
+from flask.testing import FlaskClient
+import pytest
+from pymongo.errors import OperationFailure
+from pytest_mock import MockerFixture
+from app.commands import db_indexes_command
+from app.models.database import Database
+
+
+def mock_database(mocker: MockerFixture) -> dict:
+    """
+    Mocks the collections of the database, reporting the indexes of a database where the `name`
+    index of `certifiers` has never been used, and `certificate-list` has an old `title` index
+    instead of the required `certifier_id__id` index.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Returns:
+        The mocked database, mapping collection names to mocked collections.
+    """
+    certifiers = mocker.MagicMock()
+    certifiers.index_information.return_value = {"_id_": {}, "name": {}}
+    certifiers.aggregate.return_value = [
+        {"name": "_id_", "accesses": {"ops": 0}},
+        {"name": "name", "accesses": {"ops": 0}},
+    ]
+    certificates = mocker.MagicMock()
+    certificates.index_information.return_value = {"_id_": {}, "title": {}}
+    certificates.aggregate.return_value = [
+        {"name": "_id_", "accesses": {"ops": 0}},
+        {"name": "title", "accesses": {"ops": 12}},
+    ]
+    mocker.patch.object(Database, "_indexes_ensured", False)
+    return {"certifiers": certifiers, "certificate-list": certificates}
+
+
+def test_ensure_indexes(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that `Database.get` creates the required indexes once per process.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    db = mock_database(mocker)
+    mocker.patch.object(Database, "get_client", return_value={"project2": db})
+
+    # Test that indexes are not created if disabled
+    client.application.config["DB_ENSURE_INDEXES"] = False
+    with client.application.app_context():
+        Database.get()
+    db["certifiers"].create_indexes.assert_not_called()
+
+    # Test that every required index is created the first time the database is used
+    client.application.config["DB_ENSURE_INDEXES"] = True
+    with client.application.app_context():
+        Database.get()
+        Database.get()
+    for collection, indexes in Database.required_indexes.items():
+        db[collection].create_indexes.assert_called_once_with(indexes)
+
+    # Test that ensuring indexes again does nothing
+    Database.ensure_indexes(db)
+    db["certifiers"].create_indexes.assert_called_once()
+
+
+def test_ensure_indexes_failure(mocker: MockerFixture, caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Tests that `Database.ensure_indexes` logs indexes that cannot be created instead of raising.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        caplog: A log capturing interface provided by `pytest`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    db = mock_database(mocker)
+    db["certifiers"].create_indexes.side_effect = OperationFailure("E11000 duplicate key error")
+    Database.ensure_indexes(db)
+    assert "Could not create indexes on certifiers: E11000 duplicate key error" in caplog.text
+    db["certificate-list"].create_indexes.assert_called_once()
+    assert Database._indexes_ensured
+
+
+def test_index_report(mocker: MockerFixture) -> None:
+    """
+    Tests that `Database.index_report` reports missing, unused and unrequired indexes, but never
+    the `_id` index.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    assert Database.index_report(mock_database(mocker)) == {
+        "certifiers": {"missing": [], "unused": ["name"]},
+        "certificate-list": {"missing": ["certifier_id__id"], "unused": ["title"]},
+    }
+
+
+def test_db_indexes_command(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that the `db-indexes` command prints the index report, creating missing indexes first
+    if asked to.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    db = mock_database(mocker)
+    mocker.patch.object(Database, "get_client", return_value={"project2": db})
+    runner = client.application.test_cli_runner()
+
+    # Test that the report is printed without creating indexes
+    result = runner.invoke(db_indexes_command)
+    assert result.exit_code == 0
+    assert result.output == (
+        "certifiers:\n"
+        "  missing: none\n"
+        "  unused: name\n"
+        "certificate-list:\n"
+        "  missing: certifier_id__id\n"
+        "  unused: title\n"
+    )
+    db["certificate-list"].create_indexes.assert_not_called()
+
+    # Test that missing indexes are created if asked to
+    result = runner.invoke(db_indexes_command, ["--create"])
+    assert result.exit_code == 0
+    db["certificate-list"].create_indexes.assert_called_once()
@@ -0,0 +1,71 @@
+"""
+Includes tests for the `HttpClient` namespace-like class of the Certificate Automation Flask app. To
+collect and run these tests, you should use `pytest`'s test discovery.
+"""
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import monotonic
+from pytest import raises
+from pytest_mock import MockerFixture
+import requests
+from app.http_client import HttpClient
+
+
+class TemplateHandler(BaseHTTPRequestHandler):
+    """
+    Serves a small body on every path, keeping connections alive.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self: TemplateHandler) -> None:  # pylint: disable=invalid-name
+        """
+        Sends the body.
+        """
+        body = b"template"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self: TemplateHandler, *args: object) -> None:
+        """
+        Silences the log of each request.
+        """
+
+
+def test_pool_timeout(mocker: MockerFixture) -> None:
+    """
+    Tests that a request waiting for a connection of a full pool fails after `pool_timeout`
+    seconds, and that closing a streamed response frees its connection.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    mocker.patch.object(HttpClient, "max_connections_per_host", 1)
+    mocker.patch.object(HttpClient, "pool_timeout", 0.2)
+    mocker.patch.object(HttpClient, "_session", None)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TemplateHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/template.png"
+    try:
+        # Test that a request fails instead of waiting forever while the only connection is used
+        response = HttpClient.get(url, stream=True)
+        started = monotonic()
+        with raises(requests.ConnectionError):
+            HttpClient.get(url, stream=True)
+        assert monotonic() - started < 5
+
+        # Test that the connection can be used again once the response is closed
+        response.close()
+        with HttpClient.get(url, stream=True) as response:
+            assert HttpClient.read(response, 1024) == b"template"
+        with HttpClient.get(url, stream=True) as response:
+            assert response.status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        HttpClient.get_session().close()
@@ -0,0 +1,50 @@
+"""
+Includes tests for the instrumentation of the Certificate Automation Flask app. To collect and run
+these tests, you should use `pytest`'s test discovery.
+"""
+from flask.testing import FlaskClient
+from pytest_mock import MockerFixture
+from app.instrumentation import Instrumentation
+from app.passwords import PasswordHasher
+from tests.mocks.mock_user import MockUser
+
+
+def test_instrumentation(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that instrumented calls are reported in the `Server-Timing` header and at `/metrics` only
+    while instrumentation is enabled.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Mock required functions
+    mocker.patch("app.models.user.User.get_by_name", wraps=MockUser.get_by_name)
+    mocker.patch.object(Instrumentation, "histograms", {})
+
+    # Test that nothing is reported while instrumentation is disabled
+    response = client.post("/account/login", data={"name": "someuser", "password": "1234"})
+    assert "Server-Timing" not in response.headers
+    assert client.get("/metrics").status_code == 404
+    assert Instrumentation.histograms == {}
+
+    # Test that the password check is reported in the response and aggregated in the metrics
+    mocker.patch.object(Instrumentation, "enabled", True)
+    response = client.post("/account/login", data={"name": "someuser", "password": "1234"})
+    assert "bcrypt.check;dur=" in response.headers["Server-Timing"]
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert b'autocertify_span_duration_ms_count{span="bcrypt.check"} 1' in response.data
+    assert b'autocertify_span_duration_ms_count{span="request.account.login"} 1' in response.data
+    assert b'span="bcrypt.check",le="+Inf"} 1' in response.data
+
+    # Test that the usage counters of the password hasher are reported in the metrics
+    mocker.patch.object(PasswordHasher, "completed", 7)
+    mocker.patch.object(PasswordHasher, "rejected", 2)
+    response = client.get("/metrics")
+    assert b"autocertify_password_hasher_pending 0\n" in response.data
+    assert b"autocertify_password_hasher_max_queue 32\n" in response.data
+    assert b"autocertify_password_hasher_completed_total 7\n" in response.data
+    assert b"autocertify_password_hasher_rejected_total 2\n" in response.data
@@ -0,0 +1,102 @@
+"""
+Includes tests for the `Layout` class of the Certificate Automation Flask app. To collect and run
+these tests, you should use `pytest`'s test discovery.
+"""
+from pickle import dumps, loads
+from types import SimpleNamespace
+import pytest
+from app.layout import Layout, LayoutError
+
+
+def test_compile() -> None:
+    """
+    Tests that `Layout.compile` fills missing fields with defaults, caches compiled layouts and
+    produces immutable, picklable objects.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Test that empty settings compile into the default layout, loaded from settings.json
+    layout = Layout.compile({})
+    assert layout.template == "http://127.0.0.1:5000/static/template.png"
+    assert layout.font.name == "Poppins Bold" and layout.font.size == 32
+    assert layout.qrcode.width == 125 and layout.certifier.bottom == 100
+    assert Layout.compile(None) is layout
+
+    # Test that equal settings share a compiled layout and missing fields take defaults
+    custom = Layout.compile({"title": {"left": 322}, "font": {"size": 24}})
+    assert custom is Layout.compile({"font": {"size": 24}, "title": {"left": 322}})
+    assert custom.title.left == 322 and custom.title.bottom == 245
+    assert custom.font.size == 24 and custom.name == layout.name
+    assert custom.digest != layout.digest
+    assert Layout.compile(Layout.defaults).digest == layout.digest
+
+    # Test that templates can be given by their path or by their URL in this application
+    assert Layout.compile({"template": "./app/static/template.png"}).template == (
+        "./app/static/template.png"
+    )
+    assert Layout.compile({"template": "http://localhost:5000/static/template.png"})
+
+    # Test that compiled layouts cannot be modified but can be sent to other processes
+    with pytest.raises(AttributeError):
+        custom.template = "./other.png"
+    with pytest.raises(AttributeError):
+        custom.qrcode.width = 10
+    assert loads(dumps(custom)) == custom
+
+
+def test_of() -> None:
+    """
+    Tests that `Layout.of` compiles each version of a certifier's layout once.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Test that certifiers without a layout use the default one
+    certifier = SimpleNamespace(id_="someid", layout=None, layout_version=0)
+    assert Layout.of(certifier) is Layout.compile({})
+
+    # Test that the layout is only compiled again when its version changes
+    certifier.layout = {"font": {"size": 20}}
+    assert Layout.of(certifier).font.size == 32
+    certifier.layout_version = 1
+    assert Layout.of(certifier).font.size == 20
+
+
+@pytest.mark.parametrize(
+    "settings, message",
+    [
+        ([], "layout must be an object"),
+        ({"colour": "red"}, "layout has an unknown field 'colour'"),
+        ({"template": ""}, "layout.template must be a non-empty string"),
+        ({"template": "./config.py"}, "layout.template must be a .png/.jpg/.jpeg image"),
+        ({"template": "./app/static/../../config.py"}, "layout.template must be a"),
+        ({"template": "/etc/passwd"}, "layout.template must be a"),
+        ({"template": "./app/static/settings.json"}, "layout.template must be a"),
+        ({"template": "./app/static/missing.png"}, "layout.template must be a"),
+        ({"template": "http://169.254.169.254/template.png"}, "layout.template must be a"),
+        ({"template": "http://localhost/static/../config.py"}, "layout.template must be a"),
+        ({"template": "http://localhost/static/settings.json"}, "layout.template must be a"),
+        ({"template": "http://localhost/static/missing.png"}, "layout.template must be a"),
+        ({"template": "http://localhost/template.png"}, "layout.template must be a"),
+        ({"template": "file:///etc/passwd"}, "layout.template must be a"),
+        ({"font": {"name": "Comic Sans"}}, "layout.font.name must be one of"),
+        ({"font": {"size": 0}}, "layout.font.size must be a positive number"),
+        ({"qrcode": {"width": "125"}}, "layout.qrcode.width must be a positive number"),
+        ({"name": {"left": True}}, "layout.name.left must be a number"),
+        ({"title": 5}, "layout.title must be an object"),
+    ],
+)
+def test_compile_errors(settings: object, message: str) -> None:
+    """
+    Tests that `Layout.compile` rejects invalid settings with errors naming the invalid field.
+
+    Args:
+        settings: The invalid settings.
+        message: The expected start of the error message.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    with pytest.raises(LayoutError) as error:
+        Layout.compile(settings)
+    assert str(error.value).startswith(message)
@@ -0,0 +1,244 @@
+"""
+Includes tests for the models of the Certificate Automation Flask app. To collect and run these
+tests, you should use `pytest`'s test discovery.
+"""
+from copy import copy
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from pytest import raises
+from pytest_mock import MockerFixture
+from app.models.certificate import BulkInsertError, Certificate
+from app.models.user import User
+from tests.mocks.mock_collection import MockCollection
+
+
+def test_save_many_partial_failure(mocker: MockerFixture) -> None:
+    """
+    Tests that `Certificate.save_many` reports the certificates inserted before and after a
+    certificate that could not be inserted.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+
+    def insert_many(documents: list[dict], ordered: bool) -> None:
+        """
+        Inserts documents as pymongo does, failing on every document titled "duplicate".
+        """
+        assert not ordered
+        for document in documents:
+            document["_id"] = ObjectId()
+        write_errors = [
+            {"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"}
+            for index, document in enumerate(documents)
+            if document["title"] == "duplicate"
+        ]
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": 0})
+
+    collection = mocker.MagicMock()
+    collection.insert_many.side_effect = insert_many
+    mocker.patch("app.models.database.Database.get", return_value={"certificate-list": collection})
+    certifier_id = str(ObjectId())
+    certificates = [
+        Certificate.create(f"person{row}", "duplicate" if row == 2 else "title", certifier_id)
+        for row in range(1, 6)
+    ]
+
+    # Test that every other certificate is inserted, in chunks, and that the failure is reported
+    with raises(BulkInsertError) as error:
+        Certificate.save_many(certificates, chunk_size=2)
+    assert collection.insert_many.call_count == 3
+    assert error.value.errors == [{"row": 2, "error": "E11000 duplicate key error"}]
+    assert error.value.inserted_ids == [
+        certificate.id_ for certificate in certificates if certificate.title != "duplicate"
+    ]
+    assert len(error.value.inserted_ids) == 4
+    assert certificates[1].id_ is None
+
+
+def test_user_cache_after_save(mocker: MockerFixture) -> None:
+    """
+    Tests that saving a user never leaves the version read before the save in `User.cache`, even
+    if it is read while the save is running.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    user_id = str(ObjectId())
+    stored_user = User(user_id, "someuser", "hash", None)
+    users = mocker.MagicMock()
+    mocker.patch("app.models.database.Database.get", return_value={"certifiers": users})
+    mocker.patch("app.models.user.User.get_by_id", side_effect=lambda id_: copy(stored_user))
+    User.cache.clear()
+
+    # Test that a user read while the update is being written is discarded afterwards
+    users.update_one.side_effect = lambda *args: User.get_cached(user_id)
+    User.get_cached(user_id).save()
+    assert User.cache.get(user_id) is None
+
+    # Test that a user read before an update finished is not cached after it
+    def get_by_id_during_save(id_: str) -> User:
+        """
+        Returns the stored user, as read before another request saved it.
+        """
+        old_user = copy(stored_user)
+        User(user_id, "renameduser", "hash", None).save()
+        return old_user
+
+    users.update_one.side_effect = None
+    User.get_by_id.side_effect = get_by_id_during_save
+    assert User.get_cached(user_id).name == "someuser"
+    assert User.cache.get(user_id) is None
+
+
+def test_user_save_verification(mocker: MockerFixture) -> None:
+    """
+    Tests that `User.save_verification` only updates the verification fields of a user, so that
+    other fields changed while a verification runs are kept.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    users = mocker.MagicMock()
+    mocker.patch("app.models.database.Database.get", return_value={"certifiers": users})
+    user_id = str(ObjectId())
+    user = User(user_id, "someuser", "hash", None)
+    User.cache.put(user_id, user)
+    user.set_verified("example.com")
+    user.set_verification("verified", "example.com")
+    user.save_verification()
+
+    # Test that only the verification fields are updated and that the cached user is discarded
+    query, update = users.update_one.call_args.args
+    assert query == {"_id": ObjectId(user_id)}
+    assert update == {
+        "$set": {
+            "url": "example.com",
+            "verification": {"status": "verified", "url": "example.com"},
+            "updated_at": user.updated_at,
+        }
+    }
+    assert User.cache.get(user_id) is None
+
+
+def test_user_save_layout(mocker: MockerFixture) -> None:
+    """
+    Tests that `User.save_layout` only updates the layout of a user, incrementing its version in
+    the database so that concurrent changes never reuse a version.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    users = mocker.MagicMock()
+    mocker.patch("app.models.database.Database.get", return_value={"certifiers": users})
+    user_id = str(ObjectId())
+    user = User(user_id, "someuser", "hash", None)
+    User.cache.put(user_id, user)
+    user.save_layout({"title": {"left": 322}})
+
+    # Test that the layout is set, its version incremented and the cached user discarded
+    query, update = users.update_one.call_args.args
+    assert query == {"_id": ObjectId(user_id)}
+    assert update == {
+        "$set": {"layout": {"title": {"left": 322}}, "updated_at": user.updated_at},
+        "$inc": {"layout_version": 1},
+    }
+    assert User.cache.get(user_id) is None
+
+    # Test that saving the rest of the user never writes its (possibly stale) layout back
+    user.save()
+    assert not {"layout", "layout_version"} & set(users.update_one.call_args.args[1]["$set"])
+
+
+def test_user_save_password(mocker: MockerFixture) -> None:
+    """
+    Tests that `User.save_password` only updates the password of a user, so that a verification
+    finishing at the same time is kept.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    users = mocker.MagicMock()
+    mocker.patch("app.models.database.Database.get", return_value={"certifiers": users})
+    user_id = str(ObjectId())
+    user = User(user_id, "someuser", "oldhash", None)
+    User.cache.put(user_id, user)
+    user.password = "newhash"
+    user.save_password()
+
+    # Test that only the password is updated and that the cached user is discarded
+    query, update = users.update_one.call_args.args
+    assert query == {"_id": ObjectId(user_id)}
+    assert update == {"$set": {"password": "newhash", "updated_at": user.updated_at}}
+    assert User.cache.get(user_id) is None
+
+def test_get_page_by_certifier_id(mocker: MockerFixture) -> None:
+    """
+    Tests that `Certificate.get_page_by_certifier_id` pages through a certifier's certificates,
+    newest first, in both directions.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    certifier_id = ObjectId()
+    ids = [ObjectId() for _ in range(7)]
+    certificates = MockCollection(
+        [
+            {"_id": id_, "name": f"person{number}", "title": "title", "certifier_id": certifier_id}
+            for number, id_ in enumerate(ids)
+        ]
+        + [{"_id": ObjectId(), "name": "other", "title": "title", "certifier_id": ObjectId()}]
+    )
+    mocker.patch(
+        "app.models.database.Database.get", return_value={"certificate-list": certificates}
+    )
+
+    def get_page(
+        after: ObjectId | None = None, before: ObjectId | None = None
+    ) -> tuple[list[ObjectId], ObjectId | None, ObjectId | None]:
+        """
+        Retrieves a page of three certificates, returning the ids of its certificates and cursors.
+        """
+        page, next_cursor, previous_cursor = Certificate.get_page_by_certifier_id(
+            str(certifier_id),
+            3,
+            after=str(after) if after else None,
+            before=str(before) if before else None,
+        )
+        return (
+            [ObjectId(certificate.id_) for certificate in page],
+            next_cursor and ObjectId(next_cursor),
+            previous_cursor and ObjectId(previous_cursor),
+        )
+
+    # Test that pages are read forwards, newest first
+    assert get_page() == ([ids[6], ids[5], ids[4]], ids[4], None)
+    assert get_page(after=ids[4]) == ([ids[3], ids[2], ids[1]], ids[1], ids[3])
+    assert get_page(after=ids[1]) == ([ids[0]], None, ids[0])
+
+    # Test that pages are read backwards, still newest first
+    assert get_page(before=ids[0]) == ([ids[3], ids[2], ids[1]], ids[1], ids[3])
+    assert get_page(before=ids[3]) == ([ids[6], ids[5], ids[4]], ids[4], None)
+
+    # Test that invalid ids give an empty page without querying the database
+    queries = len(certificates.queries)
+    assert Certificate.get_page_by_certifier_id(str(certifier_id), 3, after="bad") == (
+        [],
+        None,
+        None,
+    )
+    assert Certificate.get_page_by_certifier_id("bad", 3) == ([], None, None)
+    assert len(certificates.queries) == queries
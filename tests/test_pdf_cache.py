@@ -0,0 +1,119 @@
+"""
+Includes tests for the `PdfCache` namespace-like class of the Certificate Automation Flask app. To
+collect and run these tests, you should use `pytest`'s test discovery.
+"""
+from os import stat, utime
+from pathlib import Path
+from types import SimpleNamespace
+from PIL import Image
+from pytest_mock import MockerFixture
+from app.certificate_builder import CertificateBuilder
+from app.layout import Box, Font, Layout, Position
+from app.pdf_cache import DiskPdfStore, MemoryPdfStore, PdfCache
+
+
+def test_key_tracks_assets(tmp_path: Path) -> None:
+    """
+    Tests that replacing the template of a layout changes the key and modification time of the
+    certificates rendered with it.
+
+    Args:
+        tmp_path: A temporary directory provided by `pytest`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    template = tmp_path / "template.png"
+    Image.new("RGB", (64, 48), "white").save(template)
+    layout = Layout(
+        str(template),
+        Font("Poppins Bold", 32),
+        Box(650, 68, 125, 125),
+        Position(420, 320),
+        Position(420, 245),
+        Position(420, 100),
+        "digest",
+    )
+    certificate = SimpleNamespace(name="goodperson", title="Good person")
+    certifier = SimpleNamespace(name="someuser")
+    version, modified_at = CertificateBuilder.assets_version(layout)
+    key = PdfCache.key(certificate, certifier, layout, version, "http://localhost/")
+
+    # Test that the same template gives the same key
+    assert CertificateBuilder.assets_version(layout) == (version, modified_at)
+
+    # Test that a replaced template gives a new key and a later modification time
+    Image.new("RGB", (64, 48), "black").save(template)
+    mtime_ns = stat(template).st_mtime_ns + 1_000_000_000
+    utime(template, ns=(mtime_ns, mtime_ns))
+    new_version, new_modified_at = CertificateBuilder.assets_version(layout)
+    assert new_version != version
+    assert new_modified_at > modified_at
+    assert (
+        PdfCache.key(certificate, certifier, layout, new_version, "http://localhost/")
+        != key
+    )
+
+
+def test_index_pruned_on_eviction(mocker: MockerFixture) -> None:
+    """
+    Tests that the invalidation index of `PdfCache` forgets the PDFs evicted from memory.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    mocker.patch.object(
+        PdfCache, "stores", [MemoryPdfStore(2, on_evict=PdfCache._unindex)]
+    )
+    mocker.patch.object(PdfCache, "_keys_by_certificate", {})
+    mocker.patch.object(PdfCache, "_certificates_by_certifier", {})
+    mocker.patch.object(PdfCache, "_owners", {})
+
+    # Test that only the PDFs still in memory are indexed
+    for number in range(5):
+        PdfCache.put(f"key{number}", b"%PDF", f"certificate{number}", "certifier")
+    assert set(PdfCache._owners) == {"key3", "key4"}
+    assert set(PdfCache._keys_by_certificate) == {"certificate3", "certificate4"}
+    assert PdfCache._certificates_by_certifier == {
+        "certifier": {"certificate3", "certificate4"}
+    }
+
+    # Test that invalidating a certifier removes its PDFs and empties the index
+    PdfCache.invalidate_certifier("certifier")
+    assert PdfCache.get("key4") is None
+    assert not PdfCache._owners
+    assert not PdfCache._keys_by_certificate
+    assert not PdfCache._certificates_by_certifier
+
+
+def test_disk_store_bound(tmp_path: Path) -> None:
+    """
+    Tests that `DiskPdfStore` removes the least recently used PDFs when it is full.
+
+    Args:
+        tmp_path: A temporary directory provided by `pytest`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    store = DiskPdfStore(str(tmp_path), max_bytes=1000)
+    for number in range(3):
+        store.put(f"key{number}", bytes(300))
+        utime(tmp_path / f"key{number}.pdf", ns=(number * 10**9, number * 10**9))
+
+    # Test that reading a PDF marks it as recently used
+    assert store.get("key0") == bytes(300)
+
+    # Test that the least recently used PDF is removed once the store is full
+    store.put("key3", bytes(300))
+    assert store.get("key1") is None
+    assert {path.name for path in tmp_path.iterdir()} == {
+        "key0.pdf",
+        "key2.pdf",
+        "key3.pdf",
+    }
+
+    # Test that PDFs written by other processes are counted when the directory is scanned again
+    (tmp_path / "other.pdf").write_bytes(bytes(300))
+    DiskPdfStore(str(tmp_path), max_bytes=1000)
+    assert sum(path.stat().st_size for path in tmp_path.iterdir()) <= 900
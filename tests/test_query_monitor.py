@@ -0,0 +1,138 @@
+"""
+Includes tests for the MongoDB query monitor of the Certificate Automation Flask app. To collect
+and run these tests, you should use `pytest`'s test discovery.
+"""
+from asyncio import get_running_loop, run
+from collections import Counter
+from types import SimpleNamespace
+from bson import ObjectId
+from flask.testing import FlaskClient
+import pytest
+from motor.frameworks.asyncio import run_on_executor
+from pytest_mock import MockerFixture
+from app.asgi import AsgiApplication
+from app.query_monitor import QueryMonitor, filter_shape, listener
+
+
+def send_command(request_id: int, command: dict, duration_ms: float) -> None:
+    """
+    Notifies the listener of a command, as pymongo does when the command is sent and answered.
+
+    Args:
+        request_id: The id of the command.
+        command: The command sent to MongoDB.
+        duration_ms: How long the command took.
+    """
+    command_name = next(iter(command))
+    listener.started(
+        SimpleNamespace(
+            command_name=command_name,
+            command=command,
+            connection_id=("localhost", 27017),
+            request_id=request_id,
+        )
+    )
+    listener.succeeded(
+        SimpleNamespace(
+            command_name=command_name,
+            connection_id=("localhost", 27017),
+            request_id=request_id,
+            duration_micros=int(duration_ms * 1000),
+        )
+    )
+
+
+def test_filter_shape() -> None:
+    """
+    Tests that `filter_shape` keeps fields and operators but hides values.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    assert filter_shape({"_id": ObjectId()}) == {"_id": "?"}
+    assert filter_shape(
+        {"certifier_id": ObjectId(), "_id": {"$lt": ObjectId()}, "$or": [{"a": 1}]}
+    ) == {"certifier_id": "?", "_id": {"$lt": "?"}, "$or": [{"a": "?"}]}
+    assert filter_shape({"_id": {"$in": [ObjectId(), ObjectId()]}}) == {"_id": {"$in": "?"}}
+
+
+def test_query_monitor(
+    mocker: MockerFixture, client: FlaskClient, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    Tests that the query monitor counts queries per endpoint, logs slow queries and flags N+1
+    patterns and requests over the query budget.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+        caplog: A log capturing interface provided by `pytest`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    mocker.patch.object(QueryMonitor, "queries", Counter())
+    mocker.patch.object(QueryMonitor, "query_budget", 2)
+    app = client.application
+    app.debug = True
+
+    # Fetch a certificate and then its certifier, one of them slowly
+    with app.test_request_context("/certificate/anid/view"):
+        app.preprocess_request()
+        send_command(1, {"find": "certificate-list", "filter": {"_id": ObjectId()}}, 5)
+        send_command(2, {"find": "certifiers", "filter": {"_id": ObjectId()}}, 250)
+        send_command(3, {"update": "certifiers", "updates": [{"q": {"_id": 1}}]}, 1)
+        app.process_response(app.response_class())
+
+    # Test that queries are counted under their endpoint
+    assert QueryMonitor.queries["certificate.view"] == 3
+    metrics = QueryMonitor.metrics()
+    assert 'autocertify_db_queries_total{endpoint="certificate.view"} 3' in metrics
+
+    # Test that the slow query is logged with the shape of its filter
+    slow_query = 'find on certifiers with filter {"_id": "?"}'
+    assert f"Slow query (250.0 ms) from certificate.view: {slow_query}" in caplog.text
+
+    # Test that the two-step fetch is flagged and the budget is enforced in debug mode
+    n_plus_one = "lookups by _id on certificate-list, certifiers"
+    assert f"Possible N+1 queries in certificate.view: {n_plus_one}" in caplog.text
+    assert "certificate.view sent 3 queries, over its budget of 2" in caplog.text
+
+
+def test_query_monitor_async(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that queries sent by Motor from its executor threads are counted under the endpoint of
+    the asynchronous view awaiting them, and that those of background verifications are not.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    mocker.patch.object(QueryMonitor, "queries", Counter())
+    app = client.application
+    asgi_app = AsgiApplication(app)
+
+    async def send_command_with_motor(request_id: int, command: dict) -> None:
+        """
+        Notifies the listener of a command from one of Motor's executor threads.
+        """
+        await run_on_executor(get_running_loop(), send_command, request_id, command, 5)
+
+    async def view() -> None:
+        """
+        Sends a query and starts a background task sending another one, as the asynchronous views
+        of `AsgiApplication` do.
+        """
+        with app.test_request_context("/certificate/anid/view"):
+            app.preprocess_request()
+            await send_command_with_motor(
+                1, {"find": "certificate-list", "filter": {"_id": ObjectId()}}
+            )
+            task = asgi_app.run_in_background(
+                send_command_with_motor(2, {"update": "certifiers", "updates": [{"q": {}}]})
+            )
+        await task
+
+    run(view())
+    assert QueryMonitor.queries == Counter({"certificate.view": 1, "background": 1})
@@ -0,0 +1,62 @@
+"""
+Includes tests for the `RenderService` namespace-like class of the Certificate Automation Flask
+app. To collect and run these tests, you should use `pytest`'s test discovery.
+"""
+from os import _exit
+from concurrent.futures.process import BrokenProcessPool
+from flask.testing import FlaskClient
+from pytest import raises
+from pytest_mock import MockerFixture
+from app.pdf_cache import PdfCache
+from app.render_service import RenderJob, RenderService
+from tests.mocks.mock_certificate import MockCertificate
+from tests.mocks.mock_user import MockUser
+
+
+def test_render_many_in_pool(mocker: MockerFixture, client: FlaskClient) -> None:
+    """
+    Tests that `RenderService.render_many` renders certificates in a real pool of worker processes,
+    and replaces the pool when a worker dies.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+        client: A Flask test client provided by a `pytest`'s fixture.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    mocker.patch.object(PdfCache, "stores", [])
+    mocker.patch.object(PdfCache, "_keys_by_certificate", {})
+    mocker.patch.object(PdfCache, "_certificates_by_certifier", {})
+    mocker.patch.object(PdfCache, "_owners", {})
+    client.application.config["RENDER_WORKERS"] = 1
+    certifier = MockUser.get_by_id("someid")
+    jobs = [
+        RenderJob(
+            MockCertificate(f"id{number}", f"person{number}", "goodtitle", "someid"),
+            certifier,
+            f"http://localhost/certificate/id{number}/view",
+        )
+        for number in range(3)
+    ]
+
+    with client.application.app_context():
+        try:
+            # Test that the PDFs are rendered by the workers, in order
+            results = list(RenderService.render_many(jobs))
+            assert [job for job, _ in results] == jobs
+            assert all(pdf.startswith(b"%PDF") for _, pdf in results)
+
+            # Test that a pool broken by a dead worker is replaced
+            broken_pool = RenderService.get_pool()
+            with raises(BrokenProcessPool):
+                broken_pool.submit(_exit, 1).result()
+            results = list(RenderService.render_many(jobs))
+            assert all(pdf.startswith(b"%PDF") for _, pdf in results)
+            assert RenderService.get_pool() is not broken_pool
+
+            # Test that jobs in flight when a worker dies are rendered again
+            RenderService.get_pool().submit(_exit, 1)
+            results = list(RenderService.render_many(jobs))
+            assert all(pdf.startswith(b"%PDF") for _, pdf in results)
+        finally:
+            RenderService.shutdown()
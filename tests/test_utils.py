@@ -0,0 +1,73 @@
+"""
+Includes tests for the `Utils` namespace-like class of the Certificate Automation Flask app. To
+collect and run these tests, you should use `pytest`'s test discovery.
+"""
+from io import StringIO
+from pytest import raises
+from pytest_mock import MockerFixture
+from app.utils import Utils
+from tests.mocks.mock_response import MockResponse
+
+
+def test_check_metadata(mocker: MockerFixture) -> None:
+    """
+    Tests that `Utils.check_metadata` finds `meta` tags in the head of a website while reading as
+    little of it as possible.
+
+    Args:
+        mocker: A mocking interface provided by `pytest-mock`.
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    get = mocker.patch("app.http_client.HttpClient.get")
+
+    # Test that the tag is found in the head of the website
+    get.return_value = MockResponse(
+        b'<html><head><meta name="ca-key" content="ca-key-someuser"></head></html>'
+    )
+    assert Utils.check_metadata("example.com", "ca-key", "ca-key-someuser")
+
+    # Test that tags with a different content are not accepted
+    assert not Utils.check_metadata("example.com", "ca-key", "ca-key-anotheruser")
+
+    # Test that reading stops as soon as the tag is found
+    get.return_value = response = MockResponse(
+        b'<head><meta name="ca-key" content="ca-key-someuser"/>' + b" " * 100000
+    )
+    assert Utils.check_metadata("example.com", "ca-key", "ca-key-someuser")
+    assert response.bytes_read < 10000
+
+    # Test that tags after the head are ignored and the body is not read
+    get.return_value = response = MockResponse(
+        b"<head></head><body>"
+        + b" " * 100000
+        + b'<meta name="ca-key" content="ca-key-someuser">'
+    )
+    assert not Utils.check_metadata("example.com", "ca-key", "ca-key-someuser")
+    assert response.bytes_read < 10000
+
+    # Test that at most `max_bytes` are read from websites without a head
+    get.return_value = response = MockResponse(b"<html>" + b" " * 1000000, None)
+    assert not Utils.check_metadata("example.com", "ca-key", "ca-key-someuser", 65536)
+    assert response.bytes_read <= 65536 + 4096
+
+
+def test_iter_json_list() -> None:
+    """
+    Tests that `Utils.iter_json_list` parses JSON lists read in small chunks and rejects anything
+    else.
+
+    Raises:
+        AssertionError: If any of the tests fails.
+    """
+    # Test that items split between chunks are parsed
+    text = '[{"name": "a,]", "title": "b"}, 12.5e3, -7, [true, null], "x"]\n'
+    for chunk_size in (1, 2, 7, 65536):
+        items = list(Utils.iter_json_list(StringIO(text), chunk_size))
+        assert items == [{"name": "a,]", "title": "b"}, 12500.0, -7, [True, None], "x"]
+    assert not list(Utils.iter_json_list(StringIO(" [ ] ")))
+
+    # Test that malformed lists are rejected
+    for text in ("", "{}", "[1", "[1 2]", "[1,]", "[1] 2"):
+        with raises(ValueError):
+            list(Utils.iter_json_list(StringIO(text), 2))